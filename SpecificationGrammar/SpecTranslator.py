@@ -14,17 +14,136 @@ from antlr4 import *
 from SpecificationGrammarLexer import SpecificationGrammarLexer
 from SpecificationGrammarParser import SpecificationGrammarParser
 from SpecificationGrammarVisitor import SpecificationGrammarVisitor
+import re
 import z3
 
+# parsers that can be used to translate the constraints
+PARSERS = ["antlr", "fast"]
+
+# when the formulas are simplified: at every operator (node), once at the end of every constraint, or never
+# leaving the simplification to the preprocessing of the solver (none)
+SIMPLIFY_MODALITIES = ["node", "constraint", "none"]
+
+
+def no_simplify(formula):
+    # as z3.simplify, reject the results of comparisons not supported by z3 (e.g., between booleans)
+    if not z3.is_expr(formula):
+        raise Exception("Z3 expression expected")
+    return formula
+
+
+def bool_operation(op, formula, f, simplify=z3.simplify):
+    if op == "and":
+        return z3.And(formula, f)
+    elif op == "or":
+        return z3.Or(formula, f)
+    elif op == "impl":
+        return z3.Implies(formula, f)
+    elif op == "iff":
+        return simplify(z3.And(z3.Implies(formula, f), z3.Implies(f,formula)))
+        #return simplify(formula == f)
+    elif op == "xor":
+        return simplify((z3.And(z3.Implies(formula, z3.Not(f)), z3.Implies(z3.Not(formula),f))))
+        #return simplify(formula == z3.Not(f))
+    raise Exception("Boolean operator " + op + "not recognised")
+
+
+def relation_operation(op, formula, f, simplify=z3.simplify):
+    if op == "<=":
+        return simplify(formula <= f)
+    elif op == "=":
+        return simplify(formula == f)
+    elif op == ">=":
+        return simplify(formula >= f)
+    elif op == "<":
+        return simplify(formula < f)
+    elif op == ">":
+        return simplify(formula > f)
+    elif op == "!=":
+        return simplify(formula != f)
+    raise Exception("Comparison operator " + op + "not recognised")
+
+
+def arithmetic_operation(op, formula, f, simplify=z3.simplify):
+    if isinstance(formula, z3.BoolRef):
+        formula = z3.If(formula, 1, 0)
+    if isinstance(f, z3.BoolRef):
+        f = z3.If(f,1,0)
+    if op == "+":
+        return simplify(formula + f)
+    elif op == "-":
+        return simplify(formula - f)
+    elif op == "*":
+        return simplify(formula * f)
+    raise Exception("Arithmetic operator " + op + "not recognised")
+
+
+def sum_operation(formulas, simplify=z3.simplify):
+    return simplify(z3.Sum([z3.If(i, 1, 0) if isinstance(i, z3.BoolRef) else i for i in formulas]))
+
+
+# n-ary translation of the associative operators
+NARY_OPERATIONS = {
+    "and": lambda formulas, simplify: z3.And(formulas),
+    "or": lambda formulas, simplify: z3.Or(formulas),
+    "+": sum_operation}
+
+
+def fold_operations(formulas, ops, operation, simplify=z3.simplify):
+    """Left associative application of the binary operators ops to the formulas.
+    Runs of the same associative operator are translated into a single n-ary term
+    (e.g., a and b and c into And(a,b,c) instead of And(And(a,b),c))"""
+    args = [formulas[0]]
+    run_op = None
+    for op, f in zip(ops, formulas[1:]):
+        if op == run_op:
+            args.append(f)
+            continue
+        formula = args[0] if len(args) == 1 else NARY_OPERATIONS[run_op](args, simplify)
+        if op in NARY_OPERATIONS:
+            args = [formula, f]
+            run_op = op
+        else:
+            args = [operation(op, formula, f, simplify)]
+            run_op = None
+    return args[0] if len(args) == 1 else NARY_OPERATIONS[run_op](args, simplify)
+
+
+def one_only(formulas):
+    if not formulas:
+        return z3.BoolVal(False)
+    elif len(formulas) == 1:
+        return formulas[0]
+    return z3.PbEq([(i,1) for i in formulas],1)
+
+
+def bool_fact(fact, simplify=z3.simplify):
+    if fact == "true":
+        return simplify(z3.BoolVal(True))
+    return simplify(z3.BoolVal(False))
+
+
+def constraint_preference(formula, simplify=z3.simplify):
+    if isinstance(formula,z3.BoolRef):
+        return z3.If(simplify(formula),1,0)
+    return simplify(formula)
+
+
+def min_max_preference(op, attribute, simplify=z3.simplify):
+    if op == "min":
+        return simplify(0 - z3.Int(attribute))
+    return z3.Int(attribute)
+
 
 class MyVisitor(SpecificationGrammarVisitor):
-    def __init__(self, json_data, feature_as_boolean=False):
+    def __init__(self, json_data, feature_as_boolean=False, simplify="node"):
         """the input parameter for the visitor is the json data"""
         self.json_data = json_data
         self.features = set()
         self.attributes = set()
         self.contexts = set()
         self.feature_as_boolean = feature_as_boolean
+        self.simplify = z3.simplify if simplify == "node" else no_simplify
 
     def defaultResult(self):
         return ""
@@ -42,41 +161,21 @@ class MyVisitor(SpecificationGrammarVisitor):
                         str(token.text) + "'")
 
     def visitConstraintPreference(self, ctx):
-        formula = ctx.getChild(0).accept(self)
-        if isinstance(formula,z3.BoolRef):
-            return z3.If(z3.simplify(ctx.getChild(0).accept(self)),1,0)
-        return z3.simplify(ctx.getChild(0).accept(self))
+        return constraint_preference(ctx.getChild(0).accept(self), self.simplify)
 
     def visitMinMaxPreference(self, ctx):
         op = ctx.getChild(0).accept(self)
         attribute = ctx.getChild(3).accept(self)
-        if op == "min":
-            return z3.simplify(0 - z3.Int(attribute))
-        return z3.Int(attribute)
+        self.attributes.add(attribute)
+        return min_max_preference(op, attribute, self.simplify)
 
     def visitConstraint(self, ctx):
         return ctx.getChild(0).accept(self)
 
     def visitB_expr(self, ctx):
-        formula = ctx.getChild(0).accept(self)
-        for i in range(1, ctx.getChildCount(), 2):
-            op = ctx.getChild(i).accept(self)
-            f = ctx.getChild(i + 1).accept(self)
-            if op == "and":
-                formula = z3.And(formula, f)
-            elif op == "or":
-                formula = z3.Or(formula, f)
-            elif op == "impl":
-                formula = z3.Implies(formula, f)
-            elif op == "iff":
-                formula = z3.simplify(z3.And(z3.Implies(formula, f), z3.Implies(f,formula)))
-                #formula = z3.simplify(formula == f)
-            elif op == "xor":
-                formula = z3.simplify((z3.And(z3.Implies(formula, z3.Not(f)), z3.Implies(z3.Not(formula),f))))
-                #formula = z3.simplify(formula == z3.Not(f))
-            else:
-                raise Exception("Boolean operator " + op + "not recognised")
-        return formula
+        formulas = [ctx.getChild(i).accept(self) for i in range(0, ctx.getChildCount(), 2)]
+        ops = [ctx.getChild(i).accept(self) for i in range(1, ctx.getChildCount(), 2)]
+        return fold_operations(formulas, ops, bool_operation, self.simplify)
 
     def visitB_term(self, ctx):
         formula = ctx.getChild(ctx.getChildCount() - 1).accept(self)
@@ -88,54 +187,24 @@ class MyVisitor(SpecificationGrammarVisitor):
         formulas = []
         for i in range(2,ctx.getChildCount()-1,2):
             formulas.append(ctx.getChild(i).accept(self))
-        if not formulas:
-            return z3.BoolVal(False)
-        elif len(formulas) == 1:
-            return formulas[0]
-        return z3.PbEq([(i,1) for i in formulas],1)
+        return one_only(formulas)
 
     def visitRelation(self, ctx):
         formula = ctx.getChild(0).accept(self)
         for i in range(1, ctx.getChildCount(), 2):
             op = ctx.getChild(i).accept(self)
             f = ctx.getChild(i + 1).accept(self)
-            if op == "<=":
-                formula = z3.simplify(formula <= f)
-            elif op == "=":
-                formula = z3.simplify(formula == f)
-            elif op == ">=":
-                formula = z3.simplify(formula >= f)
-            elif op == "<":
-                formula = z3.simplify(formula < f)
-            elif op == ">":
-                formula = z3.simplify(formula > f)
-            elif op == "!=":
-                formula = z3.simplify(formula != f)
-            else:
-                raise Exception("Comparison operator " + op + "not recognised")
+            formula = relation_operation(op, formula, f, self.simplify)
         return formula
 
     def visitExpr(self, ctx):
         formula = ctx.getChild(0).accept(self)
         num = ctx.getChildCount()
-        if num == 1 and self.feature_as_boolean:
+        if num == 1:
             return formula
-        for i in range(1, num, 2):
-            op = ctx.getChild(i).accept(self)
-            f = ctx.getChild(i + 1).accept(self)
-            if isinstance(formula, z3.BoolRef):
-                formula = z3.If(formula, 1, 0)
-            if isinstance(f, z3.BoolRef):
-                f = z3.If(f,1,0)
-            if op == "+":
-                formula = z3.simplify(formula + f)
-            elif op == "-":
-                formula = z3.simplify(formula - f)
-            elif op == "*":
-                formula = z3.simplify(formula * f)
-            else:
-                raise Exception("Arithmetic operator " + op + "not recognised")
-        return formula
+        formulas = [formula] + [ctx.getChild(i).accept(self) for i in range(2, num, 2)]
+        ops = [ctx.getChild(i).accept(self) for i in range(1, num, 2)]
+        return fold_operations(formulas, ops, arithmetic_operation, self.simplify)
 
     def visitTermInt(self, ctx):
         return z3.IntVal(int(ctx.getChild(0).accept(self)))
@@ -161,35 +230,212 @@ class MyVisitor(SpecificationGrammarVisitor):
         return ctx.getChild(1).accept(self)
 
     def visitBoolFact(self, ctx):
-        fact = ctx.getChild(0).accept(self)
-        if fact == "true":
-            return z3.simplify(z3.BoolVal(True))
-        return z3.simplify(z3.BoolVal(False))
-
-
-def translate_constraint(in_string, data,feature_as_boolean=False):
-    lexer = SpecificationGrammarLexer(InputStream(in_string))
-    stream = CommonTokenStream(lexer)
-    parser = SpecificationGrammarParser(stream)
-    tree = parser.constraint()
-    visitor = MyVisitor(data,feature_as_boolean)
-    formula = visitor.visit(tree)
+        return bool_fact(ctx.getChild(0).accept(self), self.simplify)
+
+
+
+# tokens of the grammar in SpecificationGrammar.g4
+# INT precedes the arithmetic operators to obtain the longest match of the ANTLR lexer (e.g., -1 is an INT)
+TOKEN_REGEX = re.compile(r"""
+    (?P<WS>[ \t\r\n]+) |
+    (?P<LIT>context\[|feature\[|attribute\[) |
+    (?P<INT>-?[0-9]+) |
+    (?P<ID>[a-zA-Z_][-a-zA-Z0-9_]*) |
+    (?P<OP><=|>=|!=|[=<>+\-*()\[\],])
+    """, re.VERBOSE)
+
+KEYWORDS = set(["and", "or", "xor", "oneonly", "not", "true", "false", "impl", "iff", "min", "max", "abs"])
+BOOL_OPERATORS = set(["and", "or", "impl", "iff", "xor"])
+RELATION_OPERATORS = set(["<=", "=", ">=", "<", ">", "!="])
+ARITHMETIC_OPERATORS = set(["+", "-", "*"])
+
+
+class FastTranslator:
+    """Hand written recursive descent parser for the grammar in SpecificationGrammar.g4.
+    Produces the same formulas of MyVisitor without building the ANTLR parse tree.
+    Differently from the ANTLR lexer, characters not part of the grammar are not skipped but raise an error."""
+
+    def __init__(self, json_data, feature_as_boolean=False, simplify="node"):
+        """the input parameter for the translator is the json data"""
+        self.json_data = json_data
+        self.features = set()
+        self.attributes = set()
+        self.contexts = set()
+        self.feature_as_boolean = feature_as_boolean
+        self.simplify = z3.simplify if simplify == "node" else no_simplify
+        self.tokens = []
+        self.pos = 0
+
+    def tokenize(self, in_string):
+        """Returns the list of pairs (type, text) of the tokens. The type of keywords and operators is their text."""
+        tokens = []
+        pos = 0
+        length = len(in_string)
+        while pos < length:
+            match = TOKEN_REGEX.match(in_string, pos)
+            if not match:
+                raise Exception("Erroneous character at column " + str(pos) + ": '" + in_string[pos] + "'")
+            kind = match.lastgroup
+            text = match.group(kind)
+            if kind == "ID":
+                tokens.append((text if text in KEYWORDS else "ID", text, pos))
+            elif kind == "INT":
+                tokens.append(("INT", text, pos))
+            elif kind != "WS":
+                tokens.append((text, text, pos))
+            pos = match.end()
+        tokens.append(("EOF", "<EOF>", pos))
+        return tokens
+
+    def peek(self):
+        return self.tokens[self.pos][0]
+
+    def expect(self, kind):
+        token = self.tokens[self.pos]
+        if token[0] != kind:
+            raise Exception("Erroneous token at column " + str(token[2]) + ": '" + token[1] +
+                            "' (expected " + kind + ")")
+        self.pos += 1
+        return token[1]
+
+    def parse_constraint(self, in_string):
+        self.tokens = self.tokenize(in_string)
+        self.pos = 0
+        formula = self.b_expr()
+        self.expect("EOF")
+        return formula
+
+    def parse_preference(self, in_string):
+        self.tokens = self.tokenize(in_string)
+        self.pos = 0
+        if self.peek() in ("min", "max"):
+            op = self.expect(self.peek())
+            self.expect("(")
+            self.expect("attribute[")
+            attribute = self.expect("ID")
+            self.expect("]")
+            self.expect(")")
+            self.expect("EOF")
+            self.attributes.add(attribute)
+            return min_max_preference(op, attribute, self.simplify)
+        formula = self.b_expr()
+        self.expect("EOF")
+        return constraint_preference(formula, self.simplify)
+
+    def b_expr(self):
+        formulas = [self.b_term()]
+        ops = []
+        while self.peek() in BOOL_OPERATORS:
+            ops.append(self.expect(self.peek()))
+            formulas.append(self.b_term())
+        return fold_operations(formulas, ops, bool_operation, self.simplify)
+
+    def b_term(self):
+        if self.peek() == "not":
+            self.pos += 1
+            return z3.Not(self.b_factor())
+        return self.b_factor()
+
+    def b_factor(self):
+        kind = self.peek()
+        if kind == "true" or kind == "false":
+            self.pos += 1
+            return bool_fact(kind, self.simplify)
+        if kind == "oneonly":
+            self.pos += 1
+            self.expect("[")
+            formulas = [self.b_expr()]
+            while self.peek() == ",":
+                self.pos += 1
+                formulas.append(self.b_expr())
+            self.expect("]")
+            return one_only(formulas)
+        return self.relation()
+
+    def relation(self):
+        formula = self.expr()
+        if self.peek() in RELATION_OPERATORS:
+            op = self.expect(self.peek())
+            f = self.expr()
+            formula = relation_operation(op, formula, f, self.simplify)
+        return formula
+
+    def expr(self):
+        formulas = [self.term()]
+        ops = []
+        while self.peek() in ARITHMETIC_OPERATORS:
+            ops.append(self.expect(self.peek()))
+            formulas.append(self.term())
+        return fold_operations(formulas, ops, arithmetic_operation, self.simplify)
+
+    def term(self):
+        kind = self.peek()
+        if kind == "INT":
+            return z3.IntVal(int(self.expect("INT")))
+        elif kind == "context[":
+            self.pos += 1
+            id = self.expect("ID")
+            self.expect("]")
+            self.contexts.add(id)
+            return z3.Int(id)
+        elif kind == "feature[":
+            self.pos += 1
+            id = self.expect("ID")
+            self.expect("]")
+            self.features.add(id)
+            if self.feature_as_boolean:
+                return z3.Bool(id)
+            return z3.Int(id)
+        elif kind == "attribute[":
+            self.pos += 1
+            id = self.expect("ID")
+            self.expect("]")
+            self.attributes.add(id)
+            return z3.Int(id)
+        elif kind == "(":
+            self.pos += 1
+            formula = self.b_expr()
+            self.expect(")")
+            return formula
+        token = self.tokens[self.pos]
+        raise Exception("Erroneous token at column " + str(token[2]) + ": '" + token[1] + "'")
+
+
+def translate_constraint(in_string, data, feature_as_boolean=False, parser="antlr", simplify="node"):
+    if parser == "fast":
+        translator = FastTranslator(data, feature_as_boolean, simplify)
+        formula = translator.parse_constraint(in_string)
+    else:
+        lexer = SpecificationGrammarLexer(InputStream(in_string))
+        stream = CommonTokenStream(lexer)
+        grammar_parser = SpecificationGrammarParser(stream)
+        tree = grammar_parser.constraint()
+        translator = MyVisitor(data, feature_as_boolean, simplify)
+        formula = translator.visit(tree)
+    if simplify == "constraint":
+        formula = z3.simplify(formula)
     return {
         "formula": formula,
-        "contexts": visitor.contexts,
-        "features": visitor.features,
-        "attributes": visitor.attributes}
-
-
-def translate_preference(in_string, data, feature_as_boolean=False):
-    lexer = SpecificationGrammarLexer(InputStream(in_string))
-    stream = CommonTokenStream(lexer)
-    parser = SpecificationGrammarParser(stream)
-    tree = parser.preference()
-    visitor = MyVisitor(data,feature_as_boolean)
-    formula = visitor.visit(tree)
+        "contexts": translator.contexts,
+        "features": translator.features,
+        "attributes": translator.attributes}
+
+
+def translate_preference(in_string, data, feature_as_boolean=False, parser="antlr", simplify="node"):
+    if parser == "fast":
+        translator = FastTranslator(data, feature_as_boolean, simplify)
+        formula = translator.parse_preference(in_string)
+    else:
+        lexer = SpecificationGrammarLexer(InputStream(in_string))
+        stream = CommonTokenStream(lexer)
+        grammar_parser = SpecificationGrammarParser(stream)
+        tree = grammar_parser.preference()
+        translator = MyVisitor(data, feature_as_boolean, simplify)
+        formula = translator.visit(tree)
+    if simplify == "constraint":
+        formula = z3.simplify(formula)
     return {
         "formula": formula,
-        "contexts": visitor.contexts,
-        "features": visitor.features,
-        "attributes": visitor.attributes}
+        "contexts": translator.contexts,
+        "features": translator.features,
+        "attributes": translator.attributes}
@@ -0,0 +1,66 @@
+"""
+batch_module.py: reconfiguration of a batch of configurations sharing the same feature model.
+
+The feature model is translated once by the main process before starting the pool of workers.
+The workers are forked from the main process and find the compiled model in their model cache,
+hence only the configurations are sent to the workers.
+"""
+import logging as log
+import json
+import time
+import itertools
+import multiprocessing
+import StringIO
+
+# set by run_batch before forking the workers
+BATCH = {}
+
+
+def process_configuration(args):
+    """Runs HyVarRec on the feature model of the batch extended with the configuration given as json string.
+    Returns the output line of the configuration"""
+    index, line = args
+    start_time = time.time()
+    out = {"index": index}
+    try:
+        data = dict(BATCH["data"])
+        data["configuration"] = json.loads(line)
+        out_stream = StringIO.StringIO()
+        BATCH["run"](data, out_stream)
+        out["output"] = json.loads(out_stream.getvalue())
+    except (SystemExit, Exception) as e:
+        log.critical("Configuration " + unicode(index) + " failed: " + unicode(e))
+        out["error"] = unicode(e)
+    out["time"] = time.time() - start_time
+    return json.dumps(out) + "\n"
+
+
+def run_batch(data, configurations, out_stream, num_of_process, run):
+    """Process the configurations (json strings, one per line) writing the results on the output stream in the
+    same order of the configurations.
+    The function run(data, out_stream) must run HyVarRec on the input data, writing its output on the stream.
+    The feature model must be already compiled and stored in the model cache."""
+    BATCH["data"] = data
+    BATCH["run"] = run
+    lines = ((i, line) for i, line in enumerate(configurations) if line.strip())
+    start_time = time.time()
+    counter = 0
+    if num_of_process > 1:
+        log.info("Starting a pool of {} workers".format(num_of_process))
+        pool = multiprocessing.Pool(num_of_process)
+        results = pool.imap(process_configuration, lines)
+    else:
+        pool = None
+        results = itertools.imap(process_configuration, lines)
+    try:
+        for result in results:
+            out_stream.write(result)
+            out_stream.flush()
+            counter += 1
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    elapsed_time = time.time() - start_time
+    log.info("Processed {} configurations in {} seconds ({} per second)".format(
+        counter, elapsed_time, counter / elapsed_time if elapsed_time > 0 else counter))
@@ -1,11 +1,40 @@
+"""
+check_features_module.py: detection of the dead and false optional features.
+
+The grid and pruning modalities check every time instant independently on a solver containing the feature model.
+The checks of a time instant can be split by feature, hence the time instants, or shards of the features of a time
+instant when there are few time instants, can be checked by a pool of processes. Every worker keeps its own
+incremental solver. The results are merged sorting the time instants, hence the output does not depend on the
+number of processes.
+In every modality the features settled by the implication graph of the constraints (see implication_module.py)
+are not checked by the solver.
+"""
 import logging as log
 import z3
 import uuid
 import json
 import sys
+import time
+import multiprocessing
+import implication_module
 
 STARTING_LEVEL_FEATURE_SPECULATIVE_PRUNING = 64
 SPECULATIVE_PRUNING_TIMEOUT = 30000
+# the timeout of a speculative pruning attempt is the longest of the last successful attempts times the factor
+MIN_SPECULATIVE_PRUNING_TIMEOUT = 100
+PRUNING_TIMEOUT_FACTOR = 4
+PRUNING_TIMES_WINDOW = 10
+# maximal number of backbone candidates flipped at once
+BACKBONE_CHUNK_SIZE = 64
+
+# set by run_feature_analysis before forking the workers
+CHECK = {}
+
+# declarations of the features read from the models
+DECLS = {}
+
+# literals of the features selected or deselected, built once since the checks use them many times
+LITERALS = {}
 
 def get_dic_of_features_to_check(optional_features):
     to_check = {}
@@ -44,170 +73,472 @@ def get_time_context(time_context, optional_features):
     return time_context
 
 
+def is_time_context(term, time_context):
+    return z3.is_const(term) and term.decl().kind() == z3.Z3_OP_UNINTERPRETED and term.decl().name() == time_context
+
+
+def get_time_breakpoints(constraints, time_context, contexts):
+    """Returns the time instants where the truth value of a constraint may change, i.e., the values c and c + 1 of
+    the comparisons between the time context and a constant c, and the bounds min and max + 1 of the time context.
+    Returns None if the time context is used otherwise"""
+    breakpoints = set()
+    if time_context in contexts:
+        breakpoints.update([contexts[time_context]["min"], contexts[time_context]["max"] + 1])
+    visited = set()
+    stack = list(constraints)
+    while stack:
+        term = stack.pop()
+        if term.get_id() in visited:
+            continue
+        visited.add(term.get_id())
+        if is_time_context(term, time_context):
+            return None
+        if z3.is_eq(term) or z3.is_le(term) or z3.is_lt(term) or z3.is_ge(term) or z3.is_gt(term) or \
+                z3.is_distinct(term):
+            args = term.children()
+            if len(args) == 2 and is_time_context(args[0], time_context) and z3.is_int_value(args[1]):
+                breakpoints.update([args[1].as_long(), args[1].as_long() + 1])
+                continue
+            if len(args) == 2 and is_time_context(args[1], time_context) and z3.is_int_value(args[0]):
+                breakpoints.update([args[0].as_long(), args[0].as_long() + 1])
+                continue
+        stack.extend(term.children())
+    return breakpoints
+
+
+def get_dic_of_intervals_to_check(optional_features, breakpoints):
+    """Returns the features to check in every time interval, indexed by the first instant of the interval, and the
+    last instant of every interval. The ranges of the optional features are split at the breakpoints and at the
+    bounds of the ranges, hence all the instants of an interval satisfy the same constraints and have the same
+    features to check"""
+    points = set(breakpoints)
+    for i in optional_features:
+        for k in optional_features[i]:
+            points.update([k[0], k[1] + 1])
+    points = sorted(points)
+    to_check = {}
+    ends = {}
+    for start, end in zip(points, [j - 1 for j in points[1:]]):
+        features = [i for i in optional_features if any([k[0] <= start and end <= k[1] for k in optional_features[i]])]
+        if features:
+            to_check[start] = features
+            ends[start] = end
+    return to_check, ends
+
+
+def get_model_values(model, features, features_as_boolean):
+    """Returns the values of the features in the model as pointers to the z3 values (None if not assigned).
+    The values are read with the C API since the z3 python expressions are too slow for checking every feature
+    after every satisfiable check. The declarations of the features are created once"""
+    ctx = model.ctx.ref()
+    values = {}
+    for j in features:
+        if (j, features_as_boolean) not in DECLS:
+            DECLS[(j, features_as_boolean)] = z3.Bool(j).decl() if features_as_boolean else z3.Int(j).decl()
+        values[j] = z3.Z3_model_get_const_interp(ctx, model.model, DECLS[(j, features_as_boolean)].ast).value
+    return values
+
+
 def get_fail_checks_from_model(dead_ls, false_ls, model, features_as_boolean):
-    dead_remove = []
-    false_remove = []
+    # the values are unique in the z3 context, hence they are compared by pointer
     if features_as_boolean:
-        val_true = z3.BoolVal(True)
-        val_zero = z3.BoolVal(False)
-        for j in dead_ls:
-            if model[z3.Bool(j)] == val_true:
-                dead_remove.append(j)
-        for j in false_ls:
-            if model[z3.Bool(j)] == val_zero:
-                false_remove.append(j)
+        selected, deselected = z3.BoolVal(True), z3.BoolVal(False)
     else:
-        val1 = z3.IntVal(1)
-        val0 = z3.IntVal(0)
-        for j in dead_ls:
-            if model[z3.Int(j)] == val1:
-                dead_remove.append(j)
-        for j in false_ls:
-            if model[z3.Int(j)] == val0:
-                false_remove.append(j)
+        selected, deselected = z3.IntVal(1), z3.IntVal(0)
+    values = get_model_values(model, set(dead_ls).union(false_ls), features_as_boolean)
+    dead_remove = [j for j in dead_ls if values[j] == selected.as_ast().value]
+    false_remove = [j for j in false_ls if values[j] == deselected.as_ast().value]
     log.debug("Removed {} ({}) dead (false optional) checks".format(
         len(dead_remove), len(false_remove)))
     return dead_remove, false_remove
 
 
-def run_feature_analysis_with_optimization(
-        features,
-        features_as_boolean,
-        contexts,
-        attributes,
-        constraints,
-        optional_features,
-        non_incremental_solver,
-        out_stream,
-        time_context=""):
-    """
-    Performs the feature analysis task.
-    Tries first to prune level features at the time with a given timeout.
-    If the timeout expires then level is decreased
-    When level reaches 1 than one of the possible dead features is checked using an or
-    If found another more restricting or constraint is added, until all the dead features are found.
-    """
+def add_instants(data, kind, features, instant):
+    for j in features:
+        if j in data[kind]:
+            data[kind][j].append(instant)
+        else:
+            data[kind][j] = [instant]
 
-    data = {"dead_features": {}, "false_optionals": {}}
-    solver = z3.Solver()
-    #solver = z3.Then('simplify', 'nla2bv', 'smt').solver()
-    if non_incremental_solver:
-        solver.set("combined_solver.solver2_timeout",1)
 
-    # if time variable is not defined, create a fictional one
-    time_context = get_time_context(time_context, optional_features)
+def add_interval(data, kind, features, start, end):
+    """Adds the interval to the ranges of the features, extending the last range if adjacent"""
+    for j in features:
+        ranges = data[kind].setdefault(j, [])
+        if ranges and ranges[-1][1] + 1 == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
 
-    log.debug("Add basic constraints")
-    solver.add(get_basic_formula_list(features, attributes, contexts, constraints,features_as_boolean))
 
+def write_output(data, out_stream):
+    log.info("Printing output")
+    json.dump(data, out_stream)
+    out_stream.write("\n")
+
+
+def get_pruning_schedule(kind):
+    """Returns the state of the speculative pruning of the worker for the dead (kind "dead") or the false optional
+    (kind "false") features. The state is kept between the time instants checked by the worker: the level starts
+    from the last level that succeeded and the timeout of an attempt from the times of the successful attempts"""
+    schedules = CHECK.setdefault("schedules", {})
+    if kind not in schedules:
+        schedules[kind] = {"level": STARTING_LEVEL_FEATURE_SPECULATIVE_PRUNING,
+                           "timeout": SPECULATIVE_PRUNING_TIMEOUT,
+                           "times": [],
+                           "attempts": {}}
+    return schedules[kind]
+
+
+def update_pruning_schedule(schedule, level, result, elapsed_time):
+    """Updates the schedule with the result of an attempt of pruning level features at once.
+    Returns the level of the next attempt: doubled after a success if at this level most attempts succeed, halved
+    otherwise. The next time instant starts from the last level reached by a success, halved if an attempt expires
+    (an unsat answer only means that few candidates are left)"""
+    attempts = schedule["attempts"].setdefault(level, [0, 0])
+    attempts[0] += 1
+    if result == z3.sat:
+        attempts[1] += 1
+        schedule["times"] = (schedule["times"] + [elapsed_time])[-PRUNING_TIMES_WINDOW:]
+        schedule["timeout"] = min(SPECULATIVE_PRUNING_TIMEOUT, max(
+            MIN_SPECULATIVE_PRUNING_TIMEOUT, int(PRUNING_TIMEOUT_FACTOR * 1000 * max(schedule["times"]))))
+        if 2 * attempts[1] > attempts[0]:
+            level = min(2 * level, STARTING_LEVEL_FEATURE_SPECULATIVE_PRUNING)
+        schedule["level"] = max(level, 2)
+        return level
+    if result == z3.unknown:
+        schedule["level"] = max(min(schedule["level"], level) / 2, 2)
+    return max(level / 2, 1)
+
+
+def prune_features(solver, kind, to_check, to_check_false, features_as_boolean, trace):
+    """Removes from to_check the features that can be selected (kind "dead") or deselected (kind "false") at the time
+    instant. The models found also remove the false optional features that can be deselected.
+    Tries first to prune level features at once with the timeout of the schedule. If the solver finds that less
+    than level features can change value or the timeout expires the level is halved.
+    When level reaches 1 one of the features is checked using an or. If found another more restricting or constraint
+    is added, until all the features that can not change value are found.
+    Returns the features that can not change value, the attempts are added to the trace"""
+    schedule = get_pruning_schedule(kind)
+    value = 1 if kind == "dead" else 0
+    level = max(min(schedule["level"], len(to_check) / 2), 1)
+    solver.push()
+    found = []
+    while to_check:
+        log.debug("{} {} features to check".format(len(to_check), kind))
+        literals = [get_feature_literal(j, value, features_as_boolean) for j in to_check]
+        if level == 1:
+            solver.set('smt.timeout', 4294967295)
+            solver.add(z3.Or(literals))
+        else:
+            solver.push()
+            solver.set('smt.timeout', schedule["timeout"])
+            log.debug("Attempt to prune {} features at once".format(level))
+            solver.add(z3.PbGe([(j, 1) for j in literals], level))
+
+        CHECK["calls"] += 1
+        start_time = time.time()
+        result = solver.check()
+        elapsed_time = time.time() - start_time
+        log.debug("Solver result {}".format(result))
+        trace.append({"features": kind, "level": level, "result": unicode(result), "seconds": elapsed_time})
+        if result == z3.unsat and level == 1:
+            found.extend(to_check)
+            if kind == "dead":
+                to_check_false.difference_update(to_check)
+            break
+        if result == z3.sat:
+            if kind == "dead":
+                to_remove, to_remove_false = get_fail_checks_from_model(
+                    to_check, to_check_false, solver.model(), features_as_boolean)
+                to_check_false.difference_update(to_remove_false)
+            else:
+                _, to_remove = get_fail_checks_from_model([], to_check, solver.model(), features_as_boolean)
+            to_check.difference_update(to_remove)
+        else:
+            log.debug("Less than {} features pruned or timeout expired".format(level))
+        if level != 1:
+            solver.pop()
+        level = max(min(update_pruning_schedule(schedule, level, result, elapsed_time), len(to_check) / 2), 1)
+    solver.pop()
+    return found
+
+
+def check_instant_with_optimization(solver, i, time_formula, to_check_dead, to_check_false, features_as_boolean,
+                                    non_incremental_solver):
+    """
+    Returns the dead and the false optional features among the features to check at the time instant.
+    The dead features are pruned first and then the false optional features, both by speculative pruning.
+    The attempts done are added to the pruning trace of the task.
+    """
+    trace = CHECK.setdefault("trace", [])
+    solver.push()
+    solver.add(time_formula)
     if not non_incremental_solver:
         log.debug("Preliminary check")
+        CHECK["calls"] += 1
         solver.check()
 
-    # list of the features to check
-    to_check = get_dic_of_features_to_check(optional_features)
-    to_check_dead = {i: set(to_check[i]) for i in to_check}
-    to_check_false = {i: set(to_check[i]) for i in to_check}
+    log.debug("Checking for dead features")
+    dead = prune_features(solver, "dead", to_check_dead, to_check_false, features_as_boolean, trace)
+    log.debug("Checking for false optional features")
+    false = prune_features(solver, "false", to_check_false, set(), features_as_boolean, trace)
+    solver.pop()
+    return dead, false
 
-    log.info("Features to check: {}, Time context".format(
-        len(optional_features), len(to_check)))
 
-    for i in to_check_dead:
-        log.debug("Processing time instant {}, features to check {}".format(i,len(to_check_dead[i])))
-        solver.push()
-        solver.add(z3.Int(time_context).__eq__(z3.IntVal(i)))
+def get_feature_literal(j, value, features_as_boolean):
+    """Returns the literal assuming the feature selected (value 1) or deselected (value 0)"""
+    key = (j, value, features_as_boolean)
+    if key not in LITERALS:
+        if features_as_boolean:
+            LITERALS[key] = z3.Bool(j) if value else z3.Not(z3.Bool(j))
+        else:
+            LITERALS[key] = z3.Int(j).__eq__(z3.IntVal(value))
+    return LITERALS[key]
+
+
+def get_feature_degrees(features, constraints):
+    """Returns the number of constraints using every feature"""
+    degrees = {}
+    for formula in constraints:
+        visited = set()
+        names = set()
+        stack = [formula]
+        while stack:
+            term = stack.pop()
+            if term.get_id() in visited:
+                continue
+            visited.add(term.get_id())
+            if z3.is_const(term) and term.decl().kind() == z3.Z3_OP_UNINTERPRETED:
+                names.add(term.decl().name())
+            else:
+                stack.extend(term.children())
+        for j in names.intersection(features):
+            degrees[j] = degrees.get(j, 0) + 1
+    return degrees
+
 
-        if not non_incremental_solver:
-            log.debug("Preliminary check")
-            solver.check()
+def harvest_model(solver, to_check_dead, to_check_false, features_as_boolean):
+    """Removes from the features to check the ones proven not dead or not false optional by the model of the last
+    satisfiable check. Every feature removed is a check saved"""
+    to_remove_dead, to_remove_false = get_fail_checks_from_model(
+        to_check_dead, to_check_false, solver.model(), features_as_boolean)
+    to_check_dead.difference_update(to_remove_dead)
+    to_check_false.difference_update(to_remove_false)
+    CHECK["saved"] += len(to_remove_dead) + len(to_remove_false)
 
-        solver.push()
 
-        log.debug("Checking for dead features")
-        limit = STARTING_LEVEL_FEATURE_SPECULATIVE_PRUNING
-        all_in_once = max(len(to_check_dead[i])/2,1)
-        all_in_once = min(limit,all_in_once)
+def check_instant_grid_search(solver, i, time_formula, to_check_dead, to_check_false, features_as_boolean,
+                              non_incremental_solver):
+    """
+    Returns the dead and the false optional features among the features to check at the time instant,
+    checking one feature at the time.
+    The time instant and the value of the feature are given as assumptions instead of being added in a scope,
+    hence the lemmas learned by the solver are kept for the following checks and time instants.
+    The model of every satisfiable check removes the features it proves not dead or not false optional.
+    The features used by more constraints are checked first since their models fix more features.
+    """
+    dead = []
+    false = []
+    order = lambda j: (-CHECK["degrees"].get(j, 0), j)
+    # run first time to prune easy features and check satisfiability
+    CHECK["calls"] += 1
+    result = solver.check(time_formula)
+    if result == z3.unsat:
+        log.debug("All instances are dead for time {}".format(i))
+        return list(to_check_dead), false
+    elif result == z3.sat:
+        harvest_model(solver, to_check_dead, to_check_false, features_as_boolean)
+    else:
+        log.debug("Problems in detecting the satisfiability of the instance. Z3 returned {}".format(result))
+        sys.exit(1)
+
+    log.debug("Checking for dead features")
+    for j in sorted(to_check_dead, key=order):
+        if j not in to_check_dead:
+            continue
+        log.debug("Processing feature {}, remaining {}".format(j, len(to_check_dead)))
+        to_check_dead.discard(j)
+        CHECK["calls"] += 1
+        result = solver.check(time_formula, get_feature_literal(j, 1, features_as_boolean))
+        log.debug("Result {}".format(result))
+        if result == z3.unsat:
+            log.debug("{} is a dead feature".format(j))
+            dead.append(j)
+            to_check_false.discard(j)
+        elif result == z3.sat:
+            harvest_model(solver, to_check_dead, to_check_false, features_as_boolean)
+        else:
+            log.debug("Problems checking feature{} at time {}. Z3 returned {}".format(
+                j, i, result))
+            sys.exit(1)
 
-        while to_check_dead[i]:
+    log.debug("Checking for false optional features")
+    for j in sorted(to_check_false, key=order):
+        if j not in to_check_false:
+            continue
+        log.debug("Processing feature {}, remaining {}".format(j, len(to_check_false)))
+        to_check_false.discard(j)
+        CHECK["calls"] += 1
+        result = solver.check(time_formula, get_feature_literal(j, 0, features_as_boolean))
+        log.debug("Result {}".format(result))
+        if result == z3.unsat:
+            log.debug("{} is a false optional feature".format(j))
+            false.append(j)
+        elif result == z3.sat:
+            harvest_model(solver, set(), to_check_false, features_as_boolean)
+        else:
+            log.debug("Problems checking feature{} at time {}. Z3 returned {}".format(
+                j, i, result))
+            sys.exit(1)
+    return dead, false
 
-            log.debug("{} ({}) dead (false optional) features to check".format(
-                len(to_check_dead[i]), len(to_check_false[i])))
 
-            if all_in_once == 1:
-                solver.set('smt.timeout',4294967295)
-                if features_as_boolean:
-                    solver.add(z3.Or([z3.Bool(j) for j in to_check_dead[i]]))
-                else:
-                    solver.add(z3.Or([z3.Int(j).__eq__(z3.IntVal(1)) for j in to_check_dead[i]]))
+def check_instant_backbone(solver, i, time_formula, to_check_dead, to_check_false, features_as_boolean,
+                           non_incremental_solver):
+    """
+    Returns the dead and the false optional features among the features to check at the time instant computing the
+    backbone of the feature model restricted to them: the dead features are fixed to 0 and the false optional
+    features to 1.
+    The candidates are the values of the features in a model. A chunk of candidates is checked assuming all of them
+    flipped: if satisfiable, the model removes all the candidates it flips; otherwise the candidates in the unsat
+    core are checked again with smaller chunks and a candidate alone in the core is in the backbone.
+    The backbone found is assumed in the following checks.
+    """
+    order = lambda j: (-CHECK["degrees"].get(j, 0), j)
+    CHECK["calls"] += 1
+    result = solver.check(time_formula)
+    if result == z3.unsat:
+        log.debug("All instances are dead for time {}".format(i))
+        return list(to_check_dead), []
+    elif result != z3.sat:
+        log.debug("Problems in detecting the satisfiability of the instance. Z3 returned {}".format(result))
+        sys.exit(1)
+
+    # candidates to be in the backbone with their value
+    candidates = {}
+    to_remove_dead, to_remove_false = get_fail_checks_from_model(
+        to_check_dead, to_check_false, solver.model(), features_as_boolean)
+    candidates.update({j: 0 for j in to_check_dead.difference(to_remove_dead)})
+    candidates.update({j: 1 for j in to_check_false.difference(to_remove_false)})
+    pending = sorted(candidates.keys(), key=order)
+    backbone = []
+    size = BACKBONE_CHUNK_SIZE
+    # candidates checked one at a time after an empty unsat core
+    single = set()
+    while pending:
+        chunk = pending[:1] if pending[0] in single else pending[:size]
+        flipped = {get_feature_literal(j, 1 - candidates[j], features_as_boolean).sexpr(): j for j in chunk}
+        log.debug("Checking {} backbone candidates, remaining {}".format(len(chunk), len(pending)))
+        CHECK["calls"] += 1
+        result = solver.check(*([time_formula] + [get_feature_literal(j, candidates[j], features_as_boolean)
+                                                  for j in backbone] +
+                                [get_feature_literal(j, 1 - candidates[j], features_as_boolean) for j in chunk]))
+        if result == z3.sat:
+            to_remove_dead, to_remove_false = get_fail_checks_from_model(
+                [j for j in pending if candidates[j] == 0], [j for j in pending if candidates[j] == 1],
+                solver.model(), features_as_boolean)
+            removed = set(to_remove_dead).union(to_remove_false)
+            CHECK["saved"] += len(removed.difference(chunk))
+            pending = [j for j in pending if j not in removed]
+            size = min(size * 2, BACKBONE_CHUNK_SIZE)
+        elif result == z3.unsat:
+            core = [flipped[c.sexpr()] for c in solver.unsat_core() if c.sexpr() in flipped]
+            if len(core) == 1:
+                log.debug("Found backbone {}".format(core))
+                backbone.extend(core)
+                pending = [j for j in pending if j not in core]
+            elif not core:
+                # the time instant with the backbone found is unsat, contradicting the first satisfiable check
+                log.warning("Empty unsat core checking the backbone at time {}".format(i))
+                if len(chunk) == 1:
+                    log.critical("Inconsistent answers of the solver checking the backbone at time {}".format(i))
+                    sys.exit(1)
+                log.warning("Checking the candidates of the chunk one at a time")
+                single.update(chunk)
             else:
-                solver.push()
-                solver.set('smt.timeout', SPECULATIVE_PRUNING_TIMEOUT)
-                log.debug("Attempt to prune {} features at once".format(all_in_once))
-                if features_as_boolean:
-                    solver.add(z3.PbGe([(z3.Bool(j), 1) for j in to_check_dead[i]], all_in_once))
-                else:
-                    solver.add(z3.PbGe([(z3.Int(j).__eq__(z3.IntVal(1)), 1) for j in to_check_dead[i]], all_in_once))
+                # the candidates in the core are checked first, with a smaller chunk
+                pending = core + [j for j in pending if j not in core]
+                size = max(1, len(core) / 2)
+        else:
+            log.debug("Problems checking the backbone at time {}. Z3 returned {}".format(i, result))
+            sys.exit(1)
+    return [j for j in backbone if candidates[j] == 0], [j for j in backbone if candidates[j] == 1]
 
-            result = solver.check()
-            log.debug("Solver result {}".format(result))
-            if result == z3.unsat:
-                if all_in_once == 1:
-                    to_check_false[i].difference_update(to_check_dead[i])
-                    for j in to_check_dead[i]:
-                        if j in data["dead_features"]:
-                            data["dead_features"][j].append(i)
-                        else:
-                            data["dead_features"][j] = [i]
-                    break
-                else:
-                    solver.pop()
-                    all_in_once = max(all_in_once/2, 1)
-            elif result == z3.sat:
-                to_remove_dead, to_remove_false = get_fail_checks_from_model(
-                    to_check_dead[i], to_check_false[i], solver.model(), features_as_boolean)
-                to_check_dead[i].difference_update(to_remove_dead)
-                to_check_false[i].difference_update(to_remove_false)
-
-                if all_in_once != 1:
-                    solver.pop()
-                all_in_once = max(min(all_in_once,len(to_check_dead[i]) / 2), 1)
-                all_in_once = min(limit, all_in_once)
-            else:
-                log.debug("Execution not terminated without the timeout. Moving on")
-                solver.pop()
-                all_in_once = max(all_in_once / 2, 1)
-
-        solver.pop()
-        solver.push()
-
-        log.debug("Checking for false optional features")
-        while to_check_false[i]:
-            log.debug("{} false optional features to check".format(len(to_check_false[i])))
-            if features_as_boolean:
-                solver.add(z3.Or([z3.Not(z3.Bool(j)) for j in to_check_false[i]]))
-            else:
-                solver.add(z3.Or([z3.Int(j).__eq__(z3.IntVal(0)) for j in to_check_false[i]]))
-            result = solver.check()
-            if result == z3.unsat:
-                for j in to_check_false[i]:
-                    if j in data["false_optionals"]:
-                        data["false_optionals"][j].append(i)
-                    else:
-                        data["false_optionals"][j]= [i]
-                break
-            elif result == z3.sat:
-                _, to_remove_false = get_fail_checks_from_model(
-                    [], to_check_false[i], solver.model(), features_as_boolean)
-                to_check_false[i].difference_update(to_remove_false)
-        solver.pop()
-        solver.pop()
 
-    log.info("Printing output")
-    json.dump(data, out_stream)
-    out_stream.write("\n")
+def init_check_worker():
+    """Creates the incremental solver of the feature model used by the worker for all its time instants"""
+    solver = z3.Solver()
+    if CHECK["non_incremental_solver"]:
+        solver.set("combined_solver.solver2_timeout",1)
 
+    log.debug("Add basic constraints")
+    solver.add(get_basic_formula_list(CHECK["features"], CHECK["attributes"], CHECK["contexts"],
+                                      CHECK["constraints"], CHECK["features_as_boolean"]))
 
-def run_feature_analysis_grid_search(
+    if not CHECK["non_incremental_solver"]:
+        log.debug("Preliminary check")
+        solver.check()
+    CHECK["solver"] = solver
+    CHECK["schedules"] = {}
+
+
+def check_task(task):
+    """Checks the features of the task at its time instant. Returns the time instant with the dead and the false
+    optional features found, the number of solver checks done and saved, and the pruning trace, None if the solver
+    failed.
+    The features selected in every configuration are false optional if the time instant has a configuration,
+    dead otherwise"""
+    i, to_check, static_dead, static_false = task
+    log.debug("Processing time instant {}, features to check {}".format(i, len(to_check)))
+    CHECK["calls"] = 0
+    CHECK["saved"] = 0
+    CHECK["trace"] = []
+    time_formula = z3.Int(CHECK["time_context"]).__eq__(z3.IntVal(i))
+    dead = list(static_dead)
+    false = []
+    try:
+        if to_check:
+            found_dead, found_false = CHECK["check_instant"](
+                CHECK["solver"], i, time_formula, set(to_check), set(to_check), CHECK["features_as_boolean"],
+                CHECK["non_incremental_solver"])
+            dead.extend(found_dead)
+            false.extend(found_false)
+        if static_false:
+            CHECK["calls"] += 1
+            result = CHECK["solver"].check(time_formula)
+            if result == z3.unsat:
+                dead.extend(static_false)
+            elif result == z3.sat:
+                false.extend(static_false)
+            else:
+                log.debug("Problems in detecting the satisfiability of the instance. Z3 returned {}".format(result))
+                sys.exit(1)
+    except SystemExit:
+        return None
+    return i, sorted(dead), sorted(false), CHECK["calls"], CHECK["saved"], CHECK["trace"]
+
+
+def get_tasks(to_check, num_of_process, static_dead=frozenset(), static_false=frozenset()):
+    """Returns the tasks as tuples (time instant, features to check, features statically dead, features statically
+    selected in every configuration) sorted by time instant.
+    When there are less time instants than processes, the features of a time instant are split into shards.
+    The features settled statically are not checked and are given with the first shard of their time instant"""
+    shards = max(1, (num_of_process * 4) / len(to_check)) if num_of_process > 1 and to_check else 1
+    tasks = []
+    for i in sorted(to_check.keys()):
+        features = sorted(set(to_check[i]).difference(static_dead, static_false))
+        size = max(1, (len(features) + shards - 1) / shards)
+        tasks.append((i, features[:size], sorted(static_dead.intersection(to_check[i])),
+                      sorted(static_false.intersection(to_check[i]))))
+        for j in range(size, len(features), size):
+            tasks.append((i, features[j:j + size], [], []))
+    return tasks
+
+
+def run_feature_analysis(
+        check_instant,
         features,
         features_as_boolean,
         contexts,
@@ -216,116 +547,134 @@ def run_feature_analysis_grid_search(
         optional_features,
         non_incremental_solver,
         out_stream,
-        time_context=""):
+        time_context,
+        num_of_process,
+        time_intervals=False,
+        pruning_trace=False):
     """
-    Performs the feature analysis one feature at the time with push and pops. Time context is set to all its values
-    in sequence.
-    Does not check the model except the first time for pruning the remaining features.
-    This helps for big instances where generating the model make take some time.
+    Performs the feature analysis checking every time instant with the function check_instant.
+    With more than one process the time instants are checked by a pool of processes.
+    If time_intervals is True the time instants satisfying the same constraints are checked once as an interval and
+    the output lists the ranges of the time instants instead of the time instants.
+    If pruning_trace is True the output lists for every task the speculative pruning attempts done.
     """
-
-    data = {"dead_features": {}, "false_optionals": {}}
-    solver = z3.Solver()
-    if non_incremental_solver:
-        solver.set("combined_solver.solver2_timeout",1)
-
     # if time variable is not defined, create a fictional one
     time_context = get_time_context(time_context, optional_features)
 
-    log.debug("Add basic constraints")
-    solver.add(get_basic_formula_list(features, attributes, contexts, constraints, features_as_boolean))
-
-    if not non_incremental_solver:
-        log.debug("Preliminary check")
-        solver.check()
-
     # list of the features to check
-    to_check = get_dic_of_features_to_check(optional_features)
-    to_check_dead = {i: set(to_check[i]) for i in to_check}
-    to_check_false = {i: set(to_check[i]) for i in to_check}
+    breakpoints = get_time_breakpoints(constraints, time_context, contexts) if time_intervals else None
+    if breakpoints is None:
+        if time_intervals:
+            log.warning("Time context not only compared with constants. Every time instant is checked")
+        to_check = get_dic_of_features_to_check(optional_features)
+        ends = {i: i for i in to_check}
+    else:
+        to_check, ends = get_dic_of_intervals_to_check(optional_features, breakpoints)
     log.info("Features to check: {}, Time context {}".format(
         len(optional_features), len(to_check)))
+    # the features settled by the implication graph of the constraints are not checked by the solver
+    static_dead, static_false = implication_module.get_settled_features(
+        features, constraints, set(optional_features.keys()))
+    log.info("Features settled statically: {} dead, {} selected in every configuration".format(
+        len(static_dead), len(static_false)))
+
+    CHECK.update({
+        "check_instant": check_instant,
+        "features": features,
+        "features_as_boolean": features_as_boolean,
+        "contexts": contexts,
+        "attributes": attributes,
+        "constraints": constraints,
+        "non_incremental_solver": non_incremental_solver,
+        "time_context": time_context,
+        "degrees": get_feature_degrees(features, constraints)})
+    tasks = get_tasks(to_check, num_of_process, static_dead, static_false)
+    if num_of_process > 1:
+        log.info("Checking {} tasks with {} processes".format(len(tasks), num_of_process))
+        pool = multiprocessing.Pool(num_of_process, init_check_worker)
+        try:
+            results = pool.map(check_task, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        init_check_worker()
+        results = [check_task(i) for i in tasks]
 
-    for i in to_check_dead:
-        log.debug("Processing time instant {}, features to check {}".format(i,len(to_check_dead[i])))
-        solver.push()
-        solver.add(z3.Int(time_context).__eq__(z3.IntVal(i)))
-
-        # run first time to prune easy features and check satisfiability
-        result = solver.check()
-        if result == z3.unsat:
-            log.debug("All instances are dead for time {}".format(i))
-            for j in to_check_dead[i]:
-                if j in data["dead_features"]:
-                    data["dead_features"][j].append(i)
-                else:
-                    data["dead_features"][j] = [i]
-            continue
-        elif result == z3.sat:
-            to_remove_dead, to_remove_false = get_fail_checks_from_model(
-                to_check_dead[i], to_check_false[i], solver.model(), features_as_boolean)
-            to_check_dead[i].difference_update(to_remove_dead)
-            to_check_false[i].difference_update(to_remove_false)
-        else:
-            log.debug("Problems in detecting the satisfiability of the instance. Z3 returned {}".format(result))
+    data = {"dead_features": {}, "false_optionals": {}}
+    if pruning_trace:
+        data["pruning_trace"] = []
+    calls = 0
+    saved = 0
+    for result in results:
+        if result is None:
+            log.critical("Check of the features failed")
             sys.exit(1)
+        i, dead, false, task_calls, task_saved, trace = result
+        if pruning_trace:
+            data["pruning_trace"].append({"time": i, "seconds": sum([j["seconds"] for j in trace]), "attempts": trace})
+        if time_intervals:
+            add_interval(data, "dead_features", dead, i, ends[i])
+            add_interval(data, "false_optionals", false, i, ends[i])
+        else:
+            add_instants(data, "dead_features", dead, i)
+            add_instants(data, "false_optionals", false, i)
+        calls += task_calls
+        saved += task_saved
+    log.info("Solver checks: {}, checks saved by the models: {}".format(calls, saved))
+    write_output(data, out_stream)
 
-        log.debug("Checking for dead features")
-        counter = len(to_check_dead[i])
-        for j in to_check_dead[i]:
-            log.debug("Processing feature {}, remaining {}".format(j, counter))
-            counter -= 1
-            solver.push()
-            if features_as_boolean:
-                solver.add(z3.Bool(j))
-            else:
-                solver.add(z3.Int(j).__eq__(z3.IntVal(1)))
-            result = solver.check()
-            log.debug("Result {}".format(result))
-            if result == z3.unsat:
-                log.debug("{} is a dead feature".format(j))
-                if j in data["dead_features"]:
-                    data["dead_features"][j].append(i)
-                else:
-                    data["dead_features"][j] = [i]
-                to_check_false[i].discard(j)
-            elif result != z3.sat:
-                log.debug("Problems checking feature{} at time {}. Z3 returned {}".format(
-                    j, i, result))
-                sys.exit(1)
-            solver.pop()
 
-        log.debug("Checking for false optional features")
-        counter = len(to_check_false[i])
-        for j in to_check_false[i]:
-            log.debug("Processing feature {}, remaining {}".format(j, counter))
-            counter -= 1
-            solver.push()
-            if features_as_boolean:
-                solver.add(z3.Not(z3.Bool(j)))
-            else:
-                solver.add(z3.Int(j).__eq__(z3.IntVal(0)))
-            result = solver.check()
-            log.debug("Result {}".format(result))
-            if result == z3.unsat:
-                log.debug("{} is a false optional feature".format(j))
-                if j in data["false_optionals"]:
-                    data["false_optionals"][j].append(i)
-                else:
-                    data["false_optionals"][j] = [i]
-            elif result != z3.sat:
-                log.debug("Problems checking feature{} at time {}. Z3 returned {}".format(
-                    j, i, result))
-                sys.exit(1)
-            solver.pop()
-        solver.pop()
+def run_feature_analysis_with_optimization(
+        features,
+        features_as_boolean,
+        contexts,
+        attributes,
+        constraints,
+        optional_features,
+        non_incremental_solver,
+        out_stream,
+        time_context="",
+        num_of_process=1,
+        time_intervals=False,
+        pruning_trace=False):
+    """
+    Performs the feature analysis task.
+    Tries first to prune level features at the time with a given timeout, both for the dead and the false optional
+    features. The level and the timeout are adapted to the results and the times of the previous attempts.
+    When level reaches 1 than one of the possible features is checked using an or
+    If found another more restricting or constraint is added, until all the features are found.
+    If pruning_trace is True the output lists the attempts done for every time instant.
+    """
+    run_feature_analysis(check_instant_with_optimization, features, features_as_boolean, contexts, attributes,
+                         constraints, optional_features, non_incremental_solver, out_stream, time_context,
+                         num_of_process, time_intervals, pruning_trace)
 
-    log.info("Printing output")
-    json.dump(data, out_stream)
-    out_stream.write("\n")
+
+def run_feature_analysis_grid_search(
+        features,
+        features_as_boolean,
+        contexts,
+        attributes,
+        constraints,
+        optional_features,
+        non_incremental_solver,
+        out_stream,
+        time_context="",
+        num_of_process=1,
+        time_intervals=False):
+    """
+    Performs the feature analysis one feature at the time with assumptions. Time context is set to all its values
+    in sequence.
+    Does not check the model except the first time for pruning the remaining features.
+    This helps for big instances where generating the model make take some time.
+    """
+    run_feature_analysis(check_instant_grid_search, features, features_as_boolean, contexts, attributes,
+                         constraints, optional_features, non_incremental_solver, out_stream, time_context,
+                         num_of_process, time_intervals)
 
 
-def run_feature_analysis_forall(
+def run_feature_analysis_backbone(
         features,
         features_as_boolean,
         contexts,
@@ -334,52 +683,92 @@ def run_feature_analysis_forall(
         optional_features,
         non_incremental_solver,
         out_stream,
-        time_context=""):
+        time_context="",
+        num_of_process=1,
+        time_intervals=False):
     """
-    Performs the feature analysis task.
-    A quantifier formula is solved to detect the anomalies
+    Performs the feature analysis computing for every value of the time context the backbone of the optional
+    features, i.e., the features having the same value in all the configurations.
+    """
+    run_feature_analysis(check_instant_backbone, features, features_as_boolean, contexts, attributes,
+                         constraints, optional_features, non_incremental_solver, out_stream, time_context,
+                         num_of_process, time_intervals)
+
+
+def confirm_witnesses(solver, time_context, instant, candidates, value, features_as_boolean):
+    """Returns the features among the candidates that can not have the value (1 for the dead features, 0 for the
+    false optional ones) at the time instant, checked with quantifier free checks on the solver of the feature
+    model. The model of every satisfiable check removes the candidates it proves to be not a witness"""
+    found = []
+    to_check = set(candidates)
+    time_formula = z3.Int(time_context).__eq__(z3.IntVal(instant))
+    for j in sorted(candidates):
+        if j not in to_check:
+            continue
+        to_check.discard(j)
+        result = solver.check(time_formula, get_feature_literal(j, value, features_as_boolean))
+        if result == z3.unsat:
+            found.append(j)
+        elif result == z3.sat:
+            if value:
+                to_remove, _ = get_fail_checks_from_model(to_check, [], solver.model(), features_as_boolean)
+            else:
+                _, to_remove = get_fail_checks_from_model([], to_check, solver.model(), features_as_boolean)
+            to_check.difference_update(to_remove)
+    return found
+
+
+def get_active_features(optional_features, opt_features_ls, instant):
+    """Returns the optional features of the feature model that can be selected at the time instant.
+    The optional features not used by the constraints are not quantified by the forall formulas, hence they are
+    left to the forall formulas"""
+    return [i for i in opt_features_ls if i in CHECK["features"] and
+            any([k[0] <= instant <= k[1] for k in optional_features[i]])]
+
+
+def check_forall_shard(opt_features_ls):
+    """
+    Returns the dead and false optional features among the optional features of the shard, found solving the forall
+    formulas restricted to them with a new solver, together with the number of features and the time taken.
+    Returns None if the solver failed.
     """
+    start_time = time.time()
+    features = CHECK["features"]
+    features_as_boolean = CHECK["features_as_boolean"]
+    contexts = CHECK["contexts"]
+    attributes = CHECK["attributes"]
+    optional_features = CHECK["optional_features"]
+    time_context = CHECK["time_context"]
+    formulas = CHECK["formulas"]
 
     data = {"dead_features": {}, "false_optionals": {}}
     solver = z3.Solver()
     #solver.set("smt.relevancy", 0)
-    if non_incremental_solver:
+    if CHECK["non_incremental_solver"]:
         solver.set("combined_solver.solver2_timeout",1)
 
-    # if time variable is not defined, create a fictional one
-    time_context = get_time_context(time_context, optional_features)
-    # add it in context if not present
-    if time_context not in contexts:
-        contexts[time_context] = {}
-        contexts[time_context]['min'] = 0
-        contexts[time_context]['max'] = 0
-
-
     # these constraints will also be added in the forall formula and are redundant
     # hopefully they will help the SMT solver to solve the forall formula
     solver.add(contexts[time_context]["min"] <= z3.Int(time_context))
     solver.add(z3.Int(time_context) <= contexts[time_context]["max"])
+    # the time instants without configurations are already settled
+    for i in CHECK["void_instants"]:
+        solver.add(z3.Not(z3.Int(time_context).__eq__(z3.IntVal(i))))
 
-    log.info("Building the FM formula")
-    # will repeat the constraints about the bounds on the environment but that is OK
-    formulas = get_basic_formula_list(features, attributes, contexts, constraints, features_as_boolean)
-
-    if not non_incremental_solver:
+    if not CHECK["non_incremental_solver"]:
         log.debug("Preliminary check")
         solver.check()
 
-    log.info("Computing dead or false optional features considering {} optional features".format(
-        len(optional_features)))
+    # quantifier free solver of the feature model confirming the other witnesses at the time of a witness
+    qf_solver = z3.Solver()
+    qf_solver.add(formulas)
+    # quantified formulas solved and witnesses found without solving them
+    solved = 0
+    confirmed = 0
 
-    opt_features_ls = optional_features.keys()
     # fresh variables representing the selected features namefresh_var
     fresh_var = "_" + uuid.uuid4().hex
-    if not opt_features_ls:
-        log.warning("Nothing to check")
-        json.dump(data, out_stream)
-        out_stream.write("\n")
-        return
-    elif len(opt_features_ls) == 1: # zip problem raised by smt if list of one element is used for z3.PbEq
+    if len(opt_features_ls) == 1: # zip problem raised by smt if list of one element is used for z3.PbEq
         solver.add(z3.Bool(opt_features_ls[0] + fresh_var))
     else:
         # only one selected
@@ -413,6 +802,7 @@ def run_feature_analysis_forall(
 
     while True:
         log.info("Computing")
+        solved += 1
         result = solver.check()
 
         if result == z3.sat:
@@ -424,22 +814,28 @@ def run_feature_analysis_forall(
             assert found_feature
             found_context = model[z3.Int(time_context)].as_long()
 
-            # remove check for false optional
-            log.debug("Dead feature for time {}: {}".format(found_context, found_feature))
-            if found_feature in data["dead_features"]:
-                data["dead_features"][found_feature].append(found_context)
-            else:
-                data["dead_features"][found_feature] = [found_context]
-            # add constraint for next iteration
-            solver.add(z3.Not(z3.And(z3.Bool(found_feature + fresh_var),
-                                     z3.Int(time_context).__eq__(z3.IntVal(found_context)))))
+            # the other dead features at the same time are found without solving again the forall formula
+            found_features = [found_feature] + confirm_witnesses(
+                qf_solver, time_context, found_context,
+                [i for i in get_active_features(optional_features, opt_features_ls, found_context)
+                 if i != found_feature and found_context not in data["dead_features"].get(i, [])],
+                1, features_as_boolean)
+            log.debug("Dead features for time {}: {}".format(found_context, found_features))
+            for found_feature in found_features:
+                if found_feature in data["dead_features"]:
+                    data["dead_features"][found_feature].append(found_context)
+                else:
+                    data["dead_features"][found_feature] = [found_context]
+                # add constraint for next iteration
+                solver.add(z3.Not(z3.And(z3.Bool(found_feature + fresh_var),
+                                         z3.Int(time_context).__eq__(z3.IntVal(found_context)))))
+            confirmed += len(found_features) - 1
         elif result == z3.unsat:
             log.debug("Formula found unsat. No more dead features.")
             break
         else:
             log.critical("SMT solver can not solve the forall formula (result unknown).")
-            log.critical("Exiting")
-            sys.exit(1)
+            return None
 
     solver.pop()
 
@@ -461,6 +857,7 @@ def run_feature_analysis_forall(
 
     while True:
         log.info("Computing")
+        solved += 1
         result = solver.check()
 
         if result == z3.sat:
@@ -471,25 +868,173 @@ def run_feature_analysis_forall(
                     break
             assert found_feature
             found_context = model[z3.Int(time_context)].as_long()
-            log.debug("False positive feature for time {}: {}".format(found_context, found_feature))
-            if found_feature in data["false_optionals"]:
-                data["false_optionals"][found_feature].append(found_context)
-            else:
-                data["false_optionals"][found_feature] = [found_context]
-            # add constraint for next iteration
-            solver.add(z3.Not(z3.And(z3.Bool(found_feature + fresh_var),
-                                     z3.Int(time_context).__eq__(z3.IntVal(found_context)))))
+            found_features = [found_feature] + confirm_witnesses(
+                qf_solver, time_context, found_context,
+                [i for i in get_active_features(optional_features, opt_features_ls, found_context)
+                 if i != found_feature and found_context not in data["dead_features"].get(i, []) and
+                 found_context not in data["false_optionals"].get(i, [])],
+                0, features_as_boolean)
+            log.debug("False positive features for time {}: {}".format(found_context, found_features))
+            for found_feature in found_features:
+                if found_feature in data["false_optionals"]:
+                    data["false_optionals"][found_feature].append(found_context)
+                else:
+                    data["false_optionals"][found_feature] = [found_context]
+                # add constraint for next iteration
+                solver.add(z3.Not(z3.And(z3.Bool(found_feature + fresh_var),
+                                         z3.Int(time_context).__eq__(z3.IntVal(found_context)))))
+            confirmed += len(found_features) - 1
         elif result == z3.unsat:
             log.debug("Formula found unsat. No more false positives.")
             break
         else:
             log.critical("SMT solver can not solve the forall formula (result unknown).")
-            log.critical("Exiting")
+            return None
+
+    data["features"] = len(opt_features_ls)
+    data["time"] = time.time() - start_time
+    data["solved"] = solved
+    data["confirmed"] = confirmed
+    return data
+
+
+def add_settled_features(data, static_dead, static_false, formulas, time_context, contexts, optional_features):
+    """Adds to the output the time instants where the features settled statically are optional. The features
+    selected in every configuration are false optional in the time instants with a configuration, dead in the
+    others"""
+    solver = z3.Solver()
+    solver.add(formulas)
+    satisfiable = {}
+    for i in sorted(static_dead | static_false):
+        for j in range(contexts[time_context]["min"], contexts[time_context]["max"] + 1):
+            if not any([k[0] <= j <= k[1] for k in optional_features[i]]):
+                continue
+            if i in static_false and j not in satisfiable:
+                result = solver.check(z3.Int(time_context).__eq__(z3.IntVal(j)))
+                if result == z3.unknown:
+                    log.critical("SMT solver can not check the time instant {} (result unknown).".format(j))
+                    sys.exit(1)
+                satisfiable[j] = result == z3.sat
+            kind = "false_optionals" if i in static_false and satisfiable[j] else "dead_features"
+            data[kind].setdefault(i, []).append(j)
+
+
+def get_void_instants(projection, contexts, time_context):
+    """Returns the time instants where the feature model has no configuration, checked with the projection of the
+    feature model on the contexts"""
+    solver = z3.Solver()
+    for i in contexts.keys():
+        solver.add(contexts[i]["min"] <= z3.Int(i), z3.Int(i) <= contexts[i]["max"])
+    solver.add(projection)
+    void_instants = []
+    for i in range(contexts[time_context]["min"], contexts[time_context]["max"] + 1):
+        result = solver.check(z3.Int(time_context).__eq__(z3.IntVal(i)))
+        if result == z3.unknown:
+            log.critical("SMT solver can not check the time instant {} (result unknown).".format(i))
             sys.exit(1)
+        if result == z3.unsat:
+            void_instants.append(i)
+    return void_instants
+
+
+def run_feature_analysis_forall(
+        features,
+        features_as_boolean,
+        contexts,
+        attributes,
+        constraints,
+        optional_features,
+        non_incremental_solver,
+        out_stream,
+        time_context="",
+        num_of_process=1,
+        shard_size=0,
+        projection=None):
+    """
+    Performs the feature analysis task.
+    A quantifier formula is solved to detect the anomalies.
+    The optional features are split into shards of shard_size features (by default one shard for every process),
+    every shard is checked with its own formulas, by a pool of processes if num_of_process is greater than 1.
+    If the projection of the feature model on the contexts is given, the time instants without configurations
+    are found with quantifier free checks on the projection: the optional features are dead in these time
+    instants, which are excluded from the forall formulas.
+    """
 
+    data = {"dead_features": {}, "false_optionals": {}}
 
+    # if time variable is not defined, create a fictional one
+    time_context = get_time_context(time_context, optional_features)
+    # add it in context if not present
+    if time_context not in contexts:
+        contexts[time_context] = {}
+        contexts[time_context]['min'] = 0
+        contexts[time_context]['max'] = 0
 
-    log.info("Printing output")
-    json.dump(data, out_stream)
-    out_stream.write("\n")
+    log.info("Building the FM formula")
+    # will repeat the constraints about the bounds on the environment but that is OK
+    formulas = get_basic_formula_list(features, attributes, contexts, constraints, features_as_boolean)
+
+    log.info("Computing dead or false optional features considering {} optional features".format(
+        len(optional_features)))
+
+    # the features settled by the implication graph of the constraints are not checked by the forall formulas
+    static_dead, static_false = implication_module.get_settled_features(
+        features, constraints, set(optional_features.keys()))
+    log.info("Features settled statically: {} dead, {} selected in every configuration".format(
+        len(static_dead), len(static_false)))
+    add_settled_features(data, static_dead, static_false, formulas, time_context, contexts, optional_features)
+
+    opt_features_ls = sorted(set(optional_features.keys()).difference(static_dead, static_false))
+    if not opt_features_ls:
+        log.warning("Nothing to check")
+        write_output(data, out_stream)
+        return
+
+    void_instants = []
+    if projection is not None:
+        void_instants = get_void_instants(projection, contexts, time_context)
+        log.info("Time instants without configurations found with the projection: {}".format(void_instants))
+
+    if shard_size <= 0:
+        shard_size = (len(opt_features_ls) + num_of_process - 1) / num_of_process
+    shards = [opt_features_ls[i:i + shard_size] for i in range(0, len(opt_features_ls), shard_size)]
+    CHECK.update({
+        "features": features,
+        "features_as_boolean": features_as_boolean,
+        "contexts": contexts,
+        "attributes": attributes,
+        "optional_features": optional_features,
+        "non_incremental_solver": non_incremental_solver,
+        "time_context": time_context,
+        "void_instants": void_instants,
+        "formulas": formulas})
+    if num_of_process > 1 and len(shards) > 1:
+        log.info("Checking {} shards with {} processes".format(len(shards), num_of_process))
+        pool = multiprocessing.Pool(num_of_process)
+        try:
+            results = pool.map(check_forall_shard, shards)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [check_forall_shard(i) for i in shards]
 
+    for index, result in enumerate(results):
+        if result is None:
+            log.critical("Exiting")
+            sys.exit(1)
+        log.info("Shard {} of {} features checked in {} seconds: {} dead and {} false optional features, {} "
+                 "forall formulas solved, {} witnesses confirmed without solving them".format(
+                     index, result["features"], result["time"], len(result["dead_features"]),
+                     len(result["false_optionals"]), result["solved"], result["confirmed"]))
+        # the shards have disjoint features
+        data["dead_features"].update(result["dead_features"])
+        data["false_optionals"].update(result["false_optionals"])
+
+    # the optional features are dead in the time instants without configurations
+    for i in opt_features_ls:
+        for j in void_instants:
+            if any([k[0] <= j <= k[1] for k in optional_features[i]]):
+                data["dead_features"].setdefault(i, []).append(j)
+                data["dead_features"][i].sort()
+    write_output(data, out_stream)
@@ -11,14 +11,18 @@ import os
 import logging as log
 import json
 import re
-# use multiprocessing because antlr is not thread safe
-import multiprocessing
 import click
 import z3
 import datetime
 import uuid
+import inspect
+import copy
+import StringIO
 
 import SpecificationGrammar.SpecTranslator as SpecTranslator
+import model_module
+from reconfigure_module import get_true_boolean_features_from_model
+import reconfigure_module
 
 DEVNULL = open(os.devnull, 'wb')
 
@@ -34,116 +38,12 @@ def read_json(json_file):
     return data
 
 
-# function to encode SMT expression into SMTLIB
-def toSMT2(f, status="unknown", name="benchmark", logic=""):
-  v = (z3.Ast * 0)()
-  return z3.Z3_benchmark_to_smtlib_string(f.ctx_ref(), name, logic, status, "", 0, v, f.as_ast()).replace(
-      "\n"," ").replace("(check-sat)","").replace("; benchmark (set-info :status unknown)","").strip()
-
-def get_true_boolean_features_from_model(model):
-    ls = []
-    for decl in model.decls():
-        if z3.is_true(model[decl]):
-            if not "!" in decl.__repr__():
-                ls.append(decl.__repr__())
-    return ls
-
-def run_reconfigure(
-        features,
-        initial_features,
-        contexts,
-        attributes,
-        constraints,
-        preferences,
-        features_as_boolean,
-        timeout,
-        no_default_preferences,
-        out_stream):
-    """Perform the reconfiguration task
-    """
-    solver = z3.Optimize()
-
-    log.info("Add variables")
-    if not features_as_boolean:
-        for i in features:
-            solver.add(0 <= z3.Int(i), z3.Int(i) <= 1)
-    for i in attributes.keys():
-        solver.add(attributes[i]["min"] <= z3.Int(i), z3.Int(i) <= attributes[i]["max"])
-    for i in contexts.keys():
-        solver.add(contexts[i]["min"] <= z3.Int(i), z3.Int(i) <= contexts[i]["max"])
-
-    log.info("Enforce context to be equal to intial values")
-    for i in contexts.keys():
-        solver.add(contexts[i]["initial"] == z3.Int(i))
-
-    log.info("Add constraints")
-    for i in constraints:
-        solver.add(i)
-
-    log.info("Add preferences")
-    for i in preferences:
-        solver.maximize(i)
-
-    if no_default_preferences:
-        log.info("Default preferences will be ignored.")
-    else:
-        log.info("Add preference: minimize the number of initial features removed")
-        if initial_features:
-            if features_as_boolean:
-                solver.maximize(z3.Sum([z3.If(z3.Bool(i),1,0) for i in initial_features]))
-            else:
-                solver.maximize(z3.Sum([z3.Int(i) for i in initial_features]))
-
-        log.info("Add preference: minimize the number of attributes changed")
-        initial_attributes = [k for k in attributes.keys() if "initial" in attributes[k]]
-        if initial_attributes:
-            solver.maximize(
-                z3.Sum([z3.If(z3.Int(i) == z3.IntVal(attributes[i]["initial"]), 1, 0) for i in initial_attributes]))
-
-        log.info("Add preference: minimize the number of non initial features added")
-        if features.difference(initial_features):
-            if features_as_boolean:
-                solver.minimize(z3.Sum([z3.If(z3.Bool(i),1,0) for i in features.difference(initial_features)]))
-            else:
-                solver.minimize(z3.Sum([z3.Int(i) for i in features.difference(initial_features)]))
-
-        log.info("Add preference: minimize the values of the attributes")
-        for i in attributes.keys():
-            solver.minimize(z3.Int(i))
-
-    #log.debug(unicode(solver))
-
-    if timeout > 0:
-        solver.set("timeout", timeout)
-
-    log.info("Computing reconfiguration")
-    result = solver.check()
-
-    log.info("Printing output")
-    if result == z3.sat:
-        model = solver.model()
-        out = {"result": "sat", "features": [], "attributes": []}
-        if features_as_boolean:
-            out["features"].extend(get_true_boolean_features_from_model(model))
-        else:
-            for i in features:
-                if model[z3.Int(i)] == z3.IntVal(1):
-                    out["features"].append(i)
-        for i in attributes.keys():
-            if attributes[i]["feature"] in out["features"]:
-                out["attributes"].append({"id": i, "value": unicode(model[z3.Int(i)])})
-        json.dump(out, out_stream)
-        out_stream.write("\n")
-    else:
-        out_stream.write('{"result": "unsat"}\n')
-
-
 def run_explain(
         features,
         contexts,
         attributes,
         constraints,
-        data,
+        constraints_source,
         features_as_boolean,
         constraints_minimization,
         out_stream):
@@ -199,7 +99,7 @@ def run_explain(
         out = {"result": "unsat", "constraints": []}
         for i in range(len(constraints)):
             if z3.Bool('aux' + str(i)) in core:
-                out["constraints"].append(data["constraints"][i])
+                out["constraints"].append(constraints_source[i])
         json.dump(out, out_stream)
         out_stream.write("\n")
 
@@ -211,15 +111,19 @@ def run_check_interface(features,
                         contexts_constraints,
                         interface,
                         features_as_boolean,
-                        out_stream):
+                        out_stream,
+                        num_of_process=1,
+                        parser="antlr",
+                        simplify="node",
+                        projection=None):
     """Check if the interface given is a proper interface
+    If the projection of the feature model on the contexts is given, a context allowed by the interface where the
+    feature model has no configuration is searched with a quantifier free check before the forall formula
     """
     # todo possibility of using interface where features are given as boolean and not int
     # handle FM contexts_constraints
-    i_features = set()
     i_contexts = {}
     i_attributes = {}
-    i_constraints = []
     i_contexts_constraints = []
 
     log.info("Processing interface attributes")
@@ -252,28 +156,13 @@ def run_check_interface(features,
     log.debug(unicode(contexts))
 
     log.info("Processing Constraints")
-    for i in interface["constraints"]:
-        try:
-            d = SpecTranslator.translate_constraint(i, interface, features_as_boolean)
-            log.debug("Find constraint " + unicode(d))
-            i_constraints.append(d["formula"])
-            i_features.update(d["features"])
-        except Exception as e:
-            log.critical("Parsing failed while processing " + i + ": " + str(e))
-            log.critical("Exiting")
-            sys.exit(1)
+    i_constraints, i_features = model_module.translate_formulas(
+        interface["constraints"], features_as_boolean, num_of_process, parser, simplify)
 
     log.info("Processing Context Constraints")
     if "context_constraints" in interface:
-        for i in interface["context_constraints"]:
-            try:
-                d = SpecTranslator.translate_constraint(i, interface, features_as_boolean)
-                log.debug("Find context constraint " + unicode(d))
-                i_contexts_constraints.append(d["formula"])
-            except Exception as e:
-                log.critical("Parsing failed while processing " + i + ": " + str(e))
-                log.critical("Exiting")
-                sys.exit(1)
+        i_contexts_constraints, _ = model_module.translate_formulas(
+            interface["context_constraints"], features_as_boolean, num_of_process, parser, simplify)
 
     log.info("Checking Context Constraints Extensibility")
     solver = z3.Solver()
@@ -317,6 +206,22 @@ def run_check_interface(features,
             solver.add(contexts[i]["min"] <= z3.Int(i))
             solver.add(z3.Int(i) <= contexts[i]["max"])
 
+    # the projection has the bounds of the FM attributes, it can be used if the interface does not extend them
+    if projection is not None and \
+            all([attributes[i]["min"] == i_attributes[i]["min"] and attributes[i]["max"] == i_attributes[i]["max"]
+                 for i in i_attributes.keys()]):
+        log.info("Searching a context without configurations with the projection on the contexts")
+        qf_solver = z3.Solver()
+        qf_solver.add(solver.assertions())
+        # the projection is exact only within the bounds of the FM contexts
+        for i in contexts.keys():
+            qf_solver.add(contexts[i]["min"] <= z3.Int(i), z3.Int(i) <= contexts[i]["max"])
+        qf_solver.add(z3.Not(projection))
+        if qf_solver.check() == z3.sat:
+            write_not_valid_interface(qf_solver.model(), contexts, i_features, i_attributes, features_as_boolean,
+                                      out_stream)
+            return None
+
     log.info("Building the FM formula")
     formulas = []
     if not features_as_boolean:
@@ -353,42 +258,237 @@ def run_check_interface(features,
     log.info("Printing output")
 
     if result == z3.sat:
-        model = solver.model()
-        out = {"result": "not_valid", "contexts": [], "attributes": [], "features" : []}
-        for i in contexts.keys():
-            out["contexts"].append({"id": i, "value": unicode(model[z3.Int(i)])})
-        if features_as_boolean:
-            for i in i_features:
-                out["features"].append({"id": i, "value": unicode(model[z3.Bool(i)])})
-        else:
-            for i in i_features:
-                out["features"].append({"id": i, "value": unicode(model[z3.Int(i)])})
-        for i in i_attributes.keys():
-            out["attributes"].append({"id": i, "value": unicode(model[z3.Int(i)])})
-        json.dump(out, out_stream)
-        out_stream.write("\n")
+        write_not_valid_interface(solver.model(), contexts, i_features, i_attributes, features_as_boolean,
+                                  out_stream)
     else:
         out_stream.write('{"result":"valid"}\n')
 
 
-def translate_constraints(triple):
-    c,data,features_as_boolean = triple
-    try:
-        d = SpecTranslator.translate_constraint(c, data, features_as_boolean)
-    except Exception as e:
-        log.critical("Parsing failed while processing " + c + ": " + str(e))
-        log.critical("Exiting")
+def write_not_valid_interface(model, contexts, i_features, i_attributes, features_as_boolean, out_stream):
+    """Writes the contexts and the values of the interface features and attributes where the interface is not
+    valid"""
+    out = {"result": "not_valid", "contexts": [], "attributes": [], "features" : []}
+    for i in contexts.keys():
+        out["contexts"].append({"id": i, "value": unicode(model[z3.Int(i)])})
+    if features_as_boolean:
+        for i in i_features:
+            out["features"].append({"id": i, "value": unicode(model[z3.Bool(i)])})
+    else:
+        for i in i_features:
+            out["features"].append({"id": i, "value": unicode(model[z3.Int(i)])})
+    for i in i_attributes.keys():
+        out["attributes"].append({"id": i, "value": unicode(model[z3.Int(i)])})
+    json.dump(out, out_stream)
+    out_stream.write("\n")
+
+
+def run_hyvarrec(data,
+                 modality,
+                 out_stream,
+                 interface=None,
+                 num_of_process=1,
+                 features_as_boolean=False,
+                 validate_modality="forall",
+                 check_features_modality="forall",
+                 timeout=0,
+                 constraints_minimization=False,
+                 non_incremental_solver=False,
+                 no_default_preferences=False,
+                 parser="antlr",
+                 simplify="node",
+                 session=False,
+                 anytime=False,
+                 stream_solutions=False,
+                 grid_order="lexicographic",
+                 checkpoint=None,
+                 limit=0,
+                 time_intervals=False,
+                 forall_shard_size=0,
+                 pruning_trace=False,
+                 context_projection=False):
+    """Process the json input data and run the given modality writing the result on the output stream
+    """
+    model = model_module.get_compiled_model(data, features_as_boolean, num_of_process, parser, simplify)
+    features = model["features"]
+    constraints = model["constraints"]
+    contexts_constraints = model["contexts_constraints"]
+    preferences = []
+    if modality == "reconfigure":
+        preferences = model_module.get_preferences(model)
+    initial_features, contexts, attributes = model_module.configure_model(model, data)
+    # the modalities may modify the optional features
+    optional_features = copy.deepcopy(model["optional_features"])
+
+    start_running_time = datetime.datetime.now()
+    import validate_module
+    # the projection on the contexts is computed once for the compiled model, then reused
+    projection = None
+    if context_projection and (modality == "check-interface" or
+                               (modality == "check-features" and check_features_modality == "forall")):
+        projection = validate_module.get_context_projection(model)
+    if modality == "validate":
+        if validate_modality == "grid":
+            validate_module.run_validate_grid_search(features, initial_features, contexts, attributes, constraints,
+                                     preferences, contexts_constraints, features_as_boolean, non_incremental_solver,
+                                     out_stream, num_of_process, grid_order, checkpoint, model.get("key", ""), timeout)
+        elif validate_modality == "box":
+            validate_module.run_validate_box(features, contexts, attributes, constraints, contexts_constraints,
+                                             features_as_boolean, out_stream, num_of_process, timeout)
+        elif validate_modality == "enumerate":
+            validate_module.run_validate_enumerate(features, contexts, attributes, constraints, contexts_constraints,
+                                                   features_as_boolean, out_stream, limit, timeout)
+        elif validate_modality == "projection":
+            validate_module.run_validate_projection(validate_module.get_context_projection(model), contexts,
+                                                    contexts_constraints, out_stream)
+        elif validate_modality == "forall":
+            validate_module.run_validate(features, initial_features, contexts, attributes, constraints,
+                 preferences, contexts_constraints, features_as_boolean, out_stream)
+
+    elif modality == "explain":
+        run_explain(features, contexts, attributes, constraints,
+                model["constraints_source"], features_as_boolean, constraints_minimization, out_stream)
+    elif modality == "check-interface":
+        run_check_interface(features, contexts, attributes, constraints, contexts_constraints,
+                        interface, features_as_boolean, out_stream, num_of_process, parser, simplify, projection)
+    elif modality == "check-features":
+        import check_features_module
+        if check_features_modality == "grid":
+            check_features_module.run_feature_analysis_grid_search(
+                features,
+                features_as_boolean,
+                contexts,
+                attributes,
+                constraints,
+                optional_features,
+                non_incremental_solver,
+                out_stream,
+                model["time_context"],
+                num_of_process,
+                time_intervals)
+        elif check_features_modality == "forall":
+            check_features_module.run_feature_analysis_forall(
+                features,
+                features_as_boolean,
+                contexts,
+                attributes,
+                constraints,
+                optional_features,
+                non_incremental_solver,
+                out_stream,
+                model["time_context"],
+                num_of_process,
+                forall_shard_size,
+                projection)
+        elif check_features_modality == "backbone":
+            check_features_module.run_feature_analysis_backbone(
+                features,
+                features_as_boolean,
+                contexts,
+                attributes,
+                constraints,
+                optional_features,
+                non_incremental_solver,
+                out_stream,
+                model["time_context"],
+                num_of_process,
+                time_intervals)
+        elif check_features_modality == "pruning":
+            check_features_module.run_feature_analysis_with_optimization(
+                features,
+                features_as_boolean,
+                contexts,
+                attributes,
+                constraints,
+                optional_features,
+                non_incremental_solver,
+                out_stream,
+                model["time_context"],
+                num_of_process,
+                time_intervals,
+                pruning_trace)
+    elif modality == "reconfigure":
+        if anytime:
+            reconfigure_module.run_reconfigure_anytime(features, initial_features, contexts, attributes, constraints,
+                                                       preferences, features_as_boolean, timeout,
+                                                       no_default_preferences, out_stream, stream_solutions)
+        elif session:
+            reconfigure_module.get_session(model, preferences, timeout, no_default_preferences).reconfigure(
+                initial_features, contexts, attributes, out_stream)
+        else:
+            reconfigure_module.run_reconfigure(features, initial_features, contexts, attributes, constraints,
+                                               preferences, features_as_boolean, timeout, no_default_preferences,
+                                               out_stream)
+    else:
+        log.critical("No modality matched. Exiting.")
         sys.exit(1)
-    return toSMT2(d["formula"]),d["features"]
+
+    delta = datetime.datetime.now() - start_running_time
+    log.info("Seconds taken to run the backend {}".format(delta.total_seconds()))
 
 
+def parse_hyvar_options(options):
+    """Convert the command line options listed in the hyvar_options field of a service request
+    into the keyword arguments of run_hyvarrec. Options not affecting run_hyvarrec are ignored.
+    """
+    run_arguments = inspect.getargspec(run_hyvarrec).args
+    params = {}
+    for param in main.params:
+        if isinstance(param, click.Option):
+            for opt in param.opts + param.secondary_opts:
+                params[opt] = param
+    kwargs = {}
+    options = iter(options)
+    for opt in options:
+        if opt not in params:
+            raise click.BadParameter("Option " + opt + " not recognised")
+        param = params[opt]
+        if param.is_flag or param.count:
+            value = True
+        else:
+            value = param.type(next(options), param, None)
+        if param.name in run_arguments:
+            kwargs[param.name] = value
+        else:
+            log.warning("Option " + opt + " ignored by the service")
+    return kwargs
+
+
+def process_request(modality, request):
+    """Process a request received by the service returning the output produced by HyVarRec
+    (None if the request could not be processed) and the statistics of the model cache of the worker.
+    Raises service_module.RequestError for the combinations of options rejected also by the command line.
+    """
+    import service_module
+    out_stream = StringIO.StringIO()
+    output = None
+    try:
+        kwargs = parse_hyvar_options(request.get("hyvar_options", []))
+        # workers of the service are daemonic and can not spawn further processes
+        kwargs["num_of_process"] = 1
+        if modality == "reconfigure-session":
+            modality = "reconfigure"
+            kwargs["session"] = True
+        if modality == "check-interface":
+            if kwargs.get("features_as_boolean", False):
+                raise service_module.RequestError(
+                    "features check-interface and features-as-boolean are incompatible, only one can be selected")
+            run_hyvarrec(request["spl"], modality, out_stream, request["interface"], **kwargs)
+        else:
+            run_hyvarrec(request, modality, out_stream, **kwargs)
+        output = out_stream.getvalue()
+    except service_module.RequestError:
+        raise
+    except (SystemExit, Exception) as e:
+        log.critical("Request failed: " + unicode(e))
+    return output, model_module.MODEL_CACHE.get_stats()
 
 
 @click.command()
 @click.argument('input_file',
+    required=False,
     type=click.Path(exists=True, file_okay=True, dir_okay=False, writable=False, readable=True, resolve_path=True))
 @click.option('--num-of-process', '-p', type=click.INT, default=1,
-              help='Number of process to use for translating the dependencies.')
+              help='Number of process to use for translating the dependencies, for the grid validation, for the grid and pruning checking of the features or, in service mode, for serving the requests.')
 @click.option('--output-file', '-o',
               type=click.Path(exists=False, file_okay=True, dir_okay=False, writable=True, readable=True, resolve_path=True),
               help='Output file - Otherwise the output is printed on stdout.')
@@ -401,8 +501,18 @@ def translate_constraints(triple):
 @click.option('--validate-modality',
               help="Modality for conducting the validation",
               default="forall",
-              type=click.Choice(["grid", "forall"]),
+              type=click.Choice(["grid", "forall", "box", "enumerate", "projection"]),
+              show_default=True)
+@click.option('--grid-order',
+              help="Order of the context combinations tried by the grid validation.",
+              default="lexicographic",
+              type=click.Choice(["lexicographic", "shuffled"]),
               show_default=True)
+@click.option('--checkpoint',
+              type=click.Path(file_okay=True, dir_okay=False, writable=True, readable=True, resolve_path=True),
+              help="File where the grid validation saves the combinations checked. An interrupted validation restarts from the checkpoint.")
+@click.option('--limit', type=click.INT, default=0,
+              help="Maximal number of boxes of void contexts returned by the enumerate validation (0 = no limit).")
 @click.option('--explain', is_flag=True,
               help="Tries to explain why a FM is void.")
 @click.option('--check-interface',
@@ -415,16 +525,57 @@ def translate_constraints(triple):
 @click.option('--check-features-modality',
               help="Modality for conducting the check feature search.",
               default="forall",
-              type=click.Choice(["grid", "forall", "pruning"]),
+              type=click.Choice(["grid", "forall", "pruning", "backbone"]),
               show_default=True)
+@click.option('--time-intervals', is_flag=True,
+              help="Check the features once for every interval of time instants satisfying the same constraints, listing the ranges of the time instants in the output (grid, pruning, and backbone check of the features).")
+@click.option('--pruning-trace', is_flag=True,
+              help="List in the output the speculative pruning attempts done for every time instant with their level, result, and time (pruning check of the features).")
+@click.option('--context-projection', is_flag=True,
+              help="Use the projection of the feature model on the contexts, computed once for the compiled model, in the interface check and in the forall check of the features.")
+@click.option('--forall-shard-size', type=click.INT, default=0,
+              help="Number of optional features checked by every formula of the forall check of the features (0 = the optional features are split evenly among --num-of-process processes).")
 @click.option('--timeout', type=click.INT, default=0,
-              help="Timeout in milliseconds for the solver (0 = no-timeout). Valid only when used in reconfiguration mode.")
+              help="Timeout in milliseconds for the solver (0 = no-timeout). Valid only when used in reconfiguration mode and for the grid, box, and enumerate validation.")
+@click.option('--anytime', is_flag=True,
+              help="Optimize the preferences one at a time returning the best configuration found when the timeout expires. Option significant only in reconfiguration mode.")
+@click.option('--stream-solutions', is_flag=True,
+              help="Print every configuration improving the previous one as soon as it is found. Option significant only in anytime mode.")
 @click.option('--constraints-minimization', is_flag=True,
               help="Try to produce a minimal explanation. Option valid only in explanation mode.")
 @click.option('--no-default-preferences', is_flag=True,
               help="Do not consider default preferences to minimize the difference w.r.t. the initial configuration. Option significant only in reconfiguration mode.")
 @click.option('--non-incremental-solver', is_flag=True,
               help="Set the timeout for the incremental solver of Z3 to 1.")
+@click.option('--parser',
+              help="Parser used to translate the constraints. The fast parser is a hand written parser for the same grammar.",
+              default="antlr",
+              type=click.Choice(SpecTranslator.PARSERS),
+              show_default=True)
+@click.option('--simplify',
+              help="When formulas are simplified during the translation: at every operator (node), once per constraint (constraint), or only by the solver (none).",
+              default="node",
+              type=click.Choice(SpecTranslator.SIMPLIFY_MODALITIES),
+              show_default=True)
+@click.option('--serve', is_flag=True,
+              help="Start HyVarRec as a HTTP service answering the requests with a pool of --num-of-process workers.")
+@click.option('--port', type=click.INT, default=9001,
+              help="Port used by the HTTP service.",
+              show_default=True)
+@click.option('--session', is_flag=True,
+              help="Reuse the solver of the feature model for the following reconfigurations of the same feature model. Option significant only in service and batch mode.")
+@click.option('--batch',
+              type=click.Path(exists=True, file_okay=True, dir_okay=False, writable=False, readable=True, resolve_path=True),
+              help="File with one json configuration per line to reconfigure with the feature model of the input file. The configurations are processed in parallel by --num-of-process workers.")
+@click.option('--portfolio', type=click.INT, default=1,
+              help="Number of differently configured solvers run in parallel on the same task. The first definitive answer is returned. Option significant only in reconfiguration, validation, and explanation mode.",
+              show_default=True)
+@click.option('--cache-size', type=click.INT, default=model_module.DEFAULT_CACHE_SIZE,
+              help="Maximal number of compiled feature models kept in cache by every process.",
+              show_default=True)
+@click.option('--cache-memory', type=click.INT, default=model_module.DEFAULT_CACHE_MEMORY,
+              help="Maximal size in MB of the feature models kept in cache by every process (estimated from their json definition).",
+              show_default=True)
 def main(input_file,
          num_of_process,
          output_file,
@@ -432,15 +583,33 @@ def main(input_file,
          verbose,
          validate,
          validate_modality,
+         grid_order,
+         checkpoint,
+         limit,
          explain,
          check_interface,
          features_as_boolean,
          check_features,
          check_features_modality,
+         time_intervals,
+         pruning_trace,
+         context_projection,
+         forall_shard_size,
          timeout,
+         anytime,
+         stream_solutions,
          constraints_minimization,
          non_incremental_solver,
-         no_default_preferences):
+         no_default_preferences,
+         parser,
+         simplify,
+         serve,
+         port,
+         session,
+         batch,
+         portfolio,
+         cache_size,
+         cache_memory):
     """
     INPUT_FILE Json input file
     """
@@ -458,6 +627,18 @@ def main(input_file,
         log.critical("Features check-interface and features-as-boolean are incompatible, only one can be selected.")
         sys.exit(-1)
 
+    if not serve and not input_file:
+        log.critical("An input file is required when HyVarRec is not used as a service.")
+        sys.exit(1)
+
+    if batch and sum([validate,explain,check_features,(len(check_interface) > 0),serve]) > 0:
+        log.critical("The batch mode can be used only for the reconfiguration.")
+        sys.exit(1)
+
+    if portfolio > 1 and (batch or serve or check_features or check_interface):
+        log.critical("The portfolio can be used only for the reconfiguration, the validation, and the explanation.")
+        sys.exit(1)
+
     if validate:
         modality = "validate"
     if explain:
@@ -486,184 +667,84 @@ def main(input_file,
         global KEEP
         KEEP = True
 
+    model_module.MODEL_CACHE = model_module.ModelCache(cache_size, cache_memory)
+
+    if serve:
+        import service_module
+        service_module.serve(port, num_of_process, process_request)
+        return
+
     out_stream = sys.stdout
     if output_file:
         out_stream = open(output_file, "w")
 
-    features = set()
-    initial_features = set()
-    contexts = {}
-    attributes = {}
-    constraints = []
-    preferences = []
-    contexts_constraints = []
     log.info("Reading input file")
     data = read_json(input_file)
-
-    # if no optional feature are given the default is that there are none specified
-    if not "optional_features" in data:
-        data["optional_features"] = {}
-
-    log.info("Processing attributes")
-    for i in data["attributes"]:
-        id = re.match("attribute\[(.*)\]", i["id"]).group(1)
-        attributes[id] = {}
-        attributes[id]["min"] = i["min"]
-        attributes[id]["max"] = i["max"]
-        attributes[id]["feature"] = re.match("feature\[(.*)\]", i["featureId"]).group(1)
-    if data["attributes"]:
-        for i in data["configuration"]["attribute_values"]:
-            id = re.match("attribute\[(.*)\]", i["id"]).group(1)
-            attributes[id]["initial"] = i["value"]
-        log.debug(unicode(attributes))
-
-    log.info("Processing contexts")
-    for i in data["contexts"]:
-        id = re.match("context\[(.*)\]", i["id"]).group(1)
-        contexts[id] = {}
-        contexts[id]["min"] = i["min"]
-        contexts[id]["max"] = i["max"]
-    if data["contexts"]:
-        for i in data["configuration"]["context_values"]:
-            id = re.match("context\[(.*)\]", i["id"]).group(1)
-            contexts[id]["initial"] = i["value"]
-    log.debug(unicode(contexts))
-
-    log.info("Processing initial features, if any")
-    if "selectedFeatures" in data["configuration"]:
-        for i in data["configuration"]["selectedFeatures"]:
-            initial_features.add(re.match("feature\[(.*)\]", i).group(1))
-    log.debug(unicode(initial_features))
-
-    log.info("Processing Constraints")
-    if num_of_process > 1:
-        # convert in parallel formulas into smt and then parse it here
-        # threads can not be used here because antlr parser seems not thread safe
-        # the z3 expression can not be serialized
-        log.debug("Starting to convert the constraints into smt representation")
-        log.debug("Constraint to convert: " + unicode(len(data["constraints"])))
-        pool = multiprocessing.Pool(num_of_process)
-        results = pool.map(translate_constraints, [(x,data,features_as_boolean) for x in data["constraints"]])
-        log.debug("Converting smt into z3 expressions")
-        for smt_f,fs in results:
-            constraints.append(z3.parse_smt2_string(smt_f))
-            features.update(fs)
+    interface = read_json(interface_file) if interface_file else None
+
+    if batch:
+        import batch_module
+        # the model is compiled before forking the workers that find it in their cache
+        if cache_size < 1:
+            model_module.MODEL_CACHE = model_module.ModelCache(1, cache_memory)
+        model = model_module.get_compiled_model(data, features_as_boolean, num_of_process, parser, simplify)
+        model_module.get_preferences(model)
+
+        def run(configuration_data, configuration_stream):
+            run_hyvarrec(configuration_data,
+                         modality,
+                         configuration_stream,
+                         features_as_boolean=features_as_boolean,
+                         timeout=timeout,
+                         no_default_preferences=no_default_preferences,
+                         parser=parser,
+                         simplify=simplify,
+                         session=session,
+                         anytime=anytime)
+
+        with open(batch) as configurations:
+            batch_module.run_batch(data, configurations, out_stream, num_of_process, run)
     else:
-        for i in data["constraints"]:
-            try:
-                d = SpecTranslator.translate_constraint(i, data, features_as_boolean)
-                log.debug("Find constrataint " + unicode(d))
-                constraints.append(d["formula"])
-                features.update(d["features"])
-            except Exception as e:
-                log.critical("Parsing failed while processing " + i + ": " + str(e))
-                log.critical("Exiting")
-                sys.exit(1)
-    log.info("Constraint processed so far: {}".format(len(constraints)))
-
-    # possibility for reconfigure and explain modality to add directly SMT formulas
-    if "smt_constraints" in data:
-        log.info("Processing special input constraint modality")
-        features.update(data["smt_constraints"]["features"])
-        for i in data["smt_constraints"]["formulas"]:
-            constraints.append(z3.parse_smt2_string(i))
-            # for explain purposes add smt_constraint to constraints
-            data["constraints"].append(i)
-    log.info("Constraint processed so far: {}".format(len("constraints")))
-
-    if modality == "reconfigure":
-        # SMT formulas direct encoding also for preferences
-        # these preferences have the highest priority
-        # here we assume that the features are already declared
-        if "smt_preferences" in data:
-            log.info("Processing special input preferences modality. Pref added as higher priority.")
-            for i in data["smt_preferences"]:
-                preferences.append(z3.parse_smt2_string(i))
-
-        log.info("Processing Preferences")
-        for i in data["preferences"]:
-            try:
-                d = SpecTranslator.translate_preference(i, data, features_as_boolean)
-                log.debug("Find preference " + unicode(d))
-                preferences.append(d["formula"])
-            except Exception as e:
-                log.critical("Parsing failed while processing " + i + ": " + str(e))
-                log.critical("Exiting")
-                sys.exit(1)
-
-    log.info("Processing Context Constraints")
-    if "context_constraints" in data:
-        for i in data["context_constraints"]:
-            try:
-                d = SpecTranslator.translate_constraint(i, data, features_as_boolean)
-                log.debug("Find context constraint " + unicode(d))
-                contexts_constraints.append(d["formula"])
-            except Exception as e:
-                log.critical("Parsing failed while processing " + i + ": " + str(e))
-                log.critical("Exiting")
-                sys.exit(1)
-
-    start_running_time = datetime.datetime.now()
-    if modality == "validate":
-        import validate_module
-        if validate_modality == "grid":
-            validate_module.run_validate_grid_search(features, initial_features, contexts, attributes, constraints,
-                                     preferences, contexts_constraints, features_as_boolean, non_incremental_solver,
-                                     out_stream)
-        elif validate_modality == "forall":
-            validate_module.run_validate(features, initial_features, contexts, attributes, constraints,
-                 preferences, contexts_constraints, features_as_boolean, out_stream)
-
-    elif modality == "explain":
-        run_explain(features, contexts, attributes, constraints,
-                data, features_as_boolean, constraints_minimization, out_stream)
-    elif modality == "check-interface":
-        run_check_interface(features, contexts, attributes, constraints, contexts_constraints,
-                        read_json(interface_file), features_as_boolean, out_stream)
-    elif modality == "check-features":
-        import check_features_module
-        if check_features_modality == "grid":
-            check_features_module.run_feature_analysis_grid_search(
-                features,
-                features_as_boolean,
-                contexts,
-                attributes,
-                constraints,
-                data["optional_features"],
-                non_incremental_solver,
-                out_stream,
-                "" if "time_context" not in data else data["time_context"])
-        elif check_features_modality == "forall":
-            check_features_module.run_feature_analysis_forall(
-                features,
-                features_as_boolean,
-                contexts,
-                attributes,
-                constraints,
-                data["optional_features"],
-                non_incremental_solver,
-                out_stream,
-                "" if "time_context" not in data else data["time_context"])
-        elif check_features_modality == "pruning":
-            check_features_module.run_feature_analysis_with_optimization(
-                features,
-                features_as_boolean,
-                contexts,
-                attributes,
-                constraints,
-                data["optional_features"],
-                non_incremental_solver,
-                out_stream,
-                "" if "time_context" not in data else data["time_context"])
-    elif modality == "reconfigure":
-        run_reconfigure(features, initial_features, contexts, attributes, constraints, preferences,
-                        features_as_boolean, timeout, no_default_preferences, out_stream)
-    else:
-        log.critical("No modality matched. Exiting.")
-        sys.exit(1)
+        options = {"interface": interface,
+                   "num_of_process": num_of_process,
+                   "features_as_boolean": features_as_boolean,
+                   "validate_modality": validate_modality,
+                   "grid_order": grid_order,
+                   "checkpoint": checkpoint,
+                   "limit": limit,
+                   "check_features_modality": check_features_modality,
+                   "time_intervals": time_intervals,
+                   "forall_shard_size": forall_shard_size,
+                   "pruning_trace": pruning_trace,
+                   "context_projection": context_projection,
+                   "timeout": timeout,
+                   "constraints_minimization": constraints_minimization,
+                   "non_incremental_solver": non_incremental_solver,
+                   "no_default_preferences": no_default_preferences,
+                   "parser": parser,
+                   "simplify": simplify,
+                   "anytime": anytime,
+                   "stream_solutions": stream_solutions}
+        if portfolio > 1:
+            import portfolio_module
+            # the model is compiled before forking the members of the portfolio that find it in their cache
+            if cache_size < 1:
+                model_module.MODEL_CACHE = model_module.ModelCache(1, cache_memory)
+            model = model_module.get_compiled_model(data, features_as_boolean, num_of_process, parser, simplify)
+            if modality == "reconfigure":
+                model_module.get_preferences(model)
+
+            def run(member_stream, member_options):
+                kwargs = dict(options)
+                kwargs.update(member_options)
+                # the members of the portfolio are daemonic and can not spawn further processes
+                kwargs["num_of_process"] = 1
+                run_hyvarrec(data, modality, member_stream, **kwargs)
+
+            portfolio_module.run_portfolio(portfolio, run, out_stream)
+        else:
+            run_hyvarrec(data, modality, out_stream, **options)
 
-    delta = datetime.datetime.now() - start_running_time
-    log.info("Seconds taken to run the backend {}".format(delta.total_seconds()))
     delta = datetime.datetime.now() - start_time
     log.info("Seconds taken to run hyvarrec {}".format(delta.total_seconds()))
     log.info("Program Succesfully Ended")
@@ -0,0 +1,262 @@
+"""
+implication_module.py: static detection of dead and false optional features.
+
+The constraints of the feature model are weakened to the clauses of at most two feature literals they imply,
+e.g., feature[a] impl feature[b], not (feature[a] and feature[b]), or the exclusions of oneonly[...]. Constraints
+using contexts, attributes, or longer clauses are dropped, hence every configuration of the feature model satisfies
+the clauses. The clauses form an implication graph between the literals (a clause l1 or l2 gives the edges
+not l1 -> l2 and not l2 -> l1). The strongly connected components of the graph are computed and the transitive
+closure is indexed on the graph of the components.
+A feature whose selection implies its deselection is dead in every time instant. A feature whose deselection
+implies its selection is selected in every configuration, hence it is false optional in every time instant
+where the feature model has a configuration.
+"""
+import logging as log
+import z3
+
+
+def get_feature(term, features):
+    """Returns the feature represented by the term (an integer feature or ite(boolean feature, 1, 0)), None if
+    the term does not represent a feature"""
+    if not z3.is_app(term):
+        return None
+    decl = term.decl()
+    kind = decl.kind()
+    if kind == z3.Z3_OP_UNINTERPRETED:
+        name = decl.name()
+        return name if name in features and term.num_args() == 0 else None
+    if kind == z3.Z3_OP_ITE:
+        condition, then_term, else_term = term.children()
+        if get_value(then_term) == 1 and get_value(else_term) == 0:
+            return get_feature(condition, features)
+    return None
+
+
+def get_value(term):
+    """Returns the value of an integer constant, None if the term is not an integer constant"""
+    return term.as_long() if z3.is_int_value(term) else None
+
+
+def get_literal(formula, kind, children, features):
+    """Returns the literal (feature, True if selected) of the formula with the given kind and children, None if
+    the formula is not a literal"""
+    if kind == z3.Z3_OP_UNINTERPRETED and z3.is_bool(formula):
+        feature = get_feature(formula, features)
+        return (feature, True) if feature else None
+    if kind == z3.Z3_OP_EQ:
+        for term, value in [(children[0], children[1]), (children[1], children[0])]:
+            value = get_value(value)
+            if value in [0, 1]:
+                feature = get_feature(term, features)
+                if feature:
+                    return feature, value == 1
+    return None
+
+
+def get_at_most_one(formula, kind, children, features):
+    """Returns the features of which at most one is selected by the formula with the given kind and children with
+    True if exactly one is selected, None if the formula does not have this shape"""
+    if kind in [z3.Z3_OP_PB_EQ, z3.Z3_OP_PB_LE, z3.Z3_OP_PB_AT_MOST]:
+        if any([i != 1 for i in formula.decl().params()]):
+            return None
+        literals = [get_literal(i, i.decl().kind(), i.children(), features) for i in children]
+        if None in literals or any([not i[1] for i in literals]):
+            return None
+        return [i[0] for i in literals], kind == z3.Z3_OP_PB_EQ
+    if kind in [z3.Z3_OP_EQ, z3.Z3_OP_LE]:
+        total, bound = children
+        if kind == z3.Z3_OP_EQ and z3.is_int_value(total):
+            total, bound = bound, total
+        if z3.is_add(total) and get_value(bound) == 1:
+            terms = [get_feature(i, features) for i in total.children()]
+            if None not in terms:
+                return terms, kind == z3.Z3_OP_EQ
+    return None
+
+
+def get_disjunction(arguments, features):
+    """Returns the clauses of the disjunction of the formulas, given as pairs (formula, polarity)"""
+    clauses = [frozenset()]
+    for formula, positive in arguments:
+        child = get_clauses(formula, features, positive)
+        if not child:
+            return []
+        clauses = [i | j for i in clauses for j in child]
+        # the tautologies and the clauses of more than two literals are dropped
+        clauses = list(set([i for i in clauses if len(i) <= 2 and not any([(k, not v) in i for k, v in i])]))
+        if not clauses:
+            return []
+    return clauses
+
+
+def get_conjunction(arguments, features):
+    """Returns the clauses of the conjunction of the formulas, given as pairs (formula, polarity)"""
+    clauses = []
+    for formula, positive in arguments:
+        clauses.extend(get_clauses(formula, features, positive))
+    return clauses
+
+
+def get_clauses(formula, features, positive=True):
+    """Returns clauses of at most two feature literals implied by the formula (by its negation if positive is
+    False). The clauses are frozensets of literals, a formula without such clauses returns an empty list"""
+    if not z3.is_app(formula):
+        return []
+    kind = formula.decl().kind()
+    children = formula.children()
+    literal = get_literal(formula, kind, children, features)
+    if literal:
+        return [frozenset([literal if positive else (literal[0], not literal[1])])]
+    if kind == z3.Z3_OP_NOT:
+        return get_clauses(children[0], features, not positive)
+    if kind == z3.Z3_OP_AND:
+        if positive:
+            return get_conjunction([(i, True) for i in children], features)
+        return get_disjunction([(i, False) for i in children], features)
+    if kind == z3.Z3_OP_OR:
+        if positive:
+            return get_disjunction([(i, True) for i in children], features)
+        return get_conjunction([(i, False) for i in children], features)
+    if kind == z3.Z3_OP_IMPLIES:
+        if positive:
+            return get_disjunction([(children[0], False), (children[1], True)], features)
+        return get_conjunction([(children[0], True), (children[1], False)], features)
+    if kind in [z3.Z3_OP_EQ, z3.Z3_OP_IFF] and z3.is_bool(children[0]):
+        a, b = children
+        if positive:
+            return get_disjunction([(a, False), (b, True)], features) + \
+                get_disjunction([(a, True), (b, False)], features)
+        return get_disjunction([(a, True), (b, True)], features) + \
+            get_disjunction([(a, False), (b, False)], features)
+    if positive:
+        at_most_one = get_at_most_one(formula, kind, children, features)
+        if at_most_one:
+            terms, exactly = at_most_one
+            clauses = [frozenset([(terms[i], False), (terms[j], False)])
+                       for i in range(len(terms)) for j in range(i + 1, len(terms))]
+            if exactly and len(terms) <= 2:
+                clauses.append(frozenset([(i, True) for i in terms]))
+            return clauses
+    return []
+
+
+def get_implication_graph(clauses):
+    """Returns the literals and the successors of every literal (by index) in the implication graph of the
+    clauses"""
+    literals = []
+    index = {}
+
+    def get_index(literal):
+        if literal not in index:
+            for i in [(literal[0], True), (literal[0], False)]:
+                index[i] = len(literals)
+                literals.append(i)
+        return index[literal]
+
+    edges = set()
+    for clause in clauses:
+        ls = sorted(clause)
+        if len(ls) == 1:
+            ls = ls * 2
+        for a, b in [(ls[0], ls[1]), (ls[1], ls[0])]:
+            edges.add((get_index((a[0], not a[1])), get_index(b)))
+    successors = [[] for _ in literals]
+    for a, b in sorted(edges):
+        successors[a].append(b)
+    return literals, successors
+
+
+def get_components(successors):
+    """Returns the strongly connected component of every node of the graph (Tarjan's algorithm without recursion).
+    Components are numbered in reverse topological order: the successors of a component have lower numbers"""
+    indexes = [None] * len(successors)
+    lowlinks = [0] * len(successors)
+    components = [None] * len(successors)
+    stack = []
+    on_stack = [False] * len(successors)
+    counter = 0
+    component = 0
+    for root in range(len(successors)):
+        if indexes[root] is not None:
+            continue
+        work = [(root, 0)]
+        while work:
+            node, child = work.pop()
+            if child == 0:
+                indexes[node] = lowlinks[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = True
+            recurse = False
+            for i in range(child, len(successors[node])):
+                succ = successors[node][i]
+                if indexes[succ] is None:
+                    work.append((node, i + 1))
+                    work.append((succ, 0))
+                    recurse = True
+                    break
+                elif on_stack[succ]:
+                    lowlinks[node] = min(lowlinks[node], indexes[succ])
+            if recurse:
+                continue
+            if lowlinks[node] == indexes[node]:
+                while True:
+                    i = stack.pop()
+                    on_stack[i] = False
+                    components[i] = component
+                    if i == node:
+                        break
+                component += 1
+            if work:
+                parent = work[-1][0]
+                lowlinks[parent] = min(lowlinks[parent], lowlinks[node])
+    return components
+
+
+def get_closure(successors, components):
+    """Returns for every component the set of the components reachable from it, as bits of an integer"""
+    size = max(components) + 1 if components else 0
+    members = [[] for _ in range(size)]
+    for node, component in enumerate(components):
+        members[component].append(node)
+    reachable = [0] * size
+    # the successors of a component have lower numbers, hence they are completed first
+    for component in range(size):
+        bits = 1 << component
+        for node in members[component]:
+            for succ in successors[node]:
+                if components[succ] != component:
+                    bits |= reachable[components[succ]]
+        reachable[component] = bits
+    return reachable
+
+
+def get_settled_features(features, constraints, candidates):
+    """Returns the candidate features that are dead and the candidate features that are selected in every
+    configuration of the feature model, found on the implication graph of the constraints.
+    If the implication graph is contradictory all the candidate features are dead"""
+    clauses = []
+    for formula in constraints:
+        clauses.extend(get_clauses(formula, features))
+    literals, successors = get_implication_graph(set(clauses))
+    components = get_components(successors)
+    log.debug("Implication graph: {} clauses, {} literals, {} components".format(
+        len(set(clauses)), len(literals), max(components) + 1 if components else 0))
+    # the two literals of a feature have consecutive indexes
+    for i in range(0, len(literals), 2):
+        if components[i] == components[i + 1]:
+            log.info("Contradictory implication graph: the feature model has no configuration")
+            return set(candidates), set()
+    reachable = get_closure(successors, components)
+    dead = set()
+    selected = set()
+    for i in range(0, len(literals), 2):
+        feature = literals[i][0]
+        if feature not in candidates:
+            continue
+        positive, negative = components[i], components[i + 1]
+        if reachable[positive] >> negative & 1:
+            dead.add(feature)
+        elif reachable[negative] >> positive & 1:
+            selected.add(feature)
+    return dead, selected
@@ -0,0 +1,324 @@
+"""
+model_module.py: translation of the feature model into z3 formulas.
+
+The translated (compiled) feature models are stored in a LRU cache indexed by
+the hash of the part of the input defining the feature model. Requests that
+differ only for the configuration reuse the compiled model without parsing
+again the constraints.
+"""
+import logging as log
+import json
+import re
+import os
+import sys
+import copy
+import hashlib
+import time
+import collections
+import multiprocessing
+import z3
+
+import SpecificationGrammar.SpecTranslator as SpecTranslator
+
+# fields of the input that define the feature model (the configuration is excluded)
+MODEL_FIELDS = ["attributes", "contexts", "constraints", "preferences", "smt_constraints", "smt_preferences",
+                "context_constraints", "optional_features", "time_context"]
+
+DEFAULT_CACHE_SIZE = 16
+DEFAULT_CACHE_MEMORY = 512 # MB
+
+
+# function to encode SMT expression into SMTLIB
+def to_smt2_assertions(formulas):
+    """Encodes the formulas into SMTLIB returning the set of declarations and the assertions (one for every
+    formula, in the same order) as separate strings"""
+    # the formulas are given as assumptions since the printer omits the main formula when it is true
+    v = (z3.Ast * len(formulas))()
+    for i in range(len(formulas)):
+        v[i] = formulas[i].as_ast()
+    true = z3.BoolVal(True)
+    smt = z3.Z3_benchmark_to_smtlib_string(true.ctx_ref(), "benchmark", "", "unknown", "",
+                                           len(formulas), v, true.as_ast())
+    declarations = set()
+    assertions = []
+    for line in smt.split("\n"):
+        if line.startswith("(declare-fun"):
+            declarations.add(line)
+        elif not line.startswith(";") and not line.startswith("(set-info") and not line.startswith("(check-sat"):
+            assertions.append(line)
+    return declarations, "\n".join(assertions)
+
+
+def translate_chunk(args):
+    """Translates a chunk of constraints (preferences if preferences is True) in a worker process.
+    The z3 expressions can not be serialized: the formulas are returned as SMTLIB assertions, integer terms
+    are wrapped in an equality. Errors are returned to the parent instead of exiting the worker."""
+    chunk, preferences, features_as_boolean, parser, simplify = args
+    translate = SpecTranslator.translate_preference if preferences else SpecTranslator.translate_constraint
+    formulas = []
+    wrapped = []
+    features = set()
+    for c in chunk:
+        try:
+            d = translate(c, {}, features_as_boolean, parser, simplify)
+        except Exception as e:
+            return {"error": "Parsing failed while processing " + c + ": " + str(e)}
+        wrapped.append(not z3.is_bool(d["formula"]))
+        formulas.append(d["formula"] == 0 if wrapped[-1] else d["formula"])
+        features.update(d["features"])
+    declarations, assertions = to_smt2_assertions(formulas)
+    return {"declarations": declarations, "assertions": assertions, "wrapped": wrapped, "features": features}
+
+
+def translate_formulas(formulas, features_as_boolean, num_of_process=1, parser="antlr", simplify="node",
+                       preferences=False):
+    """Translates the constraints (preferences if preferences is True) returning the list of z3 formulas and
+    the set of features used.
+    With more than one process the constraints are split into chunks translated by a pool of processes.
+    Only the text of the constraints is sent to the workers. The SMTLIB assertions of all the chunks are
+    parsed at once, together with the union of their declarations.
+    z3 may print SMTLIB that it can not parse back (e.g., pseudo-boolean constraints with coefficients too big
+    for an unsigned machine integer). In this case every chunk is parsed separately and the chunks that can not
+    be parsed are translated again in the main process without the SMTLIB round-trip."""
+    out = []
+    features = set()
+    if num_of_process <= 1 or len(formulas) <= 1:
+        translate = SpecTranslator.translate_preference if preferences else SpecTranslator.translate_constraint
+        for i in formulas:
+            try:
+                d = translate(i, {}, features_as_boolean, parser, simplify)
+                log.debug("Find formula %s", d)
+                out.append(d["formula"])
+                features.update(d["features"])
+            except Exception as e:
+                log.critical("Parsing failed while processing " + i + ": " + str(e))
+                log.critical("Exiting")
+                sys.exit(1)
+        return out, features
+
+    # threads can not be used here because antlr parser seems not thread safe
+    # few chunks per process to balance the load without sending a message per constraint
+    chunk_size = max(1, len(formulas) / (num_of_process * 4))
+    chunks = [formulas[i:i + chunk_size] for i in range(0, len(formulas), chunk_size)]
+    log.debug("Translating {} formulas in {} chunks".format(len(formulas), len(chunks)))
+    pool = multiprocessing.Pool(num_of_process)
+    try:
+        results = pool.map(translate_chunk, [(x, preferences, features_as_boolean, parser, simplify) for x in chunks])
+    finally:
+        pool.close()
+        pool.join()
+
+    declarations = set()
+    for result in results:
+        if "error" in result:
+            log.critical(result["error"])
+            log.critical("Exiting")
+            sys.exit(1)
+        declarations.update(result["declarations"])
+        features.update(result["features"])
+
+    log.debug("Converting smt into z3 expressions")
+    try:
+        assertions = z3.parse_smt2_string("\n".join(sorted(declarations) + [x["assertions"] for x in results]))
+    except z3.Z3Exception as e:
+        log.warning("SMTLIB of the chunks can not be parsed, parsing every chunk separately: " + str(e))
+        for chunk, result in zip(chunks, results):
+            out.extend(parse_chunk(chunk, result, features_as_boolean, parser, simplify, preferences))
+        return out, features
+    wrapped = [i for x in results for i in x["wrapped"]]
+    for i in range(len(wrapped)):
+        out.append(assertions[i].arg(0) if wrapped[i] else assertions[i])
+    return out, features
+
+
+def parse_chunk(chunk, result, features_as_boolean, parser, simplify, preferences):
+    """Returns the formulas of a chunk translated by a worker, translating the chunk again in the main process if
+    its SMTLIB assertions can not be parsed"""
+    try:
+        assertions = z3.parse_smt2_string("\n".join(sorted(result["declarations"]) + [result["assertions"]]))
+    except z3.Z3Exception as e:
+        log.debug("Translating again a chunk of {} formulas: {}".format(len(chunk), e))
+        return translate_formulas(chunk, features_as_boolean, 1, parser, simplify, preferences)[0]
+    return [assertions[i].arg(0) if result["wrapped"][i] else assertions[i] for i in range(len(chunk))]
+
+
+class ModelCache:
+    """LRU cache of the compiled feature models.
+    The memory used by a model is estimated by the size of its json definition."""
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, max_memory=DEFAULT_CACHE_MEMORY):
+        self.max_size = max_size
+        self.max_memory = max_memory * 1024 * 1024
+        self.memory = 0
+        self.models = collections.OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        if key in self.models:
+            self.stats["hits"] += 1
+            # move the model at the end of the queue
+            entry = self.models.pop(key)
+            self.models[key] = entry
+            return entry[0]
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key, model, weight):
+        if self.max_size <= 0 or weight > self.max_memory:
+            return
+        if key in self.models:
+            self.memory -= self.models.pop(key)[1]
+        while self.models and (len(self.models) >= self.max_size or self.memory + weight > self.max_memory):
+            _, (_, old_weight) = self.models.popitem(last=False)
+            self.memory -= old_weight
+            self.stats["evictions"] += 1
+        self.models[key] = (model, weight)
+        self.memory += weight
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["pid"] = os.getpid()
+        stats["size"] = len(self.models)
+        stats["memory"] = self.memory
+        return stats
+
+
+# cache used by the current process
+MODEL_CACHE = ModelCache()
+
+
+def get_model_definition(data, features_as_boolean, parser, simplify):
+    """Returns the json string of the part of the input defining the feature model"""
+    definition = {i: data[i] for i in MODEL_FIELDS if i in data}
+    definition["features_as_boolean"] = features_as_boolean
+    definition["parser"] = parser
+    definition["simplify"] = simplify
+    return json.dumps(definition, sort_keys=True)
+
+
+def compile_model(data, features_as_boolean, num_of_process=1, parser="antlr", simplify="node"):
+    """Translate the feature model into z3 formulas.
+    Preferences are translated only when needed, see get_preferences."""
+    start_time = time.time()
+    model = {
+        "features": set(),
+        "contexts": {},
+        "attributes": {},
+        "constraints": [],
+        # source of the constraints, used to explain the voidness of the FM
+        "constraints_source": list(data["constraints"]),
+        "contexts_constraints": [],
+        "preferences": None,
+        "optional_features": data.get("optional_features", {}),
+        "time_context": data.get("time_context", ""),
+        "features_as_boolean": features_as_boolean,
+        "parser": parser,
+        "simplify": simplify,
+        "num_of_process": num_of_process,
+        # definition of the model, needed to translate the preferences
+        "data": {i: data[i] for i in MODEL_FIELDS if i in data}}
+
+    log.info("Processing attributes")
+    for i in data["attributes"]:
+        id = re.match("attribute\[(.*)\]", i["id"]).group(1)
+        model["attributes"][id] = {}
+        model["attributes"][id]["min"] = i["min"]
+        model["attributes"][id]["max"] = i["max"]
+        model["attributes"][id]["feature"] = re.match("feature\[(.*)\]", i["featureId"]).group(1)
+
+    log.info("Processing contexts")
+    for i in data["contexts"]:
+        id = re.match("context\[(.*)\]", i["id"]).group(1)
+        model["contexts"][id] = {}
+        model["contexts"][id]["min"] = i["min"]
+        model["contexts"][id]["max"] = i["max"]
+
+    log.info("Processing Constraints")
+    model["constraints"], model["features"] = translate_formulas(
+        data["constraints"], features_as_boolean, num_of_process, parser, simplify)
+    log.info("Constraint processed so far: {}".format(len(model["constraints"])))
+
+    # possibility for reconfigure and explain modality to add directly SMT formulas
+    if "smt_constraints" in data:
+        log.info("Processing special input constraint modality")
+        model["features"].update(data["smt_constraints"]["features"])
+        for i in data["smt_constraints"]["formulas"]:
+            model["constraints"].append(z3.parse_smt2_string(i))
+            # for explain purposes add smt_constraint to constraints
+            model["constraints_source"].append(i)
+    log.info("Constraint processed so far: {}".format(len(model["constraints"])))
+
+    log.info("Processing Context Constraints")
+    if "context_constraints" in data:
+        model["contexts_constraints"], _ = translate_formulas(
+            data["context_constraints"], features_as_boolean, num_of_process, parser, simplify)
+    log.info("Seconds taken to translate the feature model {} (parser {}, simplify {})".format(
+        time.time() - start_time, parser, simplify))
+    return model
+
+
+def get_preferences(model):
+    """Returns the preferences of the compiled model, translating them the first time they are needed"""
+    if model["preferences"] is None:
+        data = model["data"]
+        preferences = []
+        # SMT formulas direct encoding also for preferences
+        # these preferences have the highest priority
+        # here we assume that the features are already declared
+        if "smt_preferences" in data:
+            log.info("Processing special input preferences modality. Pref added as higher priority.")
+            for i in data["smt_preferences"]:
+                preferences.append(z3.parse_smt2_string(i))
+
+        log.info("Processing Preferences")
+        preferences.extend(translate_formulas(data["preferences"], model["features_as_boolean"],
+                                              model["num_of_process"], model["parser"], model["simplify"],
+                                              preferences=True)[0])
+        model["preferences"] = preferences
+    return model["preferences"]
+
+
+def get_compiled_model(data, features_as_boolean, num_of_process=1, parser="antlr", simplify="node", cache=None):
+    """Returns the compiled feature model defined in data, using the cache if possible"""
+    if cache is None:
+        cache = MODEL_CACHE
+    definition = get_model_definition(data, features_as_boolean, parser, simplify)
+    key = hashlib.sha1(definition).hexdigest()
+    model = cache.get(key)
+    if model is None:
+        log.info("Compiled model not found in cache")
+        model = compile_model(data, features_as_boolean, num_of_process, parser, simplify)
+        model["key"] = key
+        cache.put(key, model, len(definition))
+    else:
+        log.info("Compiled model found in cache")
+    log.debug("Cache statistics: " + unicode(cache.get_stats()))
+    return model
+
+
+def configure_model(model, data):
+    """Returns the initial features, the contexts, and the attributes of the compiled model
+    extended with the initial values defined in the configuration of the input"""
+    initial_features = set()
+    contexts = copy.deepcopy(model["contexts"])
+    attributes = copy.deepcopy(model["attributes"])
+
+    if data["attributes"]:
+        for i in data["configuration"]["attribute_values"]:
+            id = re.match("attribute\[(.*)\]", i["id"]).group(1)
+            attributes[id]["initial"] = i["value"]
+        log.debug(unicode(attributes))
+
+    if data["contexts"]:
+        for i in data["configuration"]["context_values"]:
+            id = re.match("context\[(.*)\]", i["id"]).group(1)
+            contexts[id]["initial"] = i["value"]
+    log.debug(unicode(contexts))
+
+    log.info("Processing initial features, if any")
+    if "selectedFeatures" in data["configuration"]:
+        for i in data["configuration"]["selectedFeatures"]:
+            initial_features.add(re.match("feature\[(.*)\]", i).group(1))
+    log.debug(unicode(initial_features))
+
+    return initial_features, contexts, attributes
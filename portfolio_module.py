@@ -0,0 +1,117 @@
+"""
+portfolio_module.py: portfolio of differently configured solvers running the same task.
+
+Every member of the portfolio is a process forked from the main process, hence the members find
+the compiled feature model in their model cache. Every member sets its z3 parameters and runs the
+task; the first definitive answer is returned and the other members are terminated.
+The wins of the configurations are counted by the process running the portfolio and logged
+after every run to tune the portfolio. The counts are kept only in memory, hence they cover the
+portfolios run by a single HyVarRec invocation: tuning across runs requires collecting the logs.
+"""
+import logging as log
+import sys
+import json
+import time
+import multiprocessing
+import StringIO
+import z3
+
+# configurations of the members of the portfolio, in the order they are added to the portfolio
+# every configuration has a name, the z3 global parameters, and the options of the task
+CONFIGURATIONS = [
+    ("default", {}, {}),
+    ("no-relevancy", {"smt.relevancy": 0}, {}),
+    ("non-incremental", {}, {"non_incremental_solver": True}),
+    # the default arithmetic solver of z3 4.8 is the simplex (smt.arith.solver 2), this is the new lra solver
+    ("arith-lra", {"smt.arith.solver": 6}, {}),
+    ("phase-caching", {"smt.phase_selection": 5, "smt.random_seed": 1, "sat.random_seed": 1}, {}),
+    ("no-mbqi", {"smt.mbqi": False}, {})]
+
+# wins of the configurations in the portfolios run by the current process
+STATS = {}
+
+
+def get_configurations(size):
+    """Returns the configurations of a portfolio with the given number of members.
+    Configurations differing only for the random seeds are added after the predefined ones"""
+    configurations = CONFIGURATIONS[:size]
+    for i in range(len(CONFIGURATIONS), size):
+        configurations.append(("seed-" + unicode(i), {"smt.random_seed": i, "sat.random_seed": i}, {}))
+    return configurations
+
+
+def is_definitive(output):
+    """Returns True if the output is an answer that other solvers can not improve"""
+    if not output:
+        return False
+    try:
+        out = json.loads(output.strip().split("\n")[-1])
+    except ValueError:
+        return False
+    return out.get("result") != "unknown" and out.get("optimal", True)
+
+
+def run_member(queue, index, params, options, run):
+    out_stream = StringIO.StringIO()
+    start_time = time.time()
+    try:
+        for i in params:
+            z3.set_param(i, params[i])
+        run(out_stream, options)
+        output = out_stream.getvalue()
+    except (SystemExit, Exception) as e:
+        log.warning("Member " + unicode(index) + " of the portfolio failed: " + unicode(e))
+        output = None
+    queue.put((index, output, time.time() - start_time))
+
+
+def run_portfolio(size, run, out_stream):
+    """Runs the task with a portfolio of the given number of solvers, writing on the output stream the first
+    definitive answer. If no member gives a definitive answer the first answer received is written.
+    The function run(out_stream, options) must run the task writing its output on the stream, the options are the
+    keyword arguments of run_hyvarrec overridden by the configuration of the member.
+    The feature model must be already compiled and stored in the model cache."""
+    configurations = get_configurations(size)
+    queue = multiprocessing.Queue()
+    members = []
+    for index, (name, params, options) in enumerate(configurations):
+        log.info("Starting member " + unicode(index) + " of the portfolio with configuration " + name)
+        member = multiprocessing.Process(target=run_member, args=(queue, index, params, options, run))
+        member.daemon = True
+        member.start()
+        members.append(member)
+
+    winner = None
+    fallback = None
+    try:
+        for _ in members:
+            index, output, elapsed_time = queue.get()
+            log.debug("Member " + unicode(index) + " answered in " + unicode(elapsed_time) + " seconds")
+            if is_definitive(output):
+                winner = (index, output, elapsed_time)
+                break
+            if fallback is None and output:
+                fallback = output
+    finally:
+        for member in members:
+            if member.is_alive():
+                member.terminate()
+            member.join()
+
+    for name, _, _ in configurations:
+        STATS.setdefault(name, {"runs": 0, "wins": 0})["runs"] += 1
+    if winner is None:
+        log.warning("No member of the portfolio gave a definitive answer")
+        if fallback is None:
+            log.critical("All the members of the portfolio failed")
+            log.critical("Exiting")
+            sys.exit(1)
+        out_stream.write(fallback)
+    else:
+        index, output, elapsed_time = winner
+        name = configurations[index][0]
+        STATS[name]["wins"] += 1
+        log.info("Configuration " + name + " won the portfolio in " + unicode(elapsed_time) + " seconds")
+        out_stream.write(output)
+    log.info("Portfolio wins so far: " + ", ".join(
+        [i + " " + unicode(STATS[i]["wins"]) + "/" + unicode(STATS[i]["runs"]) for i in sorted(STATS.keys())]))
@@ -0,0 +1,309 @@
+"""
+reconfigure_module.py: reconfiguration of a configuration of the feature model.
+
+The reconfiguration can be performed with a new solver (run_reconfigure) or by a session
+(ReconfigurationSession) that keeps the solver of the feature model alive between the
+reconfigurations. The session asserts the variable bounds, the constraints, and the
+preferences of the feature model once, while the context values and the default
+preferences depending on the initial configuration are added in a scope removed by pop
+after every reconfiguration.
+With a timeout, run_reconfigure_anytime returns the best configuration found
+when the timeout expires instead of no configuration.
+"""
+import logging as log
+import json
+import time
+import z3
+
+
+def get_true_boolean_features_from_model(model):
+    ls = []
+    for decl in model.decls():
+        if z3.is_true(model[decl]):
+            if not "!" in decl.__repr__():
+                ls.append(decl.__repr__())
+    return ls
+
+
+def add_variables(solver, features, contexts, attributes, features_as_boolean):
+    log.info("Add variables")
+    if not features_as_boolean:
+        for i in features:
+            solver.add(0 <= z3.Int(i), z3.Int(i) <= 1)
+    for i in attributes.keys():
+        solver.add(attributes[i]["min"] <= z3.Int(i), z3.Int(i) <= attributes[i]["max"])
+    for i in contexts.keys():
+        solver.add(contexts[i]["min"] <= z3.Int(i), z3.Int(i) <= contexts[i]["max"])
+
+
+def add_initial_contexts(solver, contexts):
+    log.info("Enforce context to be equal to intial values")
+    for i in contexts.keys():
+        solver.add(contexts[i]["initial"] == z3.Int(i))
+
+
+def get_default_objectives(features, initial_features, attributes, features_as_boolean):
+    """Returns the default preferences as list of pairs (term, True if the term is maximized) in order of priority
+    """
+    objectives = []
+    log.info("Add preference: minimize the number of initial features removed")
+    if initial_features:
+        if features_as_boolean:
+            objectives.append((z3.Sum([z3.If(z3.Bool(i),1,0) for i in initial_features]), True))
+        else:
+            objectives.append((z3.Sum([z3.Int(i) for i in initial_features]), True))
+
+    log.info("Add preference: minimize the number of attributes changed")
+    initial_attributes = [k for k in attributes.keys() if "initial" in attributes[k]]
+    if initial_attributes:
+        objectives.append((
+            z3.Sum([z3.If(z3.Int(i) == z3.IntVal(attributes[i]["initial"]), 1, 0) for i in initial_attributes]),
+            True))
+
+    log.info("Add preference: minimize the number of non initial features added")
+    if features.difference(initial_features):
+        if features_as_boolean:
+            objectives.append((z3.Sum([z3.If(z3.Bool(i),1,0) for i in features.difference(initial_features)]),
+                               False))
+        else:
+            objectives.append((z3.Sum([z3.Int(i) for i in features.difference(initial_features)]), False))
+
+    log.info("Add preference: minimize the values of the attributes")
+    for i in attributes.keys():
+        objectives.append((z3.Int(i), False))
+    return objectives
+
+
+def add_default_preferences(solver, features, initial_features, attributes, features_as_boolean):
+    for term, maximize in get_default_objectives(features, initial_features, attributes, features_as_boolean):
+        if maximize:
+            solver.maximize(term)
+        else:
+            solver.minimize(term)
+
+
+def get_result(model, features, attributes, features_as_boolean, ctx=None):
+    """Returns the output of a satisfiable reconfiguration from the model of the solver"""
+    out = {"result": "sat", "features": [], "attributes": []}
+    if features_as_boolean:
+        out["features"].extend(get_true_boolean_features_from_model(model))
+    else:
+        for i in features:
+            if model[z3.Int(i, ctx)] == z3.IntVal(1, ctx):
+                out["features"].append(i)
+    for i in attributes.keys():
+        if attributes[i]["feature"] in out["features"]:
+            out["attributes"].append({"id": i, "value": unicode(model[z3.Int(i, ctx)])})
+    return out
+
+
+def write_result(solver, result, features, attributes, features_as_boolean, out_stream):
+    log.info("Printing output")
+    if result == z3.sat:
+        json.dump(get_result(solver.model(), features, attributes, features_as_boolean), out_stream)
+        out_stream.write("\n")
+    elif result == z3.unknown:
+        # the timeout expired, the feature model may have a configuration
+        log.info("Timeout expired before finding a solution")
+        out_stream.write('{"result": "unknown"}\n')
+    else:
+        out_stream.write('{"result": "unsat"}\n')
+
+
+def run_reconfigure(
+        features,
+        initial_features,
+        contexts,
+        attributes,
+        constraints,
+        preferences,
+        features_as_boolean,
+        timeout,
+        no_default_preferences,
+        out_stream):
+    """Perform the reconfiguration task
+    """
+    solver = z3.Optimize()
+
+    add_variables(solver, features, contexts, attributes, features_as_boolean)
+    add_initial_contexts(solver, contexts)
+
+    log.info("Add constraints")
+    for i in constraints:
+        solver.add(i)
+
+    log.info("Add preferences")
+    for i in preferences:
+        solver.maximize(i)
+
+    if no_default_preferences:
+        log.info("Default preferences will be ignored.")
+    else:
+        add_default_preferences(solver, features, initial_features, attributes, features_as_boolean)
+
+    #log.debug(unicode(solver))
+
+    if timeout > 0:
+        solver.set("timeout", timeout)
+
+    log.info("Computing reconfiguration")
+    result = solver.check()
+    write_result(solver, result, features, attributes, features_as_boolean, out_stream)
+
+
+def run_reconfigure_anytime(
+        features,
+        initial_features,
+        contexts,
+        attributes,
+        constraints,
+        preferences,
+        features_as_boolean,
+        timeout,
+        no_default_preferences,
+        out_stream,
+        stream_solutions=False):
+    """Perform the reconfiguration task optimizing the objectives one at a time in order of priority.
+    The value of an objective is improved by asking the solver for a better solution until this does not
+    exist, then the objective is fixed to its best value and the next objective is considered.
+    When the timeout expires the best solution found so far is returned, marked as not optimal, with the number
+    of objectives whose optimal value has been found. If stream_solutions is True, every solution improving the
+    previous one is written as soon as it is found."""
+    deadline = time.time() + timeout / 1000.0 if timeout > 0 else None
+    # the solver is interrupted by its timeouts, this may leave the z3 context unusable (observed with z3 4.8.0)
+    # the search is therefore done in a new context, discarded at the end
+    ctx = z3.Context()
+    formulas = z3.Solver()
+
+    add_variables(formulas, features, contexts, attributes, features_as_boolean)
+    add_initial_contexts(formulas, contexts)
+
+    log.info("Add constraints")
+    for i in constraints:
+        formulas.add(i)
+
+    solver = z3.Solver(ctx=ctx)
+    for i in formulas.assertions():
+        solver.add(i.translate(ctx))
+
+    log.info("Add preferences")
+    objectives = [(i, True) for i in preferences]
+    if no_default_preferences:
+        log.info("Default preferences will be ignored.")
+    else:
+        objectives.extend(get_default_objectives(features, initial_features, attributes, features_as_boolean))
+    objectives = [(term.translate(ctx), maximize) for term, maximize in objectives]
+
+    def check():
+        if deadline is not None:
+            remaining = int((deadline - time.time()) * 1000)
+            if remaining <= 0:
+                return z3.unknown
+            solver.set("timeout", remaining)
+        return solver.check()
+
+    def write(model, optimal, completed):
+        out = get_result(model, features, attributes, features_as_boolean, ctx)
+        out["optimal"] = optimal
+        out["objectives_completed"] = completed
+        json.dump(out, out_stream)
+        out_stream.write("\n")
+        out_stream.flush()
+
+    log.info("Computing reconfiguration")
+    result = check()
+    if result == z3.unsat:
+        out_stream.write('{"result": "unsat"}\n')
+        return
+    elif result == z3.unknown:
+        log.info("Timeout expired before finding a solution")
+        out_stream.write('{"result": "unknown"}\n')
+        return
+    model = solver.model()
+    if stream_solutions:
+        write(model, False, 0)
+
+    completed = 0
+    for term, maximize in objectives:
+        value = model.eval(term, model_completion=True).as_long()
+        # the improvement required is doubled after every success and reset to 1 after a failure
+        step = 1
+        while True:
+            solver.push()
+            solver.add(term >= value + step if maximize else term <= value - step)
+            result = check()
+            if result == z3.sat:
+                model = solver.model()
+                value = model.eval(term, model_completion=True).as_long()
+                log.debug("Objective {} improved to {}".format(completed, value))
+            solver.pop()
+            if result == z3.sat:
+                step *= 2
+                if stream_solutions:
+                    write(model, False, completed)
+            elif result == z3.unsat:
+                if step == 1:
+                    break
+                step = 1
+            else:
+                log.info("Timeout expired after completing {} of {} objectives".format(completed, len(objectives)))
+                write(model, False, completed)
+                return
+        solver.add(term == value)
+        completed += 1
+    write(model, True, completed)
+
+
+class ReconfigurationSession:
+    """Solver of a compiled feature model reused for several reconfigurations.
+    The preferences of the feature model have the priority over the default preferences
+    as in run_reconfigure since they are added first."""
+
+    def __init__(self, features, contexts, attributes, constraints, preferences, features_as_boolean,
+                 timeout=0, no_default_preferences=False):
+        self.features = features
+        self.features_as_boolean = features_as_boolean
+        self.no_default_preferences = no_default_preferences
+        self.reconfigurations = 0
+        self.solver = z3.Optimize()
+
+        add_variables(self.solver, features, contexts, attributes, features_as_boolean)
+        log.info("Add constraints")
+        for i in constraints:
+            self.solver.add(i)
+        log.info("Add preferences")
+        for i in preferences:
+            self.solver.maximize(i)
+        if timeout > 0:
+            self.solver.set("timeout", timeout)
+
+    def reconfigure(self, initial_features, contexts, attributes, out_stream):
+        """Perform the reconfiguration task for the given initial configuration and context values"""
+        self.solver.push()
+        try:
+            add_initial_contexts(self.solver, contexts)
+            if self.no_default_preferences:
+                log.info("Default preferences will be ignored.")
+            else:
+                add_default_preferences(self.solver, self.features, initial_features, attributes,
+                                        self.features_as_boolean)
+            log.info("Computing reconfiguration in session (reconfigurations so far {})".format(
+                self.reconfigurations))
+            result = self.solver.check()
+            write_result(self.solver, result, self.features, attributes, self.features_as_boolean, out_stream)
+        finally:
+            self.solver.pop()
+        self.reconfigurations += 1
+
+
+def get_session(model, preferences, timeout=0, no_default_preferences=False):
+    """Returns the session of the compiled model for the given options, creating it if needed.
+    The sessions are stored in the compiled model and are therefore dropped with it from the model cache"""
+    sessions = model.setdefault("sessions", {})
+    key = (timeout, no_default_preferences)
+    if key not in sessions:
+        log.info("Creating a new reconfiguration session")
+        sessions[key] = ReconfigurationSession(model["features"], model["contexts"], model["attributes"],
+                                               model["constraints"], preferences, model["features_as_boolean"],
+                                               timeout, no_default_preferences)
+    return sessions[key]
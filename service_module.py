@@ -0,0 +1,130 @@
+"""
+service_module.py: HTTP service answering the HyVarRec requests.
+
+The service exposes the same operations of hyvar-rec.ol but, instead of running
+a new HyVarRec process for every request, it forwards the requests to a pool of
+warm worker processes that have z3 and the ANTLR parser already loaded.
+"""
+import logging as log
+import json
+import multiprocessing
+import threading
+import BaseHTTPServer
+import SocketServer
+
+# modality used to serve every operation of the service
+OPERATIONS = {
+    "/process": "reconfigure",
+    # reconfiguration reusing the solver of the feature model kept by the worker
+    "/process_session": "reconfigure-session",
+    "/validate": "validate",
+    "/explain": "explain",
+    "/check_features": "check-features",
+    "/check_interface": "check-interface"}
+
+
+class RequestError(Exception):
+    """Raised by process_request for a request that can not be accepted (answered with status 400)"""
+    pass
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """HTTP server handling every request in a separate thread.
+    Threads only wait for the workers of the pool that do the actual computation."""
+    daemon_threads = True
+
+
+class HyVarRecRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    # set by serve before starting the server
+    pool = None
+    process_request = None
+
+    # last statistics of the model cache received from every worker
+    cache_stats = {}
+    stats_lock = threading.Lock()
+
+    def get_cache_stats(self):
+        """Returns the sum of the statistics of the model caches of the workers"""
+        with self.stats_lock:
+            out = {"workers": len(self.cache_stats)}
+            for stats in self.cache_stats.values():
+                for i in stats:
+                    if i != "pid":
+                        out[i] = out.get(i, 0) + stats[i]
+        return out
+
+    def send_json(self, code, body):
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_status(self, path):
+        """Answers the requests for the health and the statistics of the service, returns False for the other
+        paths"""
+        if path == "/health":
+            self.send_json(200, "")
+        elif path == "/cache_stats":
+            self.send_json(200, json.dumps(self.get_cache_stats()) + "\n")
+        else:
+            return False
+        return True
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if not self.send_status(path):
+            self.send_json(405, '{"result": "error: method not allowed"}\n')
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if self.send_status(path):
+            return
+        if path not in OPERATIONS:
+            self.send_json(404, '{"result": "error: operation not found"}\n')
+            return
+
+        log.info("Received request for " + path)
+        try:
+            length = int(self.headers.getheader("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            log.warning("Request not in json format: " + unicode(e))
+            self.send_json(400, '{"result": "error: request not in json format"}\n')
+            return
+
+        try:
+            output, stats = self.pool.apply(self.process_request, (OPERATIONS[path], request))
+        except RequestError as e:
+            log.warning("Request not accepted: " + unicode(e))
+            self.send_json(400, json.dumps({"result": "error: " + unicode(e)}) + "\n")
+            return
+        with self.stats_lock:
+            self.cache_stats[stats["pid"]] = stats
+        if output is None:
+            self.send_json(500, '{"result": "error"}\n')
+        else:
+            self.send_json(200, output)
+
+    def log_message(self, format, *args):
+        log.info("%s - %s" % (self.address_string(), format % args))
+
+
+def serve(port, num_of_process, process_request):
+    """Start the service on the given port.
+    The function process_request(modality, request) is run by the workers of the pool and must return the output
+    of HyVarRec for the request as a string (None if the request could not be processed) together with the
+    statistics of the model cache of the worker, or raise RequestError if the request is not acceptable."""
+    log.info("Starting a pool of {} workers".format(num_of_process))
+    HyVarRecRequestHandler.pool = multiprocessing.Pool(max(num_of_process, 1))
+    HyVarRecRequestHandler.process_request = staticmethod(process_request)
+    server = ThreadedHTTPServer(("", port), HyVarRecRequestHandler)
+    log.info("Serving on port {}".format(port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info("Service stopped")
+    finally:
+        server.server_close()
+        HyVarRecRequestHandler.pool.terminate()
@@ -0,0 +1,484 @@
+"""
+Program to measure the performance of HyVarRec on synthetic feature models
+Usage:
+  benchmark.py [-v] [-n <size>] [-s <seed>] <benchmark>
+
+Benchmarks:
+  parser    constraints per second translated by the ANTLR and the fast parser
+  simplify  translation time of long sums of features with the different simplification modalities
+  deep      translation time and size of the SMT-LIB encoding of long chains of and, or, and +
+  parallel  time to compile a feature model with 1, 2, and 4 processes
+  session   latency of reconfigurations with a new solver and with a session for changing context values
+  anytime   results of the reconfiguration with and without the anytime modality for increasing timeouts
+  portfolio time of reconfigurations with the default solver and with portfolios of 2 and 4 solvers
+  grid      time of the grid and box validation with 1, 2, and 4 processes, and of the validation with the
+            projection on the contexts, of a valid and a void feature model
+  filter    context combinations per second checked against the context constraints by the numpy evaluator,
+            the python evaluator, and a new solver for every combination (as done before the evaluator)
+  features  time of the grid, pruning, and backbone checking of the features with 1, 2, and 4 processes, and of
+            the forall checking (only up to size 20), of a feature model with all the features optional in several
+            time instants
+  intervals time of the grid and backbone checking of the features, instant by instant and by time intervals,
+            of a feature model evolving over a long time horizon
+  pruning   time, solver checks by result, and largest level of the speculative pruning check of the features with
+            1 and 2 processes, of a feature model with all the features optional in several time instants
+  static    features settled by the implication graph of the constraints and time of its construction, and time of
+            the grid and backbone checking of the features, of a feature model extended with a tree of mandatory
+            features and features excluded by them
+  forall    time of the forall checking of the features with 1 and 2 processes for increasing sizes of the shards
+            of the optional features, of a feature model with many features dead from a time instant
+"""
+import getopt
+import sys
+import logging
+import os
+import random
+import time
+import StringIO
+import json
+import z3
+
+script_directory = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_directory, ".."))
+
+import SpecificationGrammar.SpecTranslator as SpecTranslator
+import model_module
+import reconfigure_module
+import portfolio_module
+import validate_module
+import check_features_module
+import implication_module
+
+__author__ = "Jacopo Mauro"
+__copyright__ = "Copyright 2016, Jacopo Mauro"
+__license__ = "ISC"
+__version__ = "0.2"
+__maintainer__ = "Jacopo Mauro"
+__email__ = "mauro.jacopo@gmail.com"
+__status__ = "Prototype"
+
+
+def generate_constraints(size):
+    """Generates constraints with the shapes typically used to encode a feature model"""
+    constraints = []
+    for i in range(1, size):
+        parent = random.randint(0, i - 1)
+        r = random.randint(0, 3)
+        if r == 0:
+            constraints.append("feature[f{}] = 1 impl feature[f{}] = 1".format(i, parent))
+        elif r == 1:
+            constraints.append("(feature[f{}] = 1 and context[c{}] > {}) impl feature[f{}] = 1".format(
+                i, random.randint(0, 3), random.randint(0, 10), parent))
+        elif r == 2:
+            constraints.append("feature[f{}] = 1 impl (attribute[a{}] >= {} and attribute[a{}] <= {})".format(
+                i, i, random.randint(0, 10), i, random.randint(10, 100)))
+        else:
+            siblings = random.sample(range(size), 3)
+            constraints.append("feature[f{}] = 1 impl feature[f{}] + feature[f{}] + feature[f{}] = 1".format(
+                i, *siblings))
+    return constraints
+
+
+def generate_configuration(size):
+    """Generates a random configuration for the feature model of generate_model"""
+    return {
+        "context_values": [{"id": "context[c{}]".format(i), "value": random.randint(0, 10)} for i in range(4)],
+        "attribute_values": [{"id": "attribute[a{}]".format(i), "value": random.randint(0, 100)}
+                             for i in range(1, size, 10)],
+        "selectedFeatures": ["feature[f{}]".format(i) for i in range(size) if random.randint(0, 1)]}
+
+
+def generate_model(size):
+    """Generates an input for HyVarRec with the constraints of generate_constraints"""
+    return {
+        "attributes": [{"id": "attribute[a{}]".format(i), "min": 0, "max": 100, "featureId": "feature[f{}]".format(i)}
+                       for i in range(1, size, 10)],
+        "contexts": [{"id": "context[c{}]".format(i), "min": 0, "max": 10} for i in range(4)],
+        "configuration": generate_configuration(size),
+        "constraints": ["feature[f0] = 1"] + generate_constraints(size),
+        "preferences": []}
+
+
+def benchmark_parser(size):
+    constraints = generate_constraints(size)
+    for parser in SpecTranslator.PARSERS:
+        start_time = time.time()
+        for c in constraints:
+            SpecTranslator.translate_constraint(c, {}, False, parser)
+        elapsed_time = time.time() - start_time
+        print parser + "," + unicode(len(constraints)) + "," + unicode(elapsed_time) + "," + \
+            unicode(len(constraints) / elapsed_time)
+
+
+def benchmark_simplify(size):
+    constraints = generate_constraints(size)
+    # long constraints of the form feature[f0] + ... + feature[fn] <= 3
+    constraints.extend([" + ".join(["feature[f{}]".format(j) for j in range(i)]) + " <= 3"
+                        for i in range(10, size / 10, 10)])
+    times = {}
+    for simplify in SpecTranslator.SIMPLIFY_MODALITIES:
+        start_time = time.time()
+        for c in constraints:
+            SpecTranslator.translate_constraint(c, {}, False, "fast", simplify)
+        times[simplify] = time.time() - start_time
+        print simplify + "," + unicode(len(constraints)) + "," + unicode(times[simplify]) + "," + \
+            unicode(times["node"] - times[simplify])
+
+
+def term_depth(formula):
+    """Returns the depth of the z3 term (iteratively, deep terms exceed the recursion limit)"""
+    depth = 0
+    level = [formula]
+    while level:
+        depth += 1
+        level = [j for i in level for j in i.children()]
+    return depth
+
+
+def benchmark_deep(size):
+    # cross-tree constraints of the form f0 = 1 and ... and fn = 1, f0 = 1 or ... or fn = 1, f0 + ... + fn <= n/2
+    # every constraint has its own features since the SMT-LIB printer uses let for the shared terms
+    constraints = []
+    for i in range(size / 10, size + 1, size / 10):
+        for op in [" and ", " or ", " + "]:
+            features = ["feature[f{}_{}]".format(len(constraints), j) for j in range(i)]
+            if op == " + ":
+                constraints.append(op.join(features) + " <= " + unicode(i / 2))
+            else:
+                constraints.append(op.join([j + " = 1" for j in features]))
+    for parser in SpecTranslator.PARSERS:
+        start_time = time.time()
+        formulas = [SpecTranslator.translate_constraint(c, {}, False, parser)["formula"] for c in constraints]
+        elapsed_time = time.time() - start_time
+        start_time = time.time()
+        smt = []
+        for f in formulas:
+            declarations, assertions = model_module.to_smt2_assertions([f])
+            smt.append("\n".join(declarations) + "\n" + assertions)
+        for f in smt:
+            z3.parse_smt2_string(f)
+        smt_time = time.time() - start_time
+        print parser + "," + unicode(len(constraints)) + "," + unicode(elapsed_time) + "," + \
+            unicode(max([term_depth(f) for f in formulas])) + "," + unicode(sum([len(f) for f in smt])) + "," + \
+            unicode(smt_time)
+
+
+def benchmark_parallel(size):
+    data = {"attributes": [], "contexts": [], "configuration": {},
+            "constraints": generate_constraints(size), "preferences": []}
+    for num_of_process in [1, 2, 4]:
+        for parser in SpecTranslator.PARSERS:
+            start_time = time.time()
+            model_module.compile_model(data, False, num_of_process, parser)
+            print parser + "," + unicode(num_of_process) + "," + unicode(len(data["constraints"])) + "," + \
+                unicode(time.time() - start_time)
+
+
+def benchmark_session(size):
+    data = generate_model(size)
+    model = model_module.get_compiled_model(data, False)
+    preferences = model_module.get_preferences(model)
+    configurations = [generate_configuration(size) for _ in range(20)]
+    times = {}
+    for modality in ["cold", "session"]:
+        start_time = time.time()
+        for configuration in configurations:
+            data["configuration"] = configuration
+            initial_features, contexts, attributes = model_module.configure_model(model, data)
+            if modality == "cold":
+                reconfigure_module.run_reconfigure(model["features"], initial_features, contexts, attributes,
+                                                   model["constraints"], preferences, False, 0, False,
+                                                   StringIO.StringIO())
+            else:
+                reconfigure_module.get_session(model, preferences).reconfigure(
+                    initial_features, contexts, attributes, StringIO.StringIO())
+        times[modality] = time.time() - start_time
+        print modality + "," + unicode(len(configurations)) + "," + unicode(times[modality]) + "," + \
+            unicode(times[modality] / len(configurations))
+
+
+def benchmark_anytime(size):
+    data = generate_model(size)
+    model = model_module.get_compiled_model(data, False)
+    preferences = model_module.get_preferences(model)
+    initial_features, contexts, attributes = model_module.configure_model(model, data)
+    for timeout in [100, 1000, 10000]:
+        for modality in ["optimize", "anytime"]:
+            out_stream = StringIO.StringIO()
+            start_time = time.time()
+            if modality == "optimize":
+                reconfigure_module.run_reconfigure(model["features"], initial_features, contexts, attributes,
+                                                   model["constraints"], preferences, False, timeout, False,
+                                                   out_stream)
+            else:
+                reconfigure_module.run_reconfigure_anytime(model["features"], initial_features, contexts, attributes,
+                                                           model["constraints"], preferences, False, timeout, False,
+                                                           out_stream)
+            elapsed_time = time.time() - start_time
+            out = json.loads(out_stream.getvalue())
+            print modality + "," + unicode(timeout) + "," + unicode(elapsed_time) + "," + out["result"] + "," + \
+                unicode(out.get("optimal", out["result"] == "sat")) + "," + unicode(out.get("objectives_completed", ""))
+
+
+def benchmark_portfolio(size):
+    models = []
+    for _ in range(5):
+        data = generate_model(size)
+        model = model_module.get_compiled_model(data, False)
+        model_module.get_preferences(model)
+        models.append((data, model))
+    for portfolio in [1, 2, 4]:
+        start_time = time.time()
+        for data, model in models:
+
+            def run(out_stream, options):
+                initial_features, contexts, attributes = model_module.configure_model(model, data)
+                reconfigure_module.run_reconfigure(model["features"], initial_features, contexts, attributes,
+                                                   model["constraints"], model["preferences"], False, 0, False,
+                                                   out_stream)
+
+            if portfolio == 1:
+                run(StringIO.StringIO(), {})
+            else:
+                portfolio_module.run_portfolio(portfolio, run, StringIO.StringIO())
+        print unicode(portfolio) + "," + unicode(len(models)) + "," + unicode(time.time() - start_time)
+    for i in sorted(portfolio_module.STATS.keys()):
+        print i + "," + unicode(portfolio_module.STATS[i]["wins"]) + "," + unicode(portfolio_module.STATS[i]["runs"])
+
+
+def benchmark_grid(size):
+    data = generate_model(size)
+    for void in [False, True]:
+        if void:
+            # void only for the last context combinations
+            data["constraints"].append(
+                "(context[c0] = 10 and context[c1] = 10 and context[c2] = 10 and context[c3] >= 5) impl feature[f0] = 0")
+        model = model_module.get_compiled_model(data, False)
+        for modality in ["grid", "box", "projection"]:
+            for num_of_process in [1] if modality == "projection" else [1, 2, 4]:
+                out_stream = StringIO.StringIO()
+                start_time = time.time()
+                if modality == "grid":
+                    validate_module.run_validate_grid_search(model["features"], set(), model["contexts"],
+                                                             model["attributes"], model["constraints"], [], [], False,
+                                                             False, out_stream, num_of_process)
+                elif modality == "projection":
+                    validate_module.run_validate_projection(validate_module.get_context_projection(model),
+                                                            model["contexts"], [], out_stream)
+                else:
+                    validate_module.run_validate_box(model["features"], model["contexts"], model["attributes"],
+                                                     model["constraints"], [], False, out_stream, num_of_process)
+                print modality + "," + unicode(void) + "," + unicode(num_of_process) + "," + \
+                    unicode(time.time() - start_time) + "," + json.loads(out_stream.getvalue())["result"]
+
+
+def benchmark_filter(size):
+    contexts = {"c{}".format(i): {"min": 0, "max": 9} for i in range(6)}
+    context_constraints, _ = model_module.translate_formulas(
+        ["context[c{}] + context[c{}] <= {} impl context[c{}] != {}".format(
+            random.randint(0, 5), random.randint(0, 5), random.randint(0, 18), random.randint(0, 5),
+            random.randint(0, 9)) for _ in range(size / 100)] +
+        ["oneonly[context[c0] > 3, context[c1] < 2, context[c2] = 5] or context[c3] * 2 > context[c4] - 3"], False)
+    grid = validate_module.get_grid(contexts)
+    names = grid["names"]
+    for backend in ["numpy", "python", "solver"]:
+        if backend == "numpy" and validate_module.numpy is None:
+            continue
+        total = {"numpy": grid["total"], "python": grid["total"] / 10, "solver": 1000}[backend]
+        start_time = time.time()
+        allowed = 0
+        if backend == "solver":
+            for position in range(total):
+                product = validate_module.get_product(grid, position)
+                solver = z3.Solver()
+                for j in range(len(product)):
+                    solver.add(product[j] == z3.Int(names[j]))
+                solver.add(context_constraints)
+                if solver.check() == z3.sat:
+                    allowed += 1
+        else:
+            numpy = validate_module.numpy
+            if backend == "python":
+                validate_module.numpy = None
+            evaluator = validate_module.compile_context_constraints(context_constraints, names)
+            for i in range(0, total, 1000):
+                allowed += len(validate_module.get_allowed_positions(grid, evaluator, i, min(i + 1000, total)))
+            validate_module.numpy = numpy
+        elapsed_time = time.time() - start_time
+        print backend + "," + unicode(total) + "," + unicode(allowed) + "," + unicode(elapsed_time) + "," + \
+            unicode(total / elapsed_time)
+
+
+def benchmark_features(size):
+    data = generate_model(size)
+    # the optional features are checked in all the time instants of a new time context
+    instants = max(size / 100, 2)
+    data["contexts"].append({"id": "context[time]", "min": 0, "max": instants - 1})
+    data["optional_features"] = {"f{}".format(i): [[0, instants - 1]] for i in range(size)}
+    data["time_context"] = "time"
+    data["constraints"].append("context[time] >= {} impl feature[f10] = 0".format(instants / 2))
+    model = model_module.get_compiled_model(data, False)
+    runs = {"grid": check_features_module.run_feature_analysis_grid_search,
+            "pruning": check_features_module.run_feature_analysis_with_optimization,
+            "backbone": check_features_module.run_feature_analysis_backbone,
+            "forall": check_features_module.run_feature_analysis_forall}
+    # the quantified formula of the forall modality is not solved in minutes with more than few tens of features
+    for modality in ["grid", "pruning", "backbone"] + (["forall"] if size <= 20 else []):
+        for num_of_process in [1] if modality == "forall" else [1, 2, 4]:
+            out_stream = StringIO.StringIO()
+            start_time = time.time()
+            args = [model["features"], False, model["contexts"], model["attributes"], model["constraints"],
+                    model["optional_features"], False, out_stream, model["time_context"]]
+            runs[modality](*(args if modality == "forall" else args + [num_of_process]))
+            out = json.loads(out_stream.getvalue())
+            print modality + "," + unicode(num_of_process) + "," + unicode(instants) + "," + \
+                unicode(time.time() - start_time) + "," + unicode(len(out["dead_features"])) + "," + \
+                unicode(len(out["false_optionals"]))
+
+
+def benchmark_intervals(size):
+    data = generate_model(size)
+    # few constraints depending on the time context, over a horizon of size time instants
+    data["contexts"].append({"id": "context[time]", "min": 0, "max": size - 1})
+    data["optional_features"] = {"f{}".format(i): [[random.randint(0, size / 2), size - 1]] for i in range(0, size, 10)}
+    data["time_context"] = "time"
+    for i in range(10, size, size / 5):
+        data["constraints"].append("context[time] >= {} impl feature[f{}] = 0".format(random.randint(0, size - 1), i))
+    model = model_module.get_compiled_model(data, False)
+    for modality, run in [("grid", check_features_module.run_feature_analysis_grid_search),
+                          ("backbone", check_features_module.run_feature_analysis_backbone)]:
+        for time_intervals in [False, True]:
+            out_stream = StringIO.StringIO()
+            start_time = time.time()
+            run(model["features"], False, model["contexts"], model["attributes"], model["constraints"],
+                model["optional_features"], False, out_stream, model["time_context"], 1, time_intervals)
+            print modality + "," + unicode(time_intervals) + "," + unicode(time.time() - start_time) + "," + \
+                unicode(len(out_stream.getvalue()))
+
+
+def benchmark_pruning(size):
+    data = generate_model(size)
+    instants = max(size / 100, 2)
+    data["contexts"].append({"id": "context[time]", "min": 0, "max": instants - 1})
+    data["optional_features"] = {"f{}".format(i): [[0, instants - 1]] for i in range(size)}
+    data["time_context"] = "time"
+    # features dead or false optional from a random time instant
+    for i in range(1, size, 7):
+        data["constraints"].append("context[time] >= {} impl feature[f{}] = {}".format(
+            random.randint(0, instants - 1), i, i % 2))
+    model = model_module.get_compiled_model(data, False)
+    for num_of_process in [1, 2]:
+        out_stream = StringIO.StringIO()
+        start_time = time.time()
+        check_features_module.run_feature_analysis_with_optimization(
+            model["features"], False, model["contexts"], model["attributes"], model["constraints"],
+            model["optional_features"], False, out_stream, model["time_context"], num_of_process, False, True)
+        out = json.loads(out_stream.getvalue())
+        attempts = [j for i in out["pruning_trace"] for j in i["attempts"]]
+        print unicode(num_of_process) + "," + unicode(time.time() - start_time) + "," + \
+            ",".join([unicode(len([i for i in attempts if i["result"] == j])) for j in ["sat", "unsat", "unknown"]]) + \
+            "," + unicode(max([i["level"] for i in attempts])) + "," + unicode(len(out["dead_features"])) + "," + \
+            unicode(len(out["false_optionals"]))
+
+
+def benchmark_static(size):
+    data = generate_model(size)
+    instants = max(size / 100, 2)
+    data["contexts"].append({"id": "context[time]", "min": 0, "max": instants - 1})
+    data["time_context"] = "time"
+    # a tree of mandatory features g with features excluded by them, an optional g feature for every f feature
+    data["constraints"].append("feature[g0] = 1")
+    for i in range(1, size, 3):
+        parent = random.choice([0] + range(1, i, 3))
+        data["constraints"].append("feature[g{}] = 1 impl feature[g{}] = 1".format(parent, i))
+        data["constraints"].append("feature[g{}] + feature[g{}] <= 1".format(i, i + 1))
+        data["constraints"].append("feature[g{}] = 1 impl feature[g{}] = 1".format(i + 2, random.randint(0, i)))
+    data["optional_features"] = {"{}{}".format(j, i): [[0, instants - 1]] for i in range(size) for j in "fg"}
+    model = model_module.get_compiled_model(data, False)
+    start_time = time.time()
+    dead, selected = implication_module.get_settled_features(model["features"], model["constraints"],
+                                                             set(model["optional_features"].keys()))
+    print "static," + unicode(time.time() - start_time) + "," + unicode(len(dead)) + "," + unicode(len(selected))
+    for modality, run in [("grid", check_features_module.run_feature_analysis_grid_search),
+                          ("backbone", check_features_module.run_feature_analysis_backbone)]:
+        out_stream = StringIO.StringIO()
+        start_time = time.time()
+        run(model["features"], False, model["contexts"], model["attributes"], model["constraints"],
+            model["optional_features"], False, out_stream, model["time_context"])
+        out = json.loads(out_stream.getvalue())
+        print modality + "," + unicode(time.time() - start_time) + "," + unicode(len(out["dead_features"])) + "," + \
+            unicode(len(out["false_optionals"]))
+
+
+def benchmark_forall(size):
+    data = generate_model(size)
+    data["contexts"].append({"id": "context[time]", "min": 0, "max": 3})
+    data["time_context"] = "time"
+    # features dead from a random time instant
+    for i in range(1, size, 3):
+        data["constraints"].append("context[time] >= {} impl feature[f{}] = 0".format(random.randint(0, 3), i))
+    model = model_module.get_compiled_model(data, False)
+    # the optional features not used by the constraints would be all dead
+    optional_features = {i: [[0, 3]] for i in model["features"]}
+    # a single shard is not solved in minutes with more than few tens of features
+    for shard_size in sorted(set([i for i in [1, 2, 5, 10, 20] if i < size] + ([size] if size <= 20 else []))):
+        for num_of_process in [1, 2]:
+            out_stream = StringIO.StringIO()
+            start_time = time.time()
+            check_features_module.run_feature_analysis_forall(
+                model["features"], False, dict(model["contexts"]), model["attributes"], model["constraints"],
+                optional_features, False, out_stream, model["time_context"], num_of_process, shard_size)
+            out = json.loads(out_stream.getvalue())
+            print unicode(shard_size) + "," + unicode(num_of_process) + "," + unicode(time.time() - start_time) + \
+                "," + unicode(len(out["dead_features"])) + "," + unicode(len(out["false_optionals"]))
+
+
+BENCHMARKS = {
+    "parser": benchmark_parser,
+    "simplify": benchmark_simplify,
+    "deep": benchmark_deep,
+    "parallel": benchmark_parallel,
+    "session": benchmark_session,
+    "anytime": benchmark_anytime,
+    "portfolio": benchmark_portfolio,
+    "grid": benchmark_grid,
+    "filter": benchmark_filter,
+    "features": benchmark_features,
+    "intervals": benchmark_intervals,
+    "pruning": benchmark_pruning,
+    "static": benchmark_static,
+    "forall": benchmark_forall}
+
+
+def main(argv):
+
+    size = 1000
+    seed = 0
+    try:
+        opts, args = getopt.getopt(argv, "hvn:s:", ["help","verbose"])
+    except getopt.GetoptError as err:
+        print str(err)
+        print(__doc__)
+        sys.exit(1)
+    for opt, arg in opts:
+        if opt in ('-h', "--help"):
+            print(__doc__)
+            sys.exit()
+        elif opt in ("-v", "--verbose"):
+            logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.DEBUG)
+            logging.info("Verbose output.")
+        elif opt == "-n":
+            size = int(arg)
+        elif opt == "-s":
+            seed = int(arg)
+
+    if len(args) != 1 or args[0] not in BENCHMARKS:
+        print "one benchmark among " + ", ".join(sorted(BENCHMARKS.keys())) + " is required"
+        print(__doc__)
+        sys.exit(1)
+
+    random.seed(seed)
+    BENCHMARKS[args[0]](size)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
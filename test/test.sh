@@ -27,6 +27,48 @@ python ../hyvar-rec.py --features-as-boolean --check-features --check-features-m
 python ../hyvar-rec.py --features-as-boolean --check-features --check-features-modality grid sat_bool.json >> $LOG_FILE
 python ../hyvar-rec.py --features-as-boolean --check-features --check-features-modality pruning sat_bool.json >> $LOG_FILE
 python ../hyvar-rec.py --check-features --check-features-modality forall --features-as-boolean test5_forall_check.json >> $LOG_FILE
+python ../hyvar-rec.py --parser fast sat.json >> $LOG_FILE
+python ../hyvar-rec.py --parser fast --explain unsat.json >> $LOG_FILE
+python ../hyvar-rec.py --parser fast --check-features --check-features-modality grid evolution_sat.json >> $LOG_FILE
+python ../hyvar-rec.py --batch batch_sat.jsonl --num-of-process 2 sat.json | sed 's/"time": [0-9.e-]*/"time": 0/' >> $LOG_FILE
+python ../hyvar-rec.py --batch batch_sat.jsonl --session sat.json | sed 's/"time": [0-9.e-]*/"time": 0/' >> $LOG_FILE
+python ../hyvar-rec.py --anytime sat.json >> $LOG_FILE
+python ../hyvar-rec.py --validate --portfolio 3 sat.json >> $LOG_FILE
+python ../hyvar-rec.py --validate --validate-modality grid --num-of-process 2 unsat.json >> $LOG_FILE
+python ../hyvar-rec.py --validate --validate-modality grid --grid-order shuffled unsat.json >> $LOG_FILE
+python ../hyvar-rec.py --validate --validate-modality box sat.json >> $LOG_FILE
+python ../hyvar-rec.py --validate --validate-modality box --num-of-process 2 unsat.json >> $LOG_FILE
+python ../hyvar-rec.py --validate --validate-modality enumerate sat.json >> $LOG_FILE
+python ../hyvar-rec.py --validate --validate-modality enumerate unsat.json >> $LOG_FILE
+python ../hyvar-rec.py --validate --validate-modality projection sat.json >> $LOG_FILE
+python ../hyvar-rec.py --validate --validate-modality projection unsat.json >> $LOG_FILE
+python ../hyvar-rec.py --validate --validate-modality grid context_constraints.json >> $LOG_FILE
+python ../hyvar-rec.py --validate --validate-modality grid --num-of-process 2 context_constraints.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality grid --num-of-process 2 evolution_sat.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality pruning --num-of-process 2 evolution_sat.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality backbone evolution_sat.json >> $LOG_FILE
+python ../hyvar-rec.py --features-as-boolean --check-features --check-features-modality backbone sat_bool.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality backbone --features-as-boolean test5_forall_check.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality grid --time-intervals evolution_sat.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality backbone --time-intervals --num-of-process 2 evolution_sat.json >> $LOG_FILE
+python ../hyvar-rec.py --features-as-boolean --check-features --check-features-modality pruning --time-intervals sat_bool.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality forall --num-of-process 2 evolution_sat.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality forall --forall-shard-size 1 --features-as-boolean test5_forall_check.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality pruning --pruning-trace evolution_sat.json | sed 's/"seconds": [0-9.e-]*/"seconds": 0/g' >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality grid static_check.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality pruning --num-of-process 2 static_check.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality backbone --time-intervals static_check.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality forall static_check.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality grid evolution_bounds.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality grid --time-intervals evolution_bounds.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality backbone --time-intervals evolution_bounds.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality pruning --time-intervals evolution_bounds.json >> $LOG_FILE
+python ../hyvar-rec.py --check-interface interface.json --context-projection unsat.json >> $LOG_FILE
+python ../hyvar-rec.py --check-features --check-features-modality forall --context-projection static_check.json >> $LOG_FILE
+# the projection of a wide context range must not enumerate the configurations
+timeout 20 python ../hyvar-rec.py --validate --validate-modality projection projection_wide.json >> $LOG_FILE
+python test_translation.py -n 50 >> $LOG_FILE
+python test_portfolio.py >> $LOG_FILE
 diff $LOG_FILE output.txt
 rm $LOG_FILE
 
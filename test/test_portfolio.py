@@ -0,0 +1,79 @@
+"""
+Program to check that a member of the portfolio whose timeout expires does not win the portfolio.
+The reconfiguration of sat.json is run by a portfolio where a member has a timeout of 1 millisecond:
+the answer of the portfolio must be the configuration found by the member without timeout.
+Usage:
+  test_portfolio.py [-v] [-n <number of runs>]
+"""
+import getopt
+import sys
+import logging
+import os
+import imp
+import json
+import StringIO
+
+script_directory = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_directory, ".."))
+
+import model_module
+import portfolio_module
+
+hyvarrec = imp.load_source("hyvarrec", os.path.join(script_directory, "..", "hyvar-rec.py"))
+
+__author__ = "Jacopo Mauro"
+__copyright__ = "Copyright 2016, Jacopo Mauro"
+__license__ = "ISC"
+__version__ = "0.2"
+__maintainer__ = "Jacopo Mauro"
+__email__ = "mauro.jacopo@gmail.com"
+__status__ = "Prototype"
+
+
+def main(argv):
+    runs = 5
+    try:
+        opts, args = getopt.getopt(argv, "hvn:", ["help", "verbose", "runs="])
+    except getopt.GetoptError as err:
+        print str(err)
+        print __doc__
+        sys.exit(1)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print __doc__
+            sys.exit()
+        elif opt in ("-v", "--verbose"):
+            logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.DEBUG)
+        elif opt in ("-n", "--runs"):
+            runs = int(arg)
+
+    with open(os.path.join(script_directory, "sat.json")) as f:
+        data = json.load(f)
+    model_module.MODEL_CACHE = model_module.ModelCache(1, 0)
+    model = model_module.get_compiled_model(data, False)
+    model_module.get_preferences(model)
+
+    def run(member_stream, member_options):
+        kwargs = {"num_of_process": 1}
+        kwargs.update(member_options)
+        hyvarrec.run_hyvarrec(data, "reconfigure", member_stream, **kwargs)
+
+    errors = 0
+    out_stream = StringIO.StringIO()
+    run(out_stream, {"timeout": 1})
+    if portfolio_module.is_definitive(out_stream.getvalue()):
+        logging.error("The answer after the timeout is definitive: " + out_stream.getvalue())
+        errors += 1
+
+    portfolio_module.CONFIGURATIONS = [("tiny-timeout", {}, {"timeout": 1}), ("default", {}, {})]
+    for _ in range(runs):
+        out_stream = StringIO.StringIO()
+        portfolio_module.run_portfolio(2, run, out_stream)
+        if json.loads(out_stream.getvalue())["result"] != "sat":
+            logging.error("Wrong answer of the portfolio: " + out_stream.getvalue())
+            errors += 1
+    print "Portfolio," + unicode(runs) + ",Errors," + unicode(errors)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,216 @@
+"""
+Program to check that the fast parser and the different simplification modalities produce formulas
+equivalent to the ones obtained by the ANTLR parser simplifying every node.
+The constraints and preferences of the json files in the test directory and randomly
+generated constraints are translated with all the variants, and with the parallel translation.
+Usage:
+  test_translation.py [-v] [-n <number of random constraints>] [-s <seed>]
+"""
+import getopt
+import sys
+import logging
+import os
+import json
+import random
+import z3
+
+script_directory = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_directory, ".."))
+
+import SpecificationGrammar.SpecTranslator as SpecTranslator
+import model_module
+
+__author__ = "Jacopo Mauro"
+__copyright__ = "Copyright 2016, Jacopo Mauro"
+__license__ = "ISC"
+__version__ = "0.2"
+__maintainer__ = "Jacopo Mauro"
+__email__ = "mauro.jacopo@gmail.com"
+__status__ = "Prototype"
+
+
+def read_json(json_file):
+    json_data = open(json_file)
+    data = json.load(json_data)
+    json_data.close()
+    return data
+
+
+def random_constraint(depth, features_as_boolean):
+    """Generates a random string of the constraint grammar"""
+
+    def term(d):
+        r = random.randint(0, 4 if d > 0 else 3)
+        if r == 0:
+            return str(random.randint(-3, 10))
+        elif r == 1:
+            return "context[c" + str(random.randint(0, 3)) + "]"
+        elif r == 2:
+            return "feature[f" + str(random.randint(0, 5)) + "]"
+        elif r == 3:
+            return "attribute[a-" + str(random.randint(0, 3)) + "]"
+        return "(" + b_expr(d - 1) + ")"
+
+    def expr(d):
+        s = term(d)
+        for _ in range(random.randint(0, 3)):
+            s += " " + random.choice(["+", "-", "*"]) + " " + term(d)
+        return s
+
+    def b_factor(d):
+        r = random.randint(0, 5 if d > 0 else 4)
+        if r == 0:
+            return random.choice(["true", "false"])
+        elif r == 1 and features_as_boolean:
+            return "feature[f" + str(random.randint(0, 5)) + "]"
+        elif r == 5:
+            return "oneonly[" + ", ".join([b_expr(d - 1) for _ in range(random.randint(1, 3))]) + "]"
+        return expr(d) + " " + random.choice(["<=", "=", ">=", "<", ">", "!="]) + " " + expr(d)
+
+    def b_expr(d):
+        s = ("not " if random.randint(0, 3) == 0 else "") + b_factor(d)
+        for _ in range(random.randint(0, 3)):
+            s += " " + random.choice(["and", "or", "impl", "iff", "xor"]) + " " + \
+                ("not " if random.randint(0, 3) == 0 else "") + b_factor(d)
+        return s
+
+    return b_expr(depth)
+
+
+def equivalent(f1, f2):
+    """Returns True if the two formulas are equivalent.
+    Structurally different formulas may be obtained also by the same parser since z3.simplify orders the terms
+    according to their internal identifiers"""
+    solver = z3.Solver()
+    solver.add(f1 != f2)
+    return solver.check() == z3.unsat
+
+
+def translate(function, text, data, features_as_boolean, parser, simplify):
+    try:
+        return function(text, data, features_as_boolean, parser, simplify)
+    except Exception as e:
+        return e
+
+
+# pairs (parser, simplify modality) compared against the ANTLR parser simplifying every node
+VARIANTS = [("fast", "node"), ("fast", "constraint"), ("fast", "none"), ("antlr", "none")]
+
+
+def compare(function, text, data, features_as_boolean):
+    """Returns True if all the variants agree on the given string"""
+    reference = translate(function, text, data, features_as_boolean, "antlr", "node")
+    for parser, simplify in VARIANTS:
+        result = translate(function, text, data, features_as_boolean, parser, simplify)
+        if isinstance(reference, Exception) or isinstance(result, Exception):
+            if isinstance(reference, Exception) and isinstance(result, Exception):
+                continue
+            logging.error("Only one variant failed on " + text + " (" + parser + ", " + simplify + "): " +
+                          unicode(reference) + " / " + unicode(result))
+            return False
+        for i in ["contexts", "features", "attributes"]:
+            if reference[i] != result[i]:
+                logging.error("Different " + i + " for " + text + " (" + parser + ", " + simplify + ")")
+                return False
+        if not reference["formula"].eq(result["formula"]) and \
+                not equivalent(reference["formula"], result["formula"]):
+            logging.error("Different formula for " + text + " (" + parser + ", " + simplify + "): " +
+                          unicode(reference["formula"]) + " / " + unicode(result["formula"]))
+            return False
+    return True
+
+
+def compare_parallel(texts, features_as_boolean, preferences):
+    """Returns the number of formulas translated differently in parallel.
+    A failure of z3 reading back its own SMTLIB is a known limitation of the round-trip and is only reported"""
+    serial, serial_features = model_module.translate_formulas(
+        texts, features_as_boolean, 1, "fast", "node", preferences)
+    try:
+        parallel, parallel_features = model_module.translate_formulas(
+            texts, features_as_boolean, 2, "fast", "node", preferences)
+    except z3.Z3Exception as e:
+        logging.warning("SMTLIB round-trip of the parallel translation failed (known limitation): " + unicode(e))
+        return 0
+    errors = 0
+    if serial_features != parallel_features:
+        logging.error("Different features in parallel")
+        errors += 1
+    for i in range(len(texts)):
+        if not serial[i].eq(parallel[i]) and not equivalent(serial[i], parallel[i]):
+            logging.error("Different formula in parallel for " + texts[i] + ": " +
+                          unicode(serial[i]) + " / " + unicode(parallel[i]))
+            errors += 1
+    return errors
+
+
+def main(argv):
+
+    num = 200
+    seed = 0
+    try:
+        opts, args = getopt.getopt(argv, "hvn:s:", ["help","verbose"])
+    except getopt.GetoptError as err:
+        print str(err)
+        print(__doc__)
+        sys.exit(1)
+    for opt, arg in opts:
+        if opt in ('-h', "--help"):
+            print(__doc__)
+            sys.exit()
+        elif opt in ("-v", "--verbose"):
+            logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.DEBUG)
+            logging.info("Verbose output.")
+        elif opt == "-n":
+            num = int(arg)
+        elif opt == "-s":
+            seed = int(arg)
+
+    random.seed(seed)
+    checked = 0
+    errors = 0
+
+    jsons = sorted([f for f in os.listdir(script_directory) if f[-5:] == ".json"])
+    for i in jsons:
+        logging.debug("Processing " + i)
+        data = read_json(os.path.join(script_directory, i))
+        for features_as_boolean in [False, True]:
+            for c in data.get("constraints", []) + data.get("context_constraints", []):
+                checked += 1
+                if not compare(SpecTranslator.translate_constraint, c, data, features_as_boolean):
+                    errors += 1
+            for c in data.get("preferences", []):
+                checked += 1
+                if not compare(SpecTranslator.translate_preference, c, data, features_as_boolean):
+                    errors += 1
+
+    # valid random constraints and preferences, used to check the parallel translation
+    texts = {(False, False): [], (False, True): [], (True, False): [], (True, True): []}
+    for i in range(num):
+        features_as_boolean = i % 2 == 0
+        c = random_constraint(random.randint(0, 3), features_as_boolean)
+        checked += 1
+        if not compare(SpecTranslator.translate_constraint, c, {}, features_as_boolean):
+            errors += 1
+        elif not isinstance(translate(SpecTranslator.translate_constraint, c, {}, features_as_boolean,
+                                      "fast", "node"), Exception):
+            texts[(features_as_boolean, False)].append(c)
+        checked += 1
+        if i % 10 == 0:
+            c = random.choice(["min", "max"]) + "(attribute[a-" + str(random.randint(0, 3)) + "])"
+        if not compare(SpecTranslator.translate_preference, c, {}, features_as_boolean):
+            errors += 1
+        elif not isinstance(translate(SpecTranslator.translate_preference, c, {}, features_as_boolean,
+                                      "fast", "node"), Exception):
+            texts[(features_as_boolean, True)].append(c)
+
+    for features_as_boolean, preferences in sorted(texts.keys()):
+        if texts[(features_as_boolean, preferences)]:
+            checked += 1
+            errors += compare_parallel(texts[(features_as_boolean, preferences)], features_as_boolean, preferences)
+
+    print "Checked," + unicode(checked) + ",Errors," + unicode(errors)
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
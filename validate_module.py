@@ -1,7 +1,111 @@
+"""
+validate_module.py: validation of the feature model, i.e., check that the feature model is not void
+for every context allowed by the context constraints.
+
+The grid search enumerates the context combinations lazily: the combinations are numbered in the order of
+itertools.product and the combination in a given position of the search is computed from its number.
+In the shuffled order the positions are mapped to the numbers by a permutation x -> a * x mod n.
+The grid search can be performed by a pool of processes. The positions are split into shards of consecutive
+positions, every worker keeps its own incremental solver for the shards it receives.
+The search can save in a checkpoint file the position reached, to resume an interrupted search.
+The context constraints are compiled into a python function evaluated on the combinations of a shard at once,
+on numpy arrays if numpy is available. The combinations not allowed by the context constraints are skipped
+before checking the feature model.
+
+The box search splits the box of the context values into sub-boxes. A configuration valid for a context of the
+sub-box (witness) is searched, then an existential check looks for a context of the sub-box where the witness is not
+valid. If there is none the whole sub-box is proven valid, otherwise the sub-box is split in two.
+
+The enumeration of the void contexts finds a void context with the formula with quantifiers, extends it to a box
+of void contexts with quantifier free checks, and blocks the box before searching the next void context.
+
+The projection of the feature model on the contexts is a quantifier free formula true for the contexts having a
+configuration. It is computed eliminating the features and the attributes with the quantifier elimination tactics
+of z3. If the tactics fail or time out, it is computed by quantifier free checks: a configuration valid for a
+context not yet covered is found, and the contexts where the configuration is valid, obtained replacing the values
+of the configuration in the feature model, are added to the projection. The projection is stored in the compiled model, where the
+interface check and the forall check of the features also find it (option --context-projection).
+"""
 import logging as log
+import os
+import time
+import hashlib
+import fractions
 import z3
 import json
-import itertools
+import multiprocessing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# set by run_validate_grid_search before forking the workers
+GRID = {}
+
+# seconds between two checkpoints of the grid search
+CHECKPOINT_INTERVAL = 10
+
+# size of the shards of the serial grid search
+SHARD_SIZE = 256
+
+# operators of the context constraints supported by the evaluator, with the python operator used to evaluate them
+EVALUATOR_OPERATORS = {
+    z3.Z3_OP_EQ: "==",
+    z3.Z3_OP_IFF: "==",
+    z3.Z3_OP_XOR: "!=",
+    z3.Z3_OP_LE: "<=",
+    z3.Z3_OP_LT: "<",
+    z3.Z3_OP_GE: ">=",
+    z3.Z3_OP_GT: ">",
+    z3.Z3_OP_ADD: "+",
+    z3.Z3_OP_SUB: "-",
+    z3.Z3_OP_MUL: "*"}
+
+# functions used by the evaluator on numpy arrays and on single values
+EVALUATOR_FUNCTIONS = {
+    "numpy": {
+        "AND": lambda *x: reduce(numpy.logical_and, x),
+        "OR": lambda *x: reduce(numpy.logical_or, x),
+        "NOT": lambda x: numpy.logical_not(x),
+        "ITE": lambda c, x, y: numpy.where(c, x, y)},
+    "python": {
+        "AND": lambda *x: all(x),
+        "OR": lambda *x: any(x),
+        "NOT": lambda x: not x,
+        "ITE": lambda c, x, y: x if c else y}}
+
+# set by run_validate_box before forking the workers
+BOX = {}
+
+# quantifier elimination tactics tried in order to compute the projection on the contexts
+PROJECTION_TACTICS = ["qe2", "qe"]
+
+# milliseconds given to every quantifier elimination tactic before enumerating the configurations instead
+PROJECTION_TIMEOUT = 10000
+
+
+def get_fm_formulas(features, attributes, constraints, features_as_boolean):
+    """Returns the formulas of the feature model: the bounds of the features and attributes, and the constraints"""
+    formulas = []
+    if not features_as_boolean:
+        for i in features:
+            formulas.append(0 <= z3.Int(i))
+            formulas.append(z3.Int(i) <= 1)
+    for i in attributes.keys():
+        formulas.append(attributes[i]["min"] <= z3.Int(i))
+        formulas.append(z3.Int(i) <= attributes[i]["max"])
+    formulas.extend(constraints)
+    return formulas
+
+
+def get_fm_variables(features, attributes, features_as_boolean):
+    """Returns the variables of the features and the attributes"""
+    if features_as_boolean:
+        variables = [z3.Bool(i) for i in features]
+    else:
+        variables = [z3.Int(i) for i in features]
+    return variables + [z3.Int(i) for i in attributes.keys()]
 
 
 def run_validate(
@@ -29,30 +133,10 @@ def run_validate(
         solver.add(i)
 
     log.info("Building the FM formula")
-    formulas = []
-    if not features_as_boolean:
-        for i in features:
-            formulas.append(0 <= z3.Int(i))
-            formulas.append(z3.Int(i) <= 1)
-
-    for i in attributes.keys():
-        formulas.append(attributes[i]["min"] <= z3.Int(i))
-        formulas.append(z3.Int(i) <= attributes[i]["max"])
-
-    for i in constraints:
-        formulas.append(i)
+    formulas = get_fm_formulas(features, attributes, constraints, features_as_boolean)
 
     log.info("Add forall not FM formula")
-    if features_as_boolean:
-        solver.add(z3.ForAll(
-            [z3.Bool(i) for i in features] + [z3.Int(i) for i in attributes.keys()],
-            z3.Not(z3.And(formulas))
-        ))
-    else:
-        solver.add(z3.ForAll(
-            [z3.Int(i) for i in features] + [z3.Int(i) for i in attributes.keys()],
-            z3.Not(z3.And(formulas))
-        ))
+    solver.add(z3.ForAll(get_fm_variables(features, attributes, features_as_boolean), z3.Not(z3.And(formulas))))
     log.debug(solver)
 
     log.info("Computing")
@@ -70,34 +154,13 @@ def run_validate(
         out_stream.write('{"result":"valid"}\n')
 
 
-def run_validate_grid_search(
-        features,
-        initial_features,
-        contexts,
-        attributes,
-        constraints,
-        preferences,
-        context_constraints,
-        features_as_boolean,
-        non_incremental_solver,
-        out_stream):
-    """
-    Perform the validation task
-    Grid search. Every context is tried
-    """
+def get_grid_solver(features, contexts, attributes, constraints, features_as_boolean, non_incremental_solver):
+    """Returns the solver of the feature model used to check the context combinations one at a time"""
     solver = z3.Solver()
     if non_incremental_solver:
         log.info("Non incremental solver modality activated")
         solver.set("combined_solver.solver2_timeout",1)
 
-    # compute grid
-    contexts_names = contexts.keys()
-    context_ranges = [range(contexts[i]["min"],contexts[i]["max"]+1) for i in contexts_names]
-    products = list(itertools.product(*context_ranges))
-    if not contexts_names: # no context is defined
-        products = [[]]
-    log.info("{} Context combination to try".format(len(products)))
-
     log.info("Add variables")
     if not features_as_boolean:
         for i in features:
@@ -114,28 +177,677 @@ def run_validate_grid_search(
     if not non_incremental_solver:
         log.info("Precheck")
         solver.check()
+    return solver
+
+
+def get_grid(contexts, order="lexicographic"):
+    """Returns the grid of the context combinations to try in the given order"""
+    names = sorted(contexts.keys())
+    ranges = [(contexts[i]["min"], contexts[i]["max"] - contexts[i]["min"] + 1) for i in names]
+    total = 1
+    for _, size in ranges:
+        total *= max(size, 0)
+    multiplier = 1
+    if order == "shuffled" and total > 1:
+        # multiplier coprime with the number of combinations close to the golden ratio of it
+        multiplier = int(total * 0.6180339887) | 1
+        while fractions.gcd(multiplier, total) != 1:
+            multiplier += 1
+    return {"names": names, "ranges": ranges, "total": total, "order": order, "multiplier": multiplier}
+
+
+def get_product(grid, position):
+    """Returns the context combination in the given position of the search"""
+    index = (position * grid["multiplier"]) % grid["total"]
+    product = []
+    for start, size in reversed(grid["ranges"]):
+        index, digit = divmod(index, size)
+        product.append(start + digit)
+    product.reverse()
+    return product
+
+
+def get_product_output(grid, product):
+    return {"result": "not_valid",
+            "contexts": [{"id": grid["names"][j], "value": unicode(product[j])} for j in range(len(product))]}
+
+
+def is_void(solver, grid, product, context_constraints):
+    """Returns True if the feature model is void for the context combination allowed by the context constraints"""
+    log.debug("Exploring product {}".format(product))
+    solver.push()
+    for j in range(len(product)):
+        solver.add(product[j] == z3.Int(grid["names"][j]))
+    result = solver.check()
+    solver.pop()
+    if result != z3.unsat:
+        return False
+    if context_constraints:
+        log.debug("Checking the context constraints are not violated")
+        solver1 = z3.Solver()
+        for j in range(len(product)):
+            solver1.add(product[j] == z3.Int(grid["names"][j]))
+        solver1.add(context_constraints)
+        if solver1.check() != z3.sat:
+            return False
+    return True
+
+
+def get_checkpoint_key(grid, model_key):
+    """Returns the identifier of the search stored in the checkpoint, a checkpoint of a different search is ignored"""
+    return hashlib.sha1(json.dumps([model_key, grid["names"], grid["ranges"], grid["order"]])).hexdigest()
+
+
+def read_checkpoint(checkpoint, key):
+    """Returns the position where the search stored in the checkpoint stopped (0 if there is no checkpoint)"""
+    if not checkpoint or not os.path.isfile(checkpoint):
+        return 0
+    with open(checkpoint) as f:
+        data = json.load(f)
+    if data.get("key") != key:
+        log.warning("Checkpoint " + checkpoint + " refers to a different search, starting from the beginning")
+        return 0
+    log.info("Resuming the search from position {}".format(data["position"]))
+    return data["position"]
+
+
+def write_checkpoint(checkpoint, key, position):
+    """Writes the position reached by the search, all the combinations before it have been checked"""
+    log.debug("Checkpoint at position {}".format(position))
+    with open(checkpoint + ".tmp", "w") as f:
+        json.dump({"key": key, "position": position}, f)
+    os.rename(checkpoint + ".tmp", checkpoint)
+
+
+def get_evaluator_source(formula, names):
+    """Returns the python expression evaluating the formula, the value of the i-th context is the variable vi.
+    Raises ValueError if the formula contains an operator not supported or a variable that is not a context"""
+    if z3.is_int_value(formula):
+        return unicode(formula.as_long())
+    if z3.is_true(formula):
+        return "True"
+    if z3.is_false(formula):
+        return "False"
+    if z3.is_const(formula) and formula.decl().kind() == z3.Z3_OP_UNINTERPRETED:
+        if formula.decl().name() not in names:
+            raise ValueError("variable " + formula.decl().name() + " is not a context")
+        return "v" + unicode(names.index(formula.decl().name()))
+    kind = formula.decl().kind()
+    args = [get_evaluator_source(i, names) for i in formula.children()]
+    if kind in EVALUATOR_OPERATORS:
+        return "(" + (" " + EVALUATOR_OPERATORS[kind] + " ").join(args) + ")"
+    elif kind == z3.Z3_OP_AND:
+        return "AND(" + ", ".join(args) + ")"
+    elif kind == z3.Z3_OP_OR:
+        return "OR(" + ", ".join(args) + ")"
+    elif kind == z3.Z3_OP_NOT:
+        return "NOT(" + args[0] + ")"
+    elif kind == z3.Z3_OP_IMPLIES:
+        return "OR(NOT(" + args[0] + "), " + args[1] + ")"
+    elif kind == z3.Z3_OP_ITE:
+        return "ITE(" + ", ".join(args) + ")"
+    elif kind == z3.Z3_OP_UMINUS:
+        return "(-" + args[0] + ")"
+    elif kind in [z3.Z3_OP_PB_EQ, z3.Z3_OP_PB_LE, z3.Z3_OP_PB_GE]:
+        # the parameters are the bound followed by the coefficients
+        params = formula.decl().params()
+        operator = {z3.Z3_OP_PB_EQ: " == ", z3.Z3_OP_PB_LE: " <= ", z3.Z3_OP_PB_GE: " >= "}[kind]
+        return "((" + " + ".join([unicode(params[i + 1]) + " * ITE(" + args[i] + ", 1, 0)"
+                                  for i in range(len(args))]) + ")" + operator + unicode(params[0]) + ")"
+    elif kind == z3.Z3_OP_DISTINCT:
+        return "AND(" + ", ".join(["(" + args[i] + " != " + args[j] + ")"
+                                   for i in range(len(args)) for j in range(i + 1, len(args))]) + ")"
+    raise ValueError("operator " + formula.decl().name() + " not supported")
+
+
+def compile_context_constraints(context_constraints, names):
+    """Returns the function checking the context constraints on the combinations of context values: the function
+    takes the values of the contexts in names, as numpy arrays or as single values if numpy is not available.
+    Returns None if there are no context constraints or they can not be compiled"""
+    if not context_constraints:
+        return None
+    try:
+        source = "AND(" + ", ".join([get_evaluator_source(i, names) for i in context_constraints]) + ")"
+    except ValueError as e:
+        log.info("Context constraints not compiled: " + unicode(e))
+        return None
+    log.debug("Context constraints compiled into " + source)
+    functions = dict(EVALUATOR_FUNCTIONS["numpy" if numpy else "python"])
+    return eval("lambda " + ", ".join(["v" + unicode(i) for i in range(len(names))]) + ": " + source, functions)
+
+
+def get_allowed_positions(grid, evaluator, start, end):
+    """Returns the positions in [start, end) of the combinations allowed by the compiled context constraints"""
+    if evaluator is None:
+        return xrange(start, end)
+    if numpy is None:
+        return [i for i in xrange(start, end) if evaluator(*get_product(grid, i))]
+    positions = numpy.arange(start, end, dtype=numpy.int64)
+    if grid["total"] * grid["multiplier"] < 2 ** 62:
+        indexes = (positions * grid["multiplier"]) % grid["total"]
+    else:
+        # the product may not fit into 64 bits
+        indexes = numpy.array([(i * grid["multiplier"]) % grid["total"] for i in xrange(start, end)], dtype=object)
+    columns = []
+    for low, size in reversed(grid["ranges"]):
+        columns.append(low + indexes % size)
+        indexes = indexes // size
+    columns.reverse()
+    allowed = numpy.broadcast_to(evaluator(*columns), positions.shape)
+    return positions[allowed].tolist()
+
+
+def init_grid_worker():
+    """Creates the incremental solver used by the worker for all its shards"""
+    GRID["solver"] = get_grid_solver(GRID["features"], GRID["contexts"], GRID["attributes"], GRID["constraints"],
+                                     GRID["features_as_boolean"], GRID["non_incremental_solver"])
+
+
+def check_shard(shard):
+    """Checks the context combinations with position in [start, end) in order, returning the position of the first
+    one making the feature model void (None if there is none).
+    The shard is abandoned when a void combination with a lower position has been found by another worker"""
+    start, end = shard
+    found = GRID["found"]
+    positions = get_allowed_positions(GRID["grid"], GRID["evaluator"], start, end)
+    GRID["skipped"] += end - start - len(positions)
+    # the context constraints are checked by the solver only if they could not be compiled
+    context_constraints = GRID["context_constraints"] if GRID["evaluator"] is None else []
+    for position in positions:
+        if found.value < position:
+            log.debug("Shard {}-{} stopped at {}".format(start, end, position))
+            return None
+        if is_void(GRID["solver"], GRID["grid"], get_product(GRID["grid"], position), context_constraints):
+            with found.get_lock():
+                if position < found.value:
+                    found.value = position
+            return position
+    return None
+
+
+def get_shards(start, total, shard_size):
+    for i in xrange(start, total, shard_size):
+        yield (i, min(i + shard_size, total))
+
+
+def run_validate_grid_search(
+        features,
+        initial_features,
+        contexts,
+        attributes,
+        constraints,
+        preferences,
+        context_constraints,
+        features_as_boolean,
+        non_incremental_solver,
+        out_stream,
+        num_of_process=1,
+        order="lexicographic",
+        checkpoint=None,
+        model_key="",
+        timeout=0):
+    """
+    Perform the validation task
+    Grid search. Every context is tried in the given order
+    With more than one process the grid is split into shards checked by a pool of processes. The results of the
+    shards are collected in order, hence the void context returned is the first one of the serial grid search.
+    With a checkpoint file the position reached is saved periodically and when the search is interrupted or
+    the timeout (in milliseconds) expires. The search starts from the position saved, if any.
+    """
+    grid = get_grid(contexts, order)
+    key = get_checkpoint_key(grid, model_key)
+    start = read_checkpoint(checkpoint, key)
+    log.info("{} Context combination to try, starting from {}".format(grid["total"], start))
+    deadline = time.time() + timeout / 1000.0 if timeout > 0 else None
+    last_checkpoint = time.time()
+    # position of the first void combination, grid["total"] if there is none
+    void = grid["total"]
+    position = start
+
+    GRID.update({
+        "features": features,
+        "contexts": contexts,
+        "attributes": attributes,
+        "constraints": constraints,
+        "context_constraints": context_constraints,
+        "evaluator": compile_context_constraints(context_constraints, grid["names"]),
+        "features_as_boolean": features_as_boolean,
+        "non_incremental_solver": non_incremental_solver,
+        "grid": grid,
+        # combinations not allowed by the context constraints skipped by the process
+        "skipped": 0,
+        # lowest position of a void context combination found so far
+        "found": multiprocessing.Value("l", grid["total"])})
+    if num_of_process > 1:
+        # several shards per process to balance the load, small enough to stop early
+        shard_size = max(1, min(1000, (grid["total"] - start) / (num_of_process * 16)))
+        log.info("Checking shards of {} combinations with {} processes".format(shard_size, num_of_process))
+        pool = multiprocessing.Pool(num_of_process, init_grid_worker)
+        shards = pool.imap(check_shard, get_shards(start, grid["total"], shard_size))
+    else:
+        shard_size = SHARD_SIZE
+        pool = None
+        init_grid_worker()
+        shards = (check_shard(i) for i in get_shards(start, grid["total"], shard_size))
+
+    try:
+        while position < grid["total"]:
+            if deadline is None:
+                found = next(shards)
+            elif pool:
+                found = shards.next(max(deadline - time.time(), 0))
+            elif time.time() < deadline:
+                found = next(shards)
+            else:
+                raise multiprocessing.TimeoutError()
+            if found is not None:
+                void = found
+                break
+            position = min(position + shard_size, grid["total"])
+            if checkpoint and time.time() - last_checkpoint > CHECKPOINT_INTERVAL:
+                write_checkpoint(checkpoint, key, position)
+                last_checkpoint = time.time()
+    except multiprocessing.TimeoutError:
+        log.info("Timeout expired after checking {} combinations".format(position))
+        if checkpoint:
+            write_checkpoint(checkpoint, key, position)
+        out_stream.write('{"result":"unknown","position":' + unicode(position) + '}\n')
+        return
+    except KeyboardInterrupt:
+        if checkpoint:
+            log.info("Search interrupted, saving the checkpoint")
+            write_checkpoint(checkpoint, key, position)
+        raise
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    if checkpoint and os.path.isfile(checkpoint):
+        os.remove(checkpoint)
+    if not pool:
+        log.info("{} combinations skipped by the context constraints".format(GRID["skipped"]))
+    if void < grid["total"]:
+        json.dump(get_product_output(grid, get_product(grid, void)), out_stream)
+        out_stream.write("\n")
+    else:
+        out_stream.write('{"result":"valid"}\n')
+
+
+def get_box_volume(box):
+    volume = 1
+    for low, high in box:
+        volume *= high - low + 1
+    return volume
+
+
+def split_box(box):
+    """Splits the box in two halves along its widest dimension"""
+    dimension = max(range(len(box)), key=lambda i: box[i][1] - box[i][0])
+    low, high = box[dimension]
+    middle = (low + high) / 2
+    return [box[:dimension] + [(low, middle)] + box[dimension + 1:],
+            box[:dimension] + [(middle + 1, high)] + box[dimension + 1:]]
+
 
-    for i in products:
-        log.info("Exploring product {}".format(i))
+def init_box_worker():
+    """Creates the incremental solvers used by the worker for all its boxes:
+    the solver of the feature model to find the witnesses, the solver of the negated feature model to search
+    the contexts where a witness is not valid, and the solver of the context constraints"""
+    names = BOX["names"]
+    contexts = BOX["contexts"]
+    attributes = BOX["attributes"]
+    solvers = {"witness": z3.Solver(), "counterexample": z3.Solver(), "context": z3.Solver()}
+    for i in names:
+        for solver in solvers.values():
+            solver.add(contexts[i]["min"] <= z3.Int(i), z3.Int(i) <= contexts[i]["max"])
+    for i in BOX["context_constraints"]:
+        for solver in solvers.values():
+            solver.add(i)
+
+    formulas = get_fm_formulas(BOX["features"], attributes, BOX["constraints"], BOX["features_as_boolean"])
+    solvers["witness"].add(formulas)
+    solvers["counterexample"].add(z3.Not(z3.And(formulas)))
+    BOX["solvers"] = solvers
+
+
+def check_box(box):
+    """Returns the result of the box as a pair: ("valid", None) if the box is proven valid,
+    ("not_valid", context values) if a context of the box makes the feature model void, and ("split", sub-boxes)
+    if the box could not be settled"""
+    names = BOX["names"]
+    solvers = BOX["solvers"]
+    box_formulas = []
+    for i in range(len(names)):
+        box_formulas.append(box[i][0] <= z3.Int(names[i]))
+        box_formulas.append(z3.Int(names[i]) <= box[i][1])
+
+    solver = solvers["witness"]
+    solver.push()
+    solver.add(box_formulas)
+    result = solver.check()
+    witness = solver.model() if result == z3.sat else None
+    solver.pop()
+    BOX["calls"] += 1
+
+    if witness is None:
+        # no context of the box has a configuration, the box is valid only if no context is allowed
+        solver = solvers["context"]
         solver.push()
-        for j in range(len(i)):
-            solver.add(i[j] == z3.Int(contexts_names[j]))
+        solver.add(box_formulas)
         result = solver.check()
-        if result == z3.unsat:
-            if context_constraints:
-                log.debug("Checking the context constraints are not violated")
-                # check that context_constraints are not violated
-                solver1 = z3.Solver()
-                for j in range(len(i)):
-                    solver1.add(products[j] == z3.Int(contexts_names[j]))
-                solver1.add(context_constraints)
-                if solver1.check() != z3.sat:
-                    continue
-            out = {"result": "not_valid", "contexts": []}
-            for j in range(len(i)):
-                out["contexts"].append({"id": contexts_names[j], "value": unicode(i[j])})
-            json.dump(out, out_stream)
-            out_stream.write("\n")
-            return
+        BOX["calls"] += 1
+        if result == z3.sat:
+            model = solver.model()
+            solver.pop()
+            return "not_valid", [model.eval(z3.Int(i), model_completion=True).as_long() for i in names]
         solver.pop()
-    out_stream.write('{"result":"valid"}\n')
\ No newline at end of file
+        return "valid", None
+
+    if get_box_volume(box) == 1:
+        return "valid", None
+    solver = solvers["counterexample"]
+    solver.push()
+    solver.add(box_formulas)
+    for i in BOX["variables"]:
+        solver.add(i == witness.eval(i, model_completion=True))
+    result = solver.check()
+    solver.pop()
+    BOX["calls"] += 1
+    if result == z3.unsat:
+        return "valid", None
+    return "split", split_box(box)
+
+
+def run_validate_box(
+        features,
+        contexts,
+        attributes,
+        constraints,
+        context_constraints,
+        features_as_boolean,
+        out_stream,
+        num_of_process=1,
+        timeout=0):
+    """
+    Perform the validation task
+    Box search. The boxes of contexts are proven valid by a witness configuration or split in two.
+    With more than one process the boxes are checked by a pool of processes.
+    When the timeout (in milliseconds) expires the fraction of contexts proven valid is returned.
+    """
+    names = sorted(contexts.keys())
+    box = [(contexts[i]["min"], contexts[i]["max"]) for i in names]
+    total = get_box_volume(box)
+    if total <= 0:
+        out_stream.write('{"result":"valid"}\n')
+        return
+    BOX.update({
+        "names": names,
+        "features": features,
+        "contexts": contexts,
+        "attributes": attributes,
+        "constraints": constraints,
+        "context_constraints": context_constraints,
+        "features_as_boolean": features_as_boolean,
+        "variables": get_fm_variables(features, attributes, features_as_boolean),
+        # solver calls of the process
+        "calls": 0})
+    deadline = time.time() + timeout / 1000.0 if timeout > 0 else None
+
+    if num_of_process > 1:
+        pool = multiprocessing.Pool(num_of_process, init_box_worker)
+    else:
+        pool = None
+        init_box_worker()
+    boxes = [box]
+    proven = 0
+    checked = 0
+    void = None
+    try:
+        while boxes and void is None:
+            log.info("Checking {} boxes, {} of the contexts proven valid".format(
+                len(boxes), float(proven) / total))
+            if pool:
+                results = pool.imap(check_box, boxes)
+            else:
+                results = (check_box(i) for i in boxes)
+            next_boxes = []
+            for i in range(len(boxes)):
+                if deadline is None:
+                    result, value = next(results)
+                elif pool:
+                    result, value = results.next(max(deadline - time.time(), 0))
+                elif time.time() < deadline:
+                    result, value = next(results)
+                else:
+                    raise multiprocessing.TimeoutError()
+                checked += 1
+                if result == "valid":
+                    proven += get_box_volume(boxes[i])
+                elif result == "split":
+                    next_boxes.extend(value)
+                else:
+                    void = value
+                    break
+            boxes = next_boxes
+    except multiprocessing.TimeoutError:
+        log.info("Timeout expired, {} of the contexts proven valid".format(float(proven) / total))
+        out_stream.write('{"result":"unknown","proven":' + unicode(float(proven) / total) + '}\n')
+        return
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    log.info("Checked {} boxes covering {} context combinations{}".format(
+        checked, total, "" if pool else " with {} solver calls".format(BOX["calls"])))
+    if void is None:
+        out_stream.write('{"result":"valid"}\n')
+    else:
+        out = {"result": "not_valid", "contexts": []}
+        for j in range(len(names)):
+            out["contexts"].append({"id": names[j], "value": unicode(void[j])})
+        json.dump(out, out_stream)
+        out_stream.write("\n")
+
+
+def get_box_formula(names, box):
+    return z3.And([z3.And(box[i][0] <= z3.Int(names[i]), z3.Int(names[i]) <= box[i][1]) for i in range(len(names))])
+
+
+def extend_void_box(solver, names, contexts, box):
+    """Extends the box of void contexts dimension by dimension as long as it remains void.
+    The solver contains the formulas of the feature model and the context constraints, a box is void if the
+    solver has no solution within the box"""
+    checks = 0
+    for i in range(len(names)):
+        for side in [0, 1]:
+            # binary search of the farthest bound keeping the box void
+            limit = contexts[names[i]]["min"] if side == 0 else contexts[names[i]]["max"]
+            bound = box[i][side]
+            while bound != limit:
+                candidate = (bound + limit) / 2 if side == 0 else (bound + limit + 1) / 2
+                extended = list(box)
+                extended[i] = (candidate, box[i][1]) if side == 0 else (box[i][0], candidate)
+                solver.push()
+                solver.add(get_box_formula(names, extended))
+                result = solver.check()
+                solver.pop()
+                checks += 1
+                if result == z3.unsat:
+                    box = extended
+                    bound = candidate
+                else:
+                    limit = candidate + 1 if side == 0 else candidate - 1
+    return box, checks
+
+
+def run_validate_enumerate(
+        features,
+        contexts,
+        attributes,
+        constraints,
+        context_constraints,
+        features_as_boolean,
+        out_stream,
+        limit=0,
+        timeout=0):
+    """
+    Perform the validation task returning all the void contexts
+    Every box of void contexts is written as soon as it is found, one json object per line. The last line is the
+    result of the validation, marked as not complete when the limit of boxes is reached or the timeout
+    (in milliseconds) expires before all the void contexts have been found.
+    """
+    names = sorted(contexts.keys())
+    deadline = time.time() + timeout / 1000.0 if timeout > 0 else None
+    formulas = get_fm_formulas(features, attributes, constraints, features_as_boolean)
+
+    solver = z3.Solver()
+    solver.set("smt.relevancy",0)
+    void_solver = z3.Solver()
+    for i in names:
+        solver.add(contexts[i]["min"] <= z3.Int(i), z3.Int(i) <= contexts[i]["max"])
+        void_solver.add(contexts[i]["min"] <= z3.Int(i), z3.Int(i) <= contexts[i]["max"])
+    solver.add(context_constraints)
+    void_solver.add(context_constraints)
+    solver.add(z3.ForAll(get_fm_variables(features, attributes, features_as_boolean), z3.Not(z3.And(formulas))))
+    void_solver.add(formulas)
+
+    boxes = 0
+    checks = 0
+    complete = True
+    while True:
+        if limit > 0 and boxes >= limit:
+            log.info("Limit of {} boxes reached".format(limit))
+            complete = False
+            break
+        if deadline is not None:
+            remaining = int((deadline - time.time()) * 1000)
+            if remaining <= 0:
+                complete = False
+                break
+            solver.set("timeout", remaining)
+        result = solver.check()
+        checks += 1
+        if result == z3.unsat:
+            break
+        elif result == z3.unknown:
+            # no other call to the solver, its context may be unusable after the interruption
+            log.info("Search of void contexts stopped with result unknown: " + solver.reason_unknown())
+            complete = False
+            break
+        model = solver.model()
+        point = [model.eval(z3.Int(i), model_completion=True).as_long() for i in names]
+        box, box_checks = extend_void_box(void_solver, names, contexts, [(i, i) for i in point])
+        checks += box_checks
+        boxes += 1
+        json.dump({"result": "void",
+                   "contexts": [{"id": names[i], "min": box[i][0], "max": box[i][1]} for i in range(len(names))]},
+                  out_stream)
+        out_stream.write("\n")
+        out_stream.flush()
+        solver.add(z3.Not(get_box_formula(names, box)))
+
+    log.info("Found {} boxes of void contexts with {} solver calls".format(boxes, checks))
+    if boxes == 0 and complete:
+        out_stream.write('{"result":"valid"}\n')
+    elif boxes == 0:
+        out_stream.write('{"result":"unknown"}\n')
+    else:
+        json.dump({"result": "not_valid", "boxes": boxes, "complete": complete}, out_stream)
+        out_stream.write("\n")
+
+
+def has_quantifiers(formula):
+    """Returns True if the formula contains a quantifier"""
+    to_visit = [formula]
+    visited = set()
+    while to_visit:
+        term = to_visit.pop()
+        if z3.is_quantifier(term):
+            return True
+        if term.get_id() in visited:
+            continue
+        visited.add(term.get_id())
+        if z3.is_app(term):
+            to_visit.extend(term.children())
+    return False
+
+
+def eliminate_quantifiers(formulas, variables):
+    """Returns the quantifier free formula equivalent to the existential quantification of the variables in the
+    formulas, obtained with the quantifier elimination tactics. Returns None if the tactics fail or time out"""
+    goal = z3.Goal()
+    goal.add(z3.Exists(variables, z3.And(formulas)) if variables else z3.And(formulas))
+    for name in PROJECTION_TACTICS:
+        try:
+            result = z3.TryFor(z3.Tactic(name), PROJECTION_TIMEOUT)(goal)
+        except z3.Z3Exception as e:
+            log.warning("Quantifier elimination with the tactic {} failed: {}".format(name, e))
+            continue
+        projection = z3.simplify(result.as_expr())
+        if has_quantifiers(projection):
+            log.warning("Quantifier elimination with the tactic {} left quantifiers".format(name))
+            continue
+        log.info("Projection on the contexts computed with the tactic {}".format(name))
+        return projection
+    return None
+
+
+def compute_context_projection(features, contexts, attributes, constraints, features_as_boolean):
+    """Returns the quantifier free formula on the contexts equivalent to the existential quantification of the
+    features and attributes of the feature model"""
+    formulas = get_fm_formulas(features, attributes, constraints, features_as_boolean)
+    variables = get_fm_variables(features, attributes, features_as_boolean)
+    projection = eliminate_quantifiers(formulas, variables)
+    if projection is not None:
+        return projection
+    log.warning("Computing the projection on the contexts enumerating the configurations")
+    solver = z3.Solver()
+    for i in contexts.keys():
+        solver.add(contexts[i]["min"] <= z3.Int(i), z3.Int(i) <= contexts[i]["max"])
+    solver.add(formulas)
+    covers = []
+    while solver.check() == z3.sat:
+        model = solver.model()
+        configuration = [(i, model.eval(i, model_completion=True)) for i in variables]
+        cover = z3.simplify(z3.substitute(z3.And(formulas), *configuration))
+        log.debug("Contexts covered by configuration {}: {}".format(len(covers), cover))
+        covers.append(cover)
+        solver.add(z3.Not(cover))
+    log.info("Projection on the contexts computed with {} configurations".format(len(covers)))
+    return z3.simplify(z3.Or(covers)) if covers else z3.BoolVal(False)
+
+
+def get_context_projection(model):
+    """Returns the projection of the compiled model on the contexts, computing it the first time it is needed.
+    The projection is stored in the compiled model and is therefore reused while the model is in the model cache"""
+    if "context_projection" not in model:
+        start_time = time.time()
+        model["context_projection"] = compute_context_projection(
+            model["features"], model["contexts"], model["attributes"], model["constraints"],
+            model["features_as_boolean"])
+        log.info("Seconds taken to compute the projection on the contexts {}".format(time.time() - start_time))
+    return model["context_projection"]
+
+
+def run_validate_projection(projection, contexts, context_constraints, out_stream):
+    """
+    Perform the validation task with the projection of the feature model on the contexts
+    A quantifier free check looks for a context allowed by the context constraints outside the projection
+    """
+    solver = z3.Solver()
+    for i in contexts.keys():
+        solver.add(contexts[i]["min"] <= z3.Int(i), z3.Int(i) <= contexts[i]["max"])
+    solver.add(context_constraints)
+    solver.add(z3.Not(projection))
+    result = solver.check()
+    if result == z3.sat:
+        model = solver.model()
+        out = {"result": "not_valid", "contexts": []}
+        for i in contexts.keys():
+            out["contexts"].append({"id": i, "value": unicode(model.eval(z3.Int(i), model_completion=True))})
+        json.dump(out, out_stream)
+        out_stream.write("\n")
+    else:
+        out_stream.write('{"result":"valid"}\n')